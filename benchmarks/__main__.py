@@ -0,0 +1,80 @@
+"""
+    Run the benchmarks:
+
+        python -m benchmarks [--save] [--baseline FILE] [--threshold 0.2]
+
+    OpenGL is replaced by utils.gl_stub, so no display or GPU is needed.
+    With --gl-calls the stub also records calls, and the GL calls per
+    frame are listed by pass and function.
+"""
+import argparse
+import logging
+import os
+import sys
+
+# the assets and sources are found relative to the repository root
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(ROOT)
+sys.path.insert(0, ROOT)
+
+from benchmarks.harness import (
+    REGRESSION_THRESHOLD, Suite, find_regressions, load_baseline, save_baseline)
+from utils import gl_shim, gl_stub
+
+
+def parse_args() -> argparse.Namespace:
+
+    parser = argparse.ArgumentParser(
+        prog = "python -m benchmarks", description = "Time the loaders and renderer.")
+    parser.add_argument("--baseline", default = "benchmarks/baseline.json",
+        help = "JSON file of results to compare against")
+    parser.add_argument("--save", action = "store_true",
+        help = "write this run's results as the new baseline")
+    parser.add_argument("--threshold", type = float, default = REGRESSION_THRESHOLD,
+        help = "fraction a benchmark may get slower before failing")
+    parser.add_argument("--filter",
+        help = "only run benchmarks whose name contains this")
+    parser.add_argument("--gl-calls", action = "store_true",
+        help = "record GL calls and report them per frame, "
+            "which slows the frame benchmarks down")
+    return parser.parse_args()
+
+def main() -> int:
+
+    args = parse_args()
+    logging.basicConfig(level = logging.WARNING)
+
+    # OpenGL must be replaced before the graphics modules import it
+    recorder = None
+    if args.gl_calls:
+        recorder = gl_shim.install_recording(gl_shim.GLRecorder(), ROOT)
+    else:
+        gl_stub.install(ROOT)
+    from benchmarks.frame import add_frame_benchmarks
+    from benchmarks.loaders import add_loader_benchmarks
+    from benchmarks.scene import add_scene_benchmarks
+
+    suite = Suite()
+    add_loader_benchmarks(suite)
+    add_scene_benchmarks(suite)
+    add_frame_benchmarks(suite)
+    results = suite.run(args.filter)
+    if recorder is not None:
+        print(recorder.summarize())
+
+    if args.save:
+        save_baseline(results, args.baseline)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, run with --save to make one")
+        return 0
+
+    regressions = find_regressions(results, load_baseline(args.baseline), args.threshold)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
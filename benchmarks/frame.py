@@ -0,0 +1,52 @@
+import numpy as np
+
+from benchmarks.harness import Suite
+from core.constants import ENTITY_TYPE, RENDER_PATH
+from core.scene import Scene
+from graphics.engine import GraphicsEngine
+
+############################## helper functions ###############################
+
+def add_frame_benchmarks(suite: Suite, cube_count: int = 500) -> None:
+    """
+        Register the full frame benchmarks: filling the snapshot and
+        issuing every pass's GL calls, against whatever OpenGL.GL is
+        installed. With utils.gl_stub the GL calls cost nothing, so
+        what's left is the CPU cost of submitting a frame.
+
+        Parameters:
+
+            suite: receives the benchmarks.
+
+            cube_count: moving cubes added to the scene, spread
+                around the camera so some are culled.
+    """
+
+    renderer = GraphicsEngine()
+    scene = Scene()
+
+    side = int(np.ceil(np.sqrt(cube_count)))
+    for i in range(cube_count):
+        x, y = divmod(i, side)
+        scene.spawn(
+            ENTITY_TYPE["CUBE"],
+            [4.0 * (x - side / 2), 4.0 * (y - side / 2), 0.0], [90, 0, -90])
+    renderer.build_static_batches(scene.entities)
+    entity_count = sum(len(entities) for entities in scene.entities.values())
+
+    def render(render_path: int):
+        def draw():
+            renderer.render_path = render_path
+            renderer.render(scene.player, scene.entities, scene.lights)
+        return draw
+
+    for name, render_path in RENDER_PATH.items():
+        suite.add(
+            f"render_frame[{name.lower()},{entity_count}]", render(render_path),
+            {"frames": 1, "entities": entity_count}, repeat = 20)
+
+    def simulate():
+        scene.update(1.0)
+
+    suite.add(
+        f"scene_update[{entity_count}]", simulate, {"entities": entity_count}, repeat = 20)
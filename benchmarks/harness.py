@@ -0,0 +1,187 @@
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+# a benchmark this much slower (or hungrier) than its baseline fails
+REGRESSION_THRESHOLD = 0.2
+# peaks below this are too small for their changes to mean anything
+MIN_PEAK_BYTES = 1 << 16
+
+
+class Result:
+    """
+        The measurements of one benchmark.
+    """
+    __slots__ = ("name", "seconds", "runs", "peak_bytes", "throughput")
+
+
+    def __init__(self,
+        name: str, seconds: float, runs: int, peak_bytes: int,
+        throughput: dict[str, float]):
+        """
+            Parameters:
+
+                name: which benchmark.
+
+                seconds: median time of one run.
+
+                runs: how many timed runs the median is over.
+
+                peak_bytes: most memory Python allocated during a run.
+
+                throughput: unit -> amount per second.
+        """
+
+        self.name = name
+        self.seconds = seconds
+        self.runs = runs
+        self.peak_bytes = peak_bytes
+        self.throughput = throughput
+
+    def to_json(self) -> dict:
+
+        return {
+            "seconds": self.seconds,
+            "runs": self.runs,
+            "peak_bytes": self.peak_bytes,
+            "throughput": self.throughput,
+        }
+
+class Suite:
+    """
+        A list of benchmarks, run one after another.
+    """
+    __slots__ = ("cases",)
+
+
+    def __init__(self):
+
+        # (name, function, work done per call, repeat)
+        self.cases: list[tuple[str, object, dict[str, float], int]] = []
+
+    def add(self,
+        name: str, function, work: dict[str, float] | None = None,
+        repeat: int = 5) -> None:
+        """
+            Register a benchmark.
+
+            Parameters:
+
+                name: unique, stable name, the baseline's key.
+
+                function: does one run's work, called without arguments.
+
+                work: unit -> amount one call gets through,
+                    e.g. {"MB": 3.4, "triangles": 50000}.
+
+                repeat: timed runs, the median is reported.
+        """
+
+        self.cases.append((name, function, work or {}, repeat))
+
+    def run(self, pattern: str | None = None) -> list[Result]:
+        """
+            Run the benchmarks whose name contains pattern, or all.
+        """
+
+        results = []
+        for name, function, work, repeat in self.cases:
+            if pattern and pattern not in name:
+                continue
+            result = measure(name, function, work, repeat)
+            print(format_result(result), flush = True)
+            results.append(result)
+        return results
+
+############################## helper functions ###############################
+
+def measure(
+    name: str, function, work: dict[str, float], repeat: int) -> Result:
+    """
+        Time a function and measure its peak memory. Memory is
+        traced on a separate run, since tracing slows Python down.
+    """
+
+    # warm caches and lazy imports first
+    function()
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    seconds = statistics.median(times)
+
+    tracemalloc.start()
+    try:
+        function()
+        _, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    throughput = {
+        f"{unit}/s": amount / seconds for unit, amount in work.items()
+    } if seconds > 0 else {}
+    return Result(name, seconds, repeat, peak_bytes, throughput)
+
+def format_result(result: Result) -> str:
+    """
+        Returns one line describing a result.
+    """
+
+    rates = ", ".join(
+        f"{value:,.1f} {unit}" for unit, value in result.throughput.items())
+    return (f"{result.name:<48} {1000.0 * result.seconds:10.3f} ms "
+            f"{result.peak_bytes / 2**20:8.2f} MiB peak  {rates}")
+
+def save_baseline(results: list[Result], filepath: str) -> None:
+    """
+        Write results as the baseline later runs are compared to.
+    """
+
+    baseline = {
+        "python": sys.version.split()[0],
+        "machine": platform.platform(),
+        "results": {result.name: result.to_json() for result in results},
+    }
+    with open(filepath, "w") as f:
+        json.dump(baseline, f, indent = 2)
+
+def load_baseline(filepath: str) -> dict[str, dict]:
+    """
+        Returns the results of a saved baseline, by name.
+    """
+
+    with open(filepath, "r") as f:
+        return json.load(f)["results"]
+
+def find_regressions(
+    results: list[Result], baseline: dict[str, dict],
+    threshold: float = REGRESSION_THRESHOLD) -> list[str]:
+    """
+        Compare results to a baseline.
+
+        Returns:
+
+            A description of every benchmark which got slower or
+            used more memory by more than the threshold, a fraction.
+    """
+
+    regressions = []
+    for result in results:
+        previous = baseline.get(result.name)
+        if previous is None:
+            continue
+        for field, label in (("seconds", "time"), ("peak_bytes", "peak memory")):
+            old = previous[field]
+            new = getattr(result, field)
+            if field == "peak_bytes" and new < MIN_PEAK_BYTES:
+                continue
+            if old > 0 and new > old * (1.0 + threshold):
+                regressions.append(
+                    f"{result.name}: {label} up {100.0 * (new / old - 1.0):.0f}% "
+                    f"({old:.6g} -> {new:.6g})")
+    return regressions
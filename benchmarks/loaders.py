@@ -0,0 +1,88 @@
+import glob
+import logging
+import os
+
+from benchmarks.harness import Suite
+from utils.obj_loader import (
+    load_mesh, load_multi_material_mesh, parse_mtl_for_material_textures)
+
+log = logging.getLogger(__name__)
+
+############################## helper functions ###############################
+
+def get_megabytes(filepath: str) -> float:
+
+    return os.path.getsize(filepath) / 2**20
+
+def get_material_names(mtl_path: str) -> list[str]:
+    """
+        Returns the names of the materials an mtl file defines.
+    """
+
+    with open(mtl_path, "r") as f:
+        return [
+            line.split()[1] for line in f
+            if line.startswith("newmtl") and len(line.split()) > 1]
+
+def add_loader_benchmarks(suite: Suite, models: str = "models", textures: str = "gfx") -> None:
+    """
+        Register the obj, mtl and image loading benchmarks, one per
+        file. Files the loaders can't read are logged and skipped.
+
+        Parameters:
+
+            suite: receives the benchmarks.
+
+            models: directory of obj and mtl files.
+
+            textures: directory of images.
+    """
+
+    for filepath in sorted(glob.glob(os.path.join(models, "*.obj"))):
+        name = os.path.basename(filepath)
+        megabytes = get_megabytes(filepath)
+
+        try:
+            vertices, _ = load_mesh(filepath)
+            groups = load_multi_material_mesh(filepath)
+        except (ValueError, IndexError) as error:
+            log.warning("Skipping %s: %s", filepath, error)
+            continue
+        # eight floats per corner, three corners per triangle
+        triangles = len(vertices) // 24
+        grouped = sum(len(group["vertices"]) for group in groups.values()) // 24
+
+        suite.add(
+            f"load_mesh[{name}]",
+            lambda filepath = filepath: load_mesh(filepath),
+            {"MB": megabytes, "triangles": triangles})
+        suite.add(
+            f"load_multi_material_mesh[{name}]",
+            lambda filepath = filepath: load_multi_material_mesh(filepath),
+            {"MB": megabytes, "triangles": grouped})
+
+    for filepath in sorted(glob.glob(os.path.join(models, "*.mtl"))):
+        names = get_material_names(filepath)
+
+        def parse(filepath = filepath, names = names):
+            # every material is wanted, so every line is used
+            parse_mtl_for_material_textures(
+                filepath, {name: {"vertices": []} for name in names})
+
+        suite.add(
+            f"parse_mtl[{os.path.basename(filepath)}]", parse,
+            {"MB": get_megabytes(filepath), "materials": len(names)}, repeat = 20)
+
+    # the decode half of Material, which needs no context
+    from graphics.material import load_image
+
+    for filepath in sorted(glob.glob(os.path.join(textures, "*"))):
+        try:
+            width, height, _ = load_image(filepath)
+        except OSError as error:
+            log.warning("Skipping %s: %s", filepath, error)
+            continue
+        suite.add(
+            f"material_decode[{os.path.basename(filepath)}]",
+            lambda filepath = filepath: load_image(filepath),
+            {"MB": get_megabytes(filepath), "Mpixels": width * height / 1e6})
@@ -0,0 +1,108 @@
+import numpy as np
+
+from benchmarks.harness import Suite
+from core.collision import PlayerCollider, TriangleGrid
+from core.scene import Camera
+from entities.archetype import Archetype
+from entities.cube import Cube
+from entities.systems import spin
+from utils.bvh import TriangleBVH
+
+############################## helper functions ###############################
+
+def add_scene_benchmarks(suite: Suite, entity_count: int = 10_000) -> None:
+    """
+        Register the per entity math benchmarks.
+
+        Parameters:
+
+            suite: receives the benchmarks.
+
+            entity_count: how many entities each run goes through.
+    """
+
+    rng = np.random.default_rng(0)
+    archetype = Archetype(entity_count)
+    cubes = [
+        Cube(position, eulers, archetype = archetype)
+        for position, eulers in zip(
+            rng.uniform(-50.0, 50.0, (entity_count, 3)).astype(np.float32),
+            rng.uniform(0.0, 360.0, (entity_count, 3)).astype(np.float32))
+    ]
+
+    def get_model_transforms():
+        for cube in cubes:
+            cube.get_model_transform()
+
+    def get_interpolated_transforms():
+        for cube in cubes:
+            cube.get_model_transform(0.5)
+
+    suite.add(
+        f"get_model_transform[{entity_count}]",
+        get_model_transforms, {"entities": entity_count})
+    suite.add(
+        f"get_model_transform_interpolated[{entity_count}]",
+        get_interpolated_transforms, {"entities": entity_count})
+
+    def get_archetype_transforms():
+        archetype.get_model_transforms(0.5)
+
+    def spin_cubes():
+        archetype.save_state()
+        spin(archetype, 1.0)
+
+    suite.add(
+        f"archetype_model_transforms[{entity_count}]",
+        get_archetype_transforms, {"entities": entity_count})
+    suite.add(
+        f"archetype_spin[{entity_count}]", spin_cubes, {"entities": entity_count})
+
+    # a bumpy ground of two triangles per grid square
+    side = 100
+    heights = rng.uniform(0.0, 1.0, (side + 1, side + 1)).astype(np.float32)
+    x, y = np.meshgrid(np.arange(side + 1), np.arange(side + 1), indexing = "ij")
+    points = np.stack([x, y, heights], axis = -1).astype(np.float32)
+    a, b = points[:-1, :-1], points[1:, :-1]
+    c, d = points[:-1, 1:], points[1:, 1:]
+    triangles = np.concatenate([
+        np.stack([a, b, d], axis = 2).reshape(-1, 3, 3),
+        np.stack([a, d, c], axis = 2).reshape(-1, 3, 3)])
+
+    ray_count = 1000
+    origins = np.column_stack([
+        rng.uniform(0.0, side, (ray_count, 2)), np.full(ray_count, 10.0)])
+    directions = np.column_stack([
+        rng.uniform(-0.5, 0.5, (ray_count, 2)), -np.ones(ray_count)])
+    bvh = TriangleBVH(triangles)
+
+    suite.add(
+        f"bvh_build[{len(triangles)}]",
+        lambda: TriangleBVH(triangles), {"triangles": len(triangles)}, repeat = 3)
+    suite.add(
+        f"bvh_raycast[{ray_count}]",
+        lambda: bvh.intersect(origins, directions), {"rays": ray_count})
+
+    grid = TriangleGrid()
+    grid.add("ground", triangles)
+    collider = PlayerCollider(grid)
+    collider.walking = True
+    move_count = 100
+
+    def walk():
+        position = np.array([side / 2, side / 2, 2.0])
+        for _ in range(move_count):
+            position = collider.move(position, [0.1, 0.05, 0.0])
+
+    suite.add(f"collide_walk[{move_count}]", walk, {"moves": move_count})
+
+    camera = Camera([0, 0, 2])
+
+    def update_camera():
+        for i in range(entity_count):
+            camera.eulers[1] = i % 89
+            camera.eulers[2] = i % 360
+            camera.update(1.0)
+
+    suite.add(
+        f"camera_update[{entity_count}]", update_camera, {"updates": entity_count})
@@ -1,3 +1,6 @@
+import logging
+import time
+
 import glfw
 import glfw.GLFW as GLFW_CONSTANTS
 from OpenGL.GL import *
@@ -7,9 +10,20 @@ import numpy as np
 
 
 from core.constants import SCREEN_WIDTH, SCREEN_HEIGHT, GLOBAL_X, GLOBAL_Y, GLOBAL_Z
+from core.constants import PRESENT_MODE, TARGET_FPS, MAX_FRAMES_IN_FLIGHT
+from core.constants import FIXED_TIMESTEP, PLAYER_SPEED
 from core.scene import Scene
+from core.pacing import FrameLimiter, FrameFences
+from core.clock import FrameClock, FixedTimestep
+from core.snapshot import SimulationWorker
+from core.world import WorldPartition
 from graphics.engine import GraphicsEngine
+from graphics.streaming import WorldStreamer
+from utils.gpu_memory import GPU_MEMORY
+from utils.obj_loader import PROGRAM_CACHE
+from utils.trace import TRACER
 
+log = logging.getLogger(__name__)
 
 
 class App:
@@ -19,23 +33,53 @@ class App:
     __slots__ = (
         "window", "renderer", "scene", "last_time", 
         "current_time", "frames_rendered", "frametime",
-        "_keys", "mouse_locked")
+        "_keys", "mouse_locked", "present_mode", "limiter", "fences",
+        "clock", "timestep", "worker", "streamer", "hovered", "picking")
 
 
-    def __init__(self):
+    def __init__(self, 
+        present_mode: int = PRESENT_MODE["VSYNC"],
+        simulation_thread: bool = True, world: str | None = None):
         """
             Initialize the program.
+
+            Parameters:
+
+                present_mode: how frames are paced, one of PRESENT_MODE.
+
+                simulation_thread: step the scene on a worker thread,
+                    the main thread then only handles input and GL.
+
+                world: a world partition manifest, whose cells are
+                    streamed in around the camera.
         """
 
         self.mouse_locked = True
+        # what the mouse points at
+        self.hovered = None
+        # whether a pick is waiting to run on the scene's thread
+        self.picking = False
+
+        with TRACER.span("App"):
+            self._set_up_glfw()
+
+            self._set_up_timer()
+
+            self._set_up_pacing(present_mode)
 
-        self._set_up_glfw()
+            self._set_up_input_systems()
 
-        self._set_up_timer()
+            self._create_assets()
 
-        self._set_up_input_systems()
+            with TRACER.span("simulation"):
+                self._set_up_simulation(simulation_thread)
 
-        self._create_assets()
+            self.streamer = None
+            if world is not None:
+                with TRACER.span("world partition"):
+                    self.streamer = WorldStreamer(
+                        WorldPartition.from_json(world),
+                        self.renderer, self.scene, self._send)
         
 
     def _set_up_glfw(self) -> None:
@@ -43,21 +87,21 @@ class App:
             Initialize and configure GLFW
         """
 
-        glfw.init()
+        with TRACER.span("glfw init"):
+            glfw.init()
         glfw.window_hint(GLFW_CONSTANTS.GLFW_CONTEXT_VERSION_MAJOR,3)
         glfw.window_hint(GLFW_CONSTANTS.GLFW_CONTEXT_VERSION_MINOR,3)
         glfw.window_hint(
             GLFW_CONSTANTS.GLFW_OPENGL_PROFILE, 
             GLFW_CONSTANTS.GLFW_OPENGL_CORE_PROFILE)
         glfw.window_hint(GLFW_CONSTANTS.GLFW_OPENGL_FORWARD_COMPAT, GLFW_CONSTANTS.GLFW_TRUE)
-        #for uncapped framerate
-        glfw.window_hint(GLFW_CONSTANTS.GLFW_DOUBLEBUFFER,GL_FALSE)
         # make the window resizable
         glfw.window_hint(GLFW_CONSTANTS.GLFW_RESIZABLE, glfw.TRUE)
-        self.window = glfw.create_window(
-            SCREEN_WIDTH, SCREEN_HEIGHT, "Title", None, None)
-        glfw.set_window_size_callback(self.window, self._on_window_resize)
-        glfw.make_context_current(self.window)
+        with TRACER.span("create window"):
+            self.window = glfw.create_window(
+                SCREEN_WIDTH, SCREEN_HEIGHT, "Title", None, None)
+            glfw.set_window_size_callback(self.window, self._on_window_resize)
+            glfw.make_context_current(self.window)
     
     def _set_up_timer(self) -> None:
         """
@@ -69,6 +113,55 @@ class App:
         self.current_time = 0
         self.frames_rendered = 0
         self.frametime = 0.0
+
+        self.clock = FrameClock()
+        self.timestep = FixedTimestep(FIXED_TIMESTEP)
+
+    def _set_up_pacing(self, present_mode: int) -> None:
+        """
+            Create the frame limiter and fences,
+            and apply the presentation mode.
+        """
+
+        self.limiter = FrameLimiter(TARGET_FPS)
+        self.fences = FrameFences(MAX_FRAMES_IN_FLIGHT)
+        self.set_present_mode(present_mode)
+
+    def set_present_mode(self, present_mode: int) -> None:
+        """
+            Choose how frames are paced.
+
+            Parameters:
+
+                present_mode: VSYNC waits for every vertical blank,
+                    ADAPTIVE_VSYNC tears instead of waiting when a frame
+                    is late, LIMITED holds TARGET_FPS without vsync and
+                    UNCAPPED draws as fast as possible.
+        """
+
+        self.present_mode = present_mode
+        if present_mode == PRESENT_MODE["VSYNC"]:
+            glfw.swap_interval(1)
+        elif present_mode == PRESENT_MODE["ADAPTIVE_VSYNC"]:
+            # a negative interval needs the swap_control_tear extension
+            if glfw.extension_supported("WGL_EXT_swap_control_tear") \
+                or glfw.extension_supported("GLX_EXT_swap_control_tear"):
+                glfw.swap_interval(-1)
+            else:
+                glfw.swap_interval(1)
+        else:
+            glfw.swap_interval(0)
+        self.limiter.set_target(TARGET_FPS)
+
+    def _cycle_present_mode(self) -> None:
+        """
+            Switch to the next presentation mode.
+        """
+
+        names = list(PRESENT_MODE)
+        present_mode = (self.present_mode + 1) % len(names)
+        self.set_present_mode(present_mode)
+        log.info("Present mode: %s", names[present_mode])
     
     def _set_up_input_systems(self) -> None:
         """
@@ -109,6 +202,24 @@ class App:
                     self.renderer.toggle_shadows()
                 if key == GLFW_CONSTANTS.GLFW_KEY_R:
                     self.renderer.reload_shaders()
+                if key == GLFW_CONSTANTS.GLFW_KEY_G:
+                    self.renderer.toggle_render_path()
+                if key == GLFW_CONSTANTS.GLFW_KEY_P:
+                    self._cycle_present_mode()
+                if key == GLFW_CONSTANTS.GLFW_KEY_T:
+                    self.renderer.timer.dump_json("pass_timings.json")
+                    self.renderer.timer.dump_csv("pass_timings.csv")
+                    log.info("Pass timings written to pass_timings.json/.csv")
+                if key == GLFW_CONSTANTS.GLFW_KEY_H:
+                    self._log_frame_times()
+                if key == GLFW_CONSTANTS.GLFW_KEY_F:
+                    self._send(self.scene.toggle_walking)
+                if key == GLFW_CONSTANTS.GLFW_KEY_Z:
+                    self.renderer.cycle_depth_prepass()
+                if key == GLFW_CONSTANTS.GLFW_KEY_U:
+                    self.renderer.toggle_dynamic_resolution()
+                if key == GLFW_CONSTANTS.GLFW_KEY_M:
+                    log.info("%s", GPU_MEMORY.summarize())
 
                 if key == GLFW_CONSTANTS.GLFW_KEY_TAB:
                     self.mouse_locked = not self.mouse_locked
@@ -117,7 +228,7 @@ class App:
                         GLFW_CONSTANTS.GLFW_CURSOR,
                         GLFW_CONSTANTS.GLFW_CURSOR_DISABLED if self.mouse_locked else GLFW_CONSTANTS.GLFW_CURSOR_NORMAL
                     )
-                    print("Mouse locked:", self.mouse_locked)
+                    log.info("Mouse locked: %s", self.mouse_locked)
 
             case GLFW_CONSTANTS.GLFW_RELEASE:
                 state = False
@@ -131,13 +242,54 @@ class App:
             Create all of the assets needed by the program.
         """
 
-        self.renderer = GraphicsEngine()
+        with TRACER.span("GraphicsEngine"):
+            self.renderer = GraphicsEngine(
+                watch_files = True, dynamic_resolution = True)
+
+        with TRACER.span("Scene"):
+            self.scene = Scene()
+
+        # the same dict, so reloaded meshes are picked against too
+        self.scene.set_meshes(self.renderer.meshes)
+        self.renderer.attach_scene(self.scene, self._send)
+        with TRACER.span("pick structures"):
+            for mesh in self.renderer.meshes.values():
+                if hasattr(mesh, "get_bvh"):
+                    mesh.get_bvh()
+
+        with TRACER.span("static batches"):
+            self.renderer.build_static_batches(self.scene.entities)
+
+    def _set_up_simulation(self, simulation_thread: bool) -> None:
+        """
+            Start the simulation worker, if asked for.
+        """
+
+        self.worker = None
+        if not simulation_thread:
+            return
+
+        self.worker = SimulationWorker(
+            self.scene, self.renderer.snapshot_builder,
+            self.renderer.projection)
+        self.worker.start()
+
+    def _send(self, command, *args) -> None:
+        """
+            Apply a change to the scene, through the worker
+            when it owns the scene.
+        """
 
-        self.scene = Scene()
+        if self.worker is None:
+            command(*args)
+        else:
+            self.worker.post(command, *args)
 
     def _on_window_resize(self, window, width, height):
         glViewport(0, 0, width, height)
         self.renderer.resize(width, height)
+        if self.worker is not None:
+            self.worker.set_projection(self.renderer.projection)
     
     def run(self) -> None:
         """
@@ -145,31 +297,64 @@ class App:
         """
 
         running = True
+        # the first frame builds whatever was left for first use
+        first_frame = time.perf_counter()
         while (running):
             #check events
             if glfw.window_should_close(self.window) \
                 or self._keys.get(GLFW_CONSTANTS.GLFW_KEY_ESCAPE, False):
                 running = False
             
+            delta = self.clock.tick()
+            self.frametime = 1000.0 * delta
+
             self._handle_keys()
             self._handle_mouse()
 
             glfw.poll_events()
 
-            self.scene.update(self.frametime / 16.67)
-            
-            self.renderer.render(
-                self.scene.player, self.scene.entities, self.scene.lights)
+            if self.streamer is not None:
+                # a stale read from the simulation thread is close enough
+                self.streamer.update(self.scene.player.position.copy())
+
+            if self.worker is None:
+                for _ in range(self.timestep.advance(delta)):
+                    self.scene.update(1000.0 * FIXED_TIMESTEP / 16.67)
+
+                self.renderer.render(
+                    self.scene.player, self.scene.entities, self.scene.lights,
+                    self.timestep.alpha)
+            else:
+                self.renderer.render_snapshot(self.worker.acquire())
+
+            self._present()
+            if first_frame is not None:
+                TRACER.record("first frame", first_frame, time.perf_counter())
+                first_frame = None
+                # shader variants left for first use are built by now
+                PROGRAM_CACHE.log_report("startup")
 
             #timing
             self._calculate_framerate()
 
+    def _present(self) -> None:
+        """
+            Show the finished frame, pacing it
+            as the presentation mode asks.
+        """
+
+        if self.present_mode == PRESENT_MODE["LIMITED"]:
+            self.limiter.wait()
+        glfw.swap_buffers(self.window)
+        self.fences.end_frame()
+
     def _handle_keys(self) -> None:
         """
             Takes action based on the keys currently pressed.
         """
 
-        rate = 0.005*self.frametime
+        # distance covered in one step at dt = 1
+        rate = PLAYER_SPEED * 0.01667
         d_pos = np.zeros(3, dtype=np.float32)
 
 
@@ -191,17 +376,21 @@ class App:
         length = pyrr.vector.length(d_pos)
 
         if abs(length) < 0.00001:
+            self._send(self.scene.set_player_motion, d_pos)
             return
 
         d_pos = rate * d_pos / length
 
-        self.scene.move_player(d_pos)
+        self._send(self.scene.set_player_motion, d_pos)
 
     def _handle_mouse(self) -> None:
         """
-            spin the player based on the mouse movement
+            pick what the mouse points at, and spin the
+            player based on the mouse movement
         """
 
+        self._pick()
+
         if not self.mouse_locked:
             return  # Skip mouse rotation if not focused
 
@@ -209,25 +398,115 @@ class App:
         (x,y) = glfw.get_cursor_pos(self.window)
         d_eulers = 0.02 * ((SCREEN_WIDTH / 2) - x) * GLOBAL_Z
         d_eulers += 0.02 * ((SCREEN_HEIGHT / 2) - y) * GLOBAL_Y
-        self.scene.spin_player(d_eulers)
+        self._send(self.scene.spin_player, d_eulers)
         glfw.set_cursor_pos(self.window, SCREEN_WIDTH / 2, SCREEN_HEIGHT / 2)
 
+    def _pick(self) -> None:
+        """
+            Cast a ray through the crosshair, or the cursor when
+            it is free, and remember what it hits. The cast runs
+            wherever the scene is updated, at most one at a time.
+        """
+
+        if self.picking:
+            return
+
+        cursor = None
+        if not self.mouse_locked:
+            x, y = glfw.get_cursor_pos(self.window)
+            width, height = glfw.get_window_size(self.window)
+            if width == 0 or height == 0:
+                return
+            cursor = (x, y, width, height)
+
+        self.picking = True
+        self._send(self._cast_pick, cursor, self.renderer.projection.copy())
+
+    def _cast_pick(self, cursor: tuple | None, projection: np.ndarray) -> None:
+        """
+            Cast the pick ray against the scene and publish the hit.
+
+            Parameters:
+
+                cursor: (x, y, width, height) of a free cursor,
+                    None to cast through the crosshair.
+
+                projection: the renderer's projection.
+        """
+
+        camera = self.scene.player
+        if cursor is None:
+            origin, direction = camera.position.copy(), camera.forwards.copy()
+        else:
+            origin, direction = camera.get_ray(*cursor, projection)
+
+        hit = self.scene.raycast(origin, direction)
+        hovered = None if hit is None else (hit.entity, hit.submesh)
+        previous = None if self.hovered is None else (self.hovered.entity, self.hovered.submesh)
+        if hovered != previous and hit is not None:
+            log.debug(
+                "Pointing at %s, range %s, at %s",
+                type(hit.entity).__name__, hit.submesh, hit.point)
+        self.hovered = hit
+        self.picking = False
+
     def _calculate_framerate(self) -> None:
         """
-            Calculate the framerate and frametime,
-            and update the window title.
+            Update the window title with the framerate,
+            once a second.
         """
 
         self.current_time = glfw.get_time()
         delta = self.current_time - self.last_time
         if (delta >= 1):
-            framerate = max(1,int(self.frames_rendered/delta))
-            glfw.set_window_title(self.window, f"Running at {framerate} fps.")
+            framerate = max(1,int(self.clock.get_fps()))
+            p99 = self.clock.stats().get("p99", 0.0)
+            title = f"Running at {framerate} fps (p99 {p99:.1f} ms)."
+            slowest = self._get_slowest_pass()
+            if slowest is not None:
+                name, milliseconds = slowest
+                title += f" Slowest pass: {name} ({milliseconds:.2f} ms)"
+            glfw.set_window_title(self.window, title)
             self.last_time = self.current_time
             self.frames_rendered = -1
-            self.frametime = float(1000.0 / max(1,framerate))
         self.frames_rendered += 1
 
+    def _log_frame_times(self) -> None:
+        """
+            Log a histogram of the recent frame times
+            and how many of them were spikes.
+        """
+
+        counts, edges = self.clock.get_histogram(bins = 10)
+        peak = max(1, counts.max())
+        for count, lo, hi in zip(counts, edges[:-1], edges[1:]):
+            bar = "#" * int(40 * count / peak)
+            log.info("%7.2f-%7.2f ms %5d %s", lo, hi, count, bar)
+        stats = self.clock.stats()
+        log.info(
+            "%d spikes in %d frames, p50 %.2f ms, p99 %.2f ms",
+            stats["spikes"], stats["samples"], stats["p50"], stats["p99"])
+
+    def _get_slowest_pass(self) -> tuple[str, float] | None:
+        """
+            Returns the render pass with the highest median GPU time.
+        """
+
+        passes = self.renderer.timer.stats()
+        timings = [
+            (name, clocks["gpu"]["p50"])
+            for name, clocks in passes.items() if "gpu" in clocks
+        ]
+        if not timings:
+            return None
+        return max(timings, key = lambda timing: timing[1])
+
     def quit(self):
         
+        if self.worker is not None:
+            self.worker.stop()
+        if self.streamer is not None:
+            self.streamer.destroy()
+        self.fences.destroy()
         self.renderer.destroy()
+        GPU_MEMORY.check_leaks()
@@ -0,0 +1,385 @@
+import ctypes
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from OpenGL.GL import *
+import numpy as np
+
+from core.headless import create_headless_context
+from core.scene import Scene
+from graphics.engine import GraphicsEngine
+from graphics.framebuffer import Framebuffer
+from utils.gpu_memory import GPU_MEMORY
+
+FRAME_FORMATS = ("png", "raw")
+
+
+class CameraPath:
+    """
+        A keyframed camera fly-through, sampled with linear
+        interpolation between keyframes.
+
+        File format:
+            {"keyframes": [
+                {"time": 0.0, "position": [x, y, z], "eulers": [roll, pitch, yaw]},
+                ...
+            ]}
+    """
+    __slots__ = ("times", "positions", "eulers")
+
+
+    def __init__(self, keyframes: list[dict]):
+        """
+            Initialize the path.
+
+            Parameters:
+
+                keyframes: dicts holding "time" (seconds),
+                    "position" and "eulers" (degrees).
+        """
+
+        if not keyframes:
+            raise ValueError("A camera path needs at least one keyframe")
+
+        keyframes = sorted(keyframes, key = lambda keyframe: keyframe["time"])
+        self.times = np.array(
+            [keyframe["time"] for keyframe in keyframes], dtype=np.float64)
+        self.positions = np.array(
+            [keyframe["position"] for keyframe in keyframes], dtype=np.float32)
+        self.eulers = np.array(
+            [keyframe["eulers"] for keyframe in keyframes], dtype=np.float32)
+
+    @classmethod
+    def from_json(cls, filepath: str) -> "CameraPath":
+        """
+            Load a path from a JSON file.
+        """
+
+        with open(filepath, "r") as f:
+            return cls(json.load(f)["keyframes"])
+
+    @property
+    def duration(self) -> float:
+        """
+            Length of the path in seconds.
+        """
+
+        return float(self.times[-1] - self.times[0])
+
+    def sample(self, t: float) -> tuple[np.ndarray, np.ndarray]:
+        """
+            Returns the camera's position and eulers at the given time.
+        """
+
+        if len(self.times) == 1:
+            return self.positions[0].copy(), self.eulers[0].copy()
+
+        t = min(max(t, self.times[0]), self.times[-1])
+        i = int(np.searchsorted(self.times, t, side = "right")) - 1
+        i = min(max(i, 0), len(self.times) - 2)
+
+        span = self.times[i + 1] - self.times[i]
+        alpha = 0.0 if span <= 0 else (t - self.times[i]) / span
+
+        position = self.positions[i] + alpha * (self.positions[i + 1] - self.positions[i])
+
+        # turn the short way round
+        d_eulers = self.eulers[i + 1] - self.eulers[i]
+        d_eulers = (d_eulers + 180) % 360 - 180
+        eulers = self.eulers[i] + alpha * d_eulers
+
+        return position.astype(np.float32), eulers.astype(np.float32)
+
+class PixelReadback:
+    """
+        Reads frames back through a ring of pixel buffer objects.
+        glReadPixels only queues a copy into a buffer, which is mapped
+        once the ring wraps round, by which time the copy is done.
+    """
+    __slots__ = ("width", "height", "buffers", "frames", "next")
+
+
+    def __init__(self, width: int, height: int, size: int = 3):
+        """
+            Allocate the buffers.
+
+            Parameters:
+
+                width: width of the frames.
+
+                height: height of the frames.
+
+                size: number of buffers, i.e. frames in flight.
+        """
+
+        self.width = width
+        self.height = height
+        self.buffers = [int(buffer) for buffer in np.atleast_1d(glGenBuffers(size))]
+        for buffer in self.buffers:
+            glBindBuffer(GL_PIXEL_PACK_BUFFER, buffer)
+            glBufferData(GL_PIXEL_PACK_BUFFER, self.nbytes, None, GL_STREAM_READ)
+            GPU_MEMORY.track_buffer(buffer, self.nbytes, "pixel readback", "batch frames")
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+
+        # frame index held by each buffer, None when free
+        self.frames: list[int | None] = [None] * size
+        self.next = 0
+
+    @property
+    def nbytes(self) -> int:
+        """
+            Size of one frame in bytes.
+        """
+
+        return self.width * self.height * 4
+
+    def is_full(self) -> bool:
+        """
+            Whether the next read would overwrite a frame
+            which hasn't been collected.
+        """
+
+        return self.frames[self.next] is not None
+
+    def start(self, fbo: int, frame: int) -> None:
+        """
+            Queue the copy of a framebuffer's color into the next buffer.
+        """
+
+        glBindFramebuffer(GL_READ_FRAMEBUFFER, fbo)
+        glReadBuffer(GL_COLOR_ATTACHMENT0)
+        glPixelStorei(GL_PACK_ALIGNMENT, 1)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, self.buffers[self.next])
+        glReadPixels(0, 0, self.width, self.height,
+                    GL_RGBA, GL_UNSIGNED_BYTE, ctypes.c_void_p(0))
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+
+        self.frames[self.next] = frame
+        self.next = (self.next + 1) % len(self.buffers)
+
+    def finish(self) -> tuple[int, np.ndarray] | None:
+        """
+            Collect the oldest queued frame.
+
+            Returns:
+
+                The frame index and a (height, width, 4) copy of its
+                pixels, bottom row first, or None if nothing is queued.
+        """
+
+        # the oldest frame is the first one after the write cursor
+        for offset in range(len(self.buffers)):
+            slot = (self.next + offset) % len(self.buffers)
+            if self.frames[slot] is not None:
+                break
+        else:
+            return None
+
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, self.buffers[slot])
+        address = glMapBufferRange(
+            GL_PIXEL_PACK_BUFFER, 0, self.nbytes, GL_MAP_READ_BIT)
+        mapped = (ctypes.c_ubyte * self.nbytes).from_address(address)
+        pixels = np.array(mapped, dtype=np.uint8, copy = True).reshape(
+            self.height, self.width, 4)
+        glUnmapBuffer(GL_PIXEL_PACK_BUFFER)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+
+        frame = self.frames[slot]
+        self.frames[slot] = None
+        return frame, pixels
+
+    def destroy(self) -> None:
+        """
+            Free the buffers.
+        """
+
+        glDeleteBuffers(len(self.buffers), self.buffers)
+        GPU_MEMORY.release("buffer", *self.buffers)
+
+def encode_frame(
+    pixels: np.ndarray, filepath: str,
+    frame_format: str, compress_level: int) -> float:
+    """
+        Write one frame to disk.
+
+        Parameters:
+
+            pixels: (height, width, 4) pixels, bottom row first.
+
+            filepath: where to write the frame.
+
+            frame_format: "png" or "raw" (RGBA8, top row first).
+
+            compress_level: zlib level for png files.
+
+        Returns:
+
+            The time spent, in seconds.
+    """
+
+    start = time.perf_counter()
+    pixels = np.ascontiguousarray(pixels[::-1])
+    if frame_format == "png":
+        from PIL import Image
+
+        Image.fromarray(pixels, "RGBA").save(
+            filepath, compress_level = compress_level)
+    else:
+        with open(filepath, "wb") as f:
+            f.write(pixels.tobytes())
+    return time.perf_counter() - start
+
+class BatchRenderer:
+    """
+        Renders a camera path offscreen to an image sequence,
+        overlapping drawing, readback and encoding.
+    """
+    __slots__ = (
+        "context", "renderer", "scene", "target", "readback",
+        "pool", "workers", "width", "height")
+
+
+    def __init__(self,
+        width: int, height: int, backend: str = "egl",
+        workers: int | None = None, ring_size: int = 3):
+        """
+            Initialize the renderer.
+
+            Parameters:
+
+                width: width of the frames.
+
+                height: height of the frames.
+
+                backend: how to create the context, "egl" or "osmesa".
+
+                workers: number of encoding threads,
+                    defaults to the number of cores.
+
+                ring_size: number of frames being read back at once.
+        """
+
+        self.width = width
+        self.height = height
+        self.workers = workers or os.cpu_count() or 1
+
+        self.context = create_headless_context(backend, width, height)
+
+        self.renderer = GraphicsEngine()
+        self.scene = Scene()
+        self.renderer.build_static_batches(self.scene.entities)
+        self.target = Framebuffer(width, height, "batch target")
+        self.renderer.resize(width, height)
+        self.renderer.set_render_target(self.target.fbo)
+
+        self.readback = PixelReadback(width, height, ring_size)
+        self.pool = ThreadPoolExecutor(max_workers = self.workers)
+
+    def render_path(self,
+        path: CameraPath, out_dir: str, fps: float = 30.0,
+        frame_format: str = "png", compress_level: int = 1) -> dict:
+        """
+            Render every frame of a camera path.
+
+            Parameters:
+
+                path: the camera path to follow.
+
+                out_dir: directory receiving the frames.
+
+                fps: frames per second of path time.
+
+                frame_format: "png" or "raw".
+
+                compress_level: zlib level for png files,
+                    low levels trade size for throughput.
+
+            Returns:
+
+                A summary: frame count, throughput and the time spent
+                rendering, reading back and encoding.
+        """
+
+        if frame_format not in FRAME_FORMATS:
+            raise ValueError(f"Unknown frame format: {frame_format}")
+        os.makedirs(out_dir, exist_ok = True)
+
+        frame_count = max(1, int(round(path.duration * fps)) + 1)
+        pending: deque[Future] = deque()
+        render_time = 0.0
+        readback_time = 0.0
+        encode_time = 0.0
+
+        def collect() -> None:
+            nonlocal readback_time
+            start = time.perf_counter()
+            frame, pixels = self.readback.finish()
+            readback_time += time.perf_counter() - start
+            filepath = os.path.join(out_dir, f"frame_{frame:05d}.{frame_format}")
+            pending.append(self.pool.submit(
+                encode_frame, pixels, filepath, frame_format, compress_level))
+
+        def drain(limit: int) -> None:
+            nonlocal encode_time
+            while len(pending) > limit:
+                encode_time += pending.popleft().result()
+
+        start = time.perf_counter()
+        for frame in range(frame_count):
+            if self.readback.is_full():
+                collect()
+            # don't let finished frames pile up in memory
+            drain(2 * self.workers)
+
+            frame_start = time.perf_counter()
+            position, eulers = path.sample(path.times[0] + frame / fps)
+            self._place_camera(position, eulers)
+            self.renderer.render(
+                self.scene.player, self.scene.entities, self.scene.lights)
+            self.readback.start(self.target.fbo, frame)
+            render_time += time.perf_counter() - frame_start
+
+        while any(slot is not None for slot in self.readback.frames):
+            collect()
+        drain(0)
+        elapsed = time.perf_counter() - start
+
+        report = {
+            "frames": frame_count,
+            "width": self.width,
+            "height": self.height,
+            "seconds": elapsed,
+            "fps": frame_count / elapsed if elapsed > 0 else 0.0,
+            "render_seconds": render_time,
+            "readback_seconds": readback_time,
+            # summed over the worker threads
+            "encode_seconds": encode_time,
+            "workers": self.workers,
+        }
+        print(f"Rendered {frame_count} frames in {elapsed:.2f} s "
+              f"({report['fps']:.1f} fps): render {render_time:.2f} s, "
+              f"readback {readback_time:.2f} s, encode {encode_time:.2f} s "
+              f"over {self.workers} workers")
+        return report
+
+    def _place_camera(self, position: np.ndarray, eulers: np.ndarray) -> None:
+        """
+            Put the scene's camera at the given pose.
+        """
+
+        camera = self.scene.player
+        camera.position[:] = position
+        camera.eulers[:] = eulers
+        camera.update(0)
+
+    def quit(self) -> None:
+
+        self.pool.shutdown(wait = True)
+        self.readback.destroy()
+        self.target.destroy()
+        self.renderer.destroy()
+        GPU_MEMORY.check_leaks()
+        self.context.destroy()
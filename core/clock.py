@@ -0,0 +1,171 @@
+import time
+
+import numpy as np
+
+# a frame longer than this is treated as a stall, not simulated in full
+MAX_FRAME_TIME = 0.25
+
+
+class FrameClock:
+    """
+        Measures the time between frames and keeps the most
+        recent frame times in a ring buffer.
+    """
+    __slots__ = ("times", "count", "index", "last_tick")
+
+
+    def __init__(self, history: int = 600):
+        """
+            Initialize the clock.
+
+            Parameters:
+
+                history: number of frame times kept.
+        """
+
+        self.times = np.zeros(history, dtype=np.float64)
+        self.count = 0
+        self.index = 0
+        self.last_tick = time.perf_counter()
+
+    def tick(self) -> float:
+        """
+            Mark the start of a new frame.
+
+            Returns:
+
+                The seconds since the previous tick, clamped
+                to MAX_FRAME_TIME.
+        """
+
+        now = time.perf_counter()
+        delta = now - self.last_tick
+        self.last_tick = now
+
+        self.times[self.index] = delta
+        self.index = (self.index + 1) % len(self.times)
+        self.count = min(self.count + 1, len(self.times))
+
+        return min(delta, MAX_FRAME_TIME)
+
+    def get_frame_times(self) -> np.ndarray:
+        """
+            Returns the recorded frame times in seconds, oldest first.
+        """
+
+        if self.count < len(self.times):
+            return self.times[:self.count].copy()
+        return np.roll(self.times, -self.index)
+
+    def get_fps(self) -> float:
+        """
+            Returns the average framerate over the recorded frames.
+        """
+
+        times = self.get_frame_times()
+        if len(times) == 0 or times.sum() <= 0:
+            return 0.0
+        return len(times) / times.sum()
+
+    def get_histogram(self, bins: int = 20) -> tuple[np.ndarray, np.ndarray]:
+        """
+            Returns a histogram of the recorded frame times.
+
+            Returns:
+
+                (counts, edges), the bin edges in milliseconds.
+        """
+
+        return np.histogram(self.get_frame_times() * 1000.0, bins = bins)
+
+    def get_spikes(self, factor: float = 2.0) -> np.ndarray:
+        """
+            Returns the positions (oldest first) of the frames which
+            took more than factor times the median frame time.
+        """
+
+        times = self.get_frame_times()
+        if len(times) == 0:
+            return np.zeros(0, dtype=np.int64)
+        return np.flatnonzero(times > factor * np.median(times))
+
+    def is_spike(self, factor: float = 2.0) -> bool:
+        """
+            Returns whether the latest frame was a spike.
+        """
+
+        if self.count == 0:
+            return False
+        times = self.get_frame_times()
+        return bool(times[-1] > factor * np.median(times))
+
+    def stats(self, factor: float = 2.0) -> dict[str, float]:
+        """
+            Returns a summary of the recorded frame times,
+            in milliseconds.
+        """
+
+        times = self.get_frame_times() * 1000.0
+        if len(times) == 0:
+            return {}
+        return {
+            "mean": float(times.mean()),
+            "p50": float(np.percentile(times, 50)),
+            "p95": float(np.percentile(times, 95)),
+            "p99": float(np.percentile(times, 99)),
+            "max": float(times.max()),
+            "spikes": int(len(self.get_spikes(factor))),
+            "samples": int(len(times)),
+        }
+
+class FixedTimestep:
+    """
+        Turns variable frame times into a whole number of fixed
+        simulation steps, carrying the remainder over.
+    """
+    __slots__ = ("step", "accumulator", "max_steps")
+
+
+    def __init__(self, step: float, max_steps: int = 5):
+        """
+            Initialize the accumulator.
+
+            Parameters:
+
+                step: length of one simulation step, in seconds.
+
+                max_steps: most steps run in one frame, so a slow
+                    frame can't snowball into slower ones.
+        """
+
+        self.step = step
+        self.accumulator = 0.0
+        self.max_steps = max_steps
+
+    def advance(self, delta: float) -> int:
+        """
+            Add a frame's time.
+
+            Returns:
+
+                The number of simulation steps to run.
+        """
+
+        self.accumulator += delta
+        steps = int(self.accumulator // self.step)
+        if steps > self.max_steps:
+            # drop the time we can't catch up on
+            steps = self.max_steps
+            self.accumulator = 0.0
+        else:
+            self.accumulator -= steps * self.step
+        return steps
+
+    @property
+    def alpha(self) -> float:
+        """
+            How far the render time is between the last
+            simulation step and the next, from 0 to 1.
+        """
+
+        return self.accumulator / self.step
@@ -0,0 +1,298 @@
+import numpy as np
+
+from core.constants import *
+from utils.bvh import intersect_triangles
+
+# farthest the player drops onto the ground below in one move
+MAX_DROP = 50.0
+# penetration resolving passes per substep
+RESOLVE_ITERATIONS = 4
+
+############################## helper functions ###############################
+
+def closest_points_on_triangles(point: np.ndarray, triangles: np.ndarray) -> np.ndarray:
+    """
+        Returns the point of each triangle closest to a point,
+        after Ericson's Real-Time Collision Detection, 5.1.5.
+
+        Parameters:
+
+            point: (3,) the point.
+
+            triangles: (n, 3, 3) corners of each triangle.
+    """
+
+    a, b, c = triangles[:, 0], triangles[:, 1], triangles[:, 2]
+    ab = b - a
+    ac = c - a
+    dot = lambda u, v: np.einsum("ij,ij->i", u, v)
+
+    ap = point - a
+    bp = point - b
+    cp = point - c
+    d1, d2 = dot(ab, ap), dot(ac, ap)
+    d3, d4 = dot(ab, bp), dot(ac, bp)
+    d5, d6 = dot(ab, cp), dot(ac, cp)
+    va = d3 * d6 - d5 * d4
+    vb = d5 * d2 - d1 * d6
+    vc = d1 * d4 - d3 * d2
+
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        # inside the face
+        denominator = va + vb + vc
+        denominator = np.where(np.abs(denominator) > 1e-12, denominator, 1.0)
+        result = a + ab * (vb / denominator)[:, None] + ac * (vc / denominator)[:, None]
+
+        # later regions win, so the order is the reverse of Ericson's tests
+        t = (d4 - d3) / ((d4 - d3) + (d5 - d6))
+        mask = (va <= 0) & (d4 - d3 >= 0) & (d5 - d6 >= 0)
+        result = np.where(mask[:, None], b + (c - b) * t[:, None], result)
+
+        t = d2 / (d2 - d6)
+        mask = (vb <= 0) & (d2 >= 0) & (d6 <= 0)
+        result = np.where(mask[:, None], a + ac * t[:, None], result)
+
+        mask = (d6 >= 0) & (d5 <= d6)
+        result = np.where(mask[:, None], c, result)
+
+        t = d1 / (d1 - d3)
+        mask = (vc <= 0) & (d1 >= 0) & (d3 <= 0)
+        result = np.where(mask[:, None], a + ab * t[:, None], result)
+
+        mask = (d3 >= 0) & (d4 <= d3)
+        result = np.where(mask[:, None], b, result)
+
+        mask = (d1 <= 0) & (d2 <= 0)
+        result = np.where(mask[:, None], a, result)
+    return result
+
+class TriangleGrid:
+    """
+        A spatial hash of static triangles on a uniform grid, each
+        filed under every cell its bounding box touches. Triangles
+        are added and removed in groups, by owner, so streamed
+        parts of the world can come and go.
+    """
+    __slots__ = ("cell_size", "cells", "groups")
+
+
+    def __init__(self, cell_size: float = COLLISION_CELL_SIZE):
+        """
+            Initialize an empty grid.
+
+            Parameters:
+
+                cell_size: width of each cubic cell.
+        """
+
+        self.cell_size = cell_size
+        # cell -> owner -> indices into the owner's triangles
+        self.cells: dict[tuple[int, int, int], dict[object, np.ndarray]] = {}
+        # owner -> (its (n, 3, 3) triangles, the cells they're in)
+        self.groups: dict[object, tuple[np.ndarray, list[tuple]]] = {}
+
+    def add(self, owner, triangles: np.ndarray) -> None:
+        """
+            File a group of world space triangles,
+            replacing any the owner had before.
+        """
+
+        self.remove(owner)
+        triangles = np.asarray(triangles, dtype=np.float64).reshape(-1, 3, 3)
+        if len(triangles) == 0:
+            return
+
+        lo = np.floor(triangles.min(axis = 1) / self.cell_size).astype(np.int64)
+        hi = np.floor(triangles.max(axis = 1) / self.cell_size).astype(np.int64)
+        spans = hi - lo + 1
+        counts = spans.prod(axis = 1)
+
+        # one (triangle, cell) pair per cell each triangle's box covers
+        ids = np.repeat(np.arange(len(triangles)), counts)
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        sy, sz = spans[ids, 1], spans[ids, 2]
+        offsets = np.stack([local // (sy * sz), (local // sz) % sy, local % sz], axis = 1)
+        cells = lo[ids] + offsets
+
+        keys, inverse = np.unique(cells, axis = 0, return_inverse = True)
+        inverse = inverse.reshape(-1)
+        order = np.argsort(inverse, kind = "stable")
+        splits = np.cumsum(np.bincount(inverse))[:-1]
+        keys = [tuple(key) for key in keys.tolist()]
+        for key, members in zip(keys, np.split(ids[order], splits)):
+            self.cells.setdefault(key, {})[owner] = members
+        self.groups[owner] = (triangles, keys)
+
+    def remove(self, owner) -> None:
+        """
+            Forget a group of triangles.
+        """
+
+        group = self.groups.pop(owner, None)
+        if group is None:
+            return
+        for key in group[1]:
+            cell = self.cells[key]
+            cell.pop(owner, None)
+            if not cell:
+                del self.cells[key]
+
+    def query(self, lo: np.ndarray, hi: np.ndarray) -> np.ndarray:
+        """
+            Returns the (m, 3, 3) triangles filed in the
+            cells a box touches, each once.
+        """
+
+        first = np.floor(np.asarray(lo) / self.cell_size).astype(np.int64)
+        last = np.floor(np.asarray(hi) / self.cell_size).astype(np.int64)
+
+        found: dict[object, list[np.ndarray]] = {}
+        for i in range(first[0], last[0] + 1):
+            for j in range(first[1], last[1] + 1):
+                for k in range(first[2], last[2] + 1):
+                    cell = self.cells.get((i, j, k))
+                    if cell is None:
+                        continue
+                    for owner, members in cell.items():
+                        found.setdefault(owner, []).append(members)
+
+        if not found:
+            return np.zeros((0, 3, 3))
+        return np.concatenate([
+            self.groups[owner][0][np.unique(np.concatenate(members))]
+            for owner, members in found.items()
+        ])
+
+class PlayerCollider:
+    """
+        Moves the player through the world without passing through
+        its static geometry. Moves are swept in substeps no longer
+        than half the player's radius, so walls can't be skipped,
+        and each substep pushes the body back out of whatever it
+        went into, which makes it slide along walls.
+
+        Flying, the body is a sphere around the eye. Walking, it is
+        a capsule from the knees to the eye, approximated by spheres
+        along it, and the feet follow the ground below.
+    """
+    __slots__ = ("grid", "radius", "eye_height", "step_height", "walking")
+
+
+    def __init__(self,
+        grid: TriangleGrid, radius: float = PLAYER_RADIUS,
+        eye_height: float = EYE_HEIGHT, step_height: float = STEP_HEIGHT):
+        """
+            Initialize the collider.
+
+            Parameters:
+
+                grid: the static triangles.
+
+                radius: the body's radius.
+
+                eye_height: from the feet to the camera.
+
+                step_height: tallest ledge walked up onto.
+        """
+
+        self.grid = grid
+        self.radius = radius
+        self.eye_height = eye_height
+        self.step_height = step_height
+        self.walking = False
+
+    def _get_body(self) -> np.ndarray:
+        """
+            Returns the centers of the body's spheres,
+            relative to the eye.
+        """
+
+        if not self.walking:
+            return np.zeros((1, 3))
+        # from just above a step to the eye, spheres a radius apart
+        lowest = self.step_height + self.radius - self.eye_height
+        count = max(1, int(np.ceil(-lowest / self.radius)) + 1)
+        heights = np.linspace(lowest, 0.0, count)
+        return np.column_stack([np.zeros(count), np.zeros(count), heights])
+
+    def move(self, position: np.ndarray, displacement: np.ndarray) -> np.ndarray:
+        """
+            Returns where the eye ends up after trying to
+            move it by the displacement.
+        """
+
+        position = np.asarray(position, dtype=np.float64).copy()
+        displacement = np.asarray(displacement, dtype=np.float64)
+        body = self._get_body()
+
+        length = np.linalg.norm(displacement)
+        steps = max(1, int(np.ceil(length / (0.5 * self.radius))))
+        for _ in range(steps):
+            position += displacement / steps
+            position = self._resolve(position, body)
+
+        if self.walking:
+            ground = self.find_ground(position)
+            if ground is not None:
+                position[2] = ground + self.eye_height
+        return position
+
+    def _resolve(self, position: np.ndarray, body: np.ndarray) -> np.ndarray:
+        """
+            Push the body out of the triangles around it,
+            deepest overlap first.
+        """
+
+        reach = self.radius + 1e-3
+        lo = position + body.min(axis = 0) - reach
+        hi = position + body.max(axis = 0) + reach
+        triangles = self.grid.query(lo, hi)
+        if len(triangles) == 0:
+            return position
+
+        for _ in range(RESOLVE_ITERATIONS):
+            deepest = 0.0
+            push = None
+            for center in position + body:
+                closest = closest_points_on_triangles(center, triangles)
+                offsets = center - closest
+                distances = np.linalg.norm(offsets, axis = 1)
+                i = int(np.argmin(distances))
+                depth = self.radius - distances[i]
+                if depth <= deepest:
+                    continue
+                deepest = depth
+                if distances[i] > 1e-9:
+                    normal = offsets[i] / distances[i]
+                else:
+                    # the center is on the triangle, leave along its normal
+                    a, b, c = triangles[i]
+                    normal = np.cross(b - a, c - a)
+                    normal /= max(np.linalg.norm(normal), 1e-12)
+                push = normal * depth
+            if push is None:
+                break
+            position = position + push
+        return position
+
+    def find_ground(self, position: np.ndarray) -> float | None:
+        """
+            Returns the height of the ground under the feet, looking
+            from a step above them down to MAX_DROP below, or None.
+        """
+
+        top = position[2] - self.eye_height + self.step_height
+        lo = np.array([position[0], position[1], top - MAX_DROP])
+        hi = np.array([position[0], position[1], top])
+        triangles = self.grid.query(lo, hi)
+        if len(triangles) == 0:
+            return None
+
+        count = len(triangles)
+        origins = np.tile([position[0], position[1], top], (count, 1))
+        directions = np.tile([0.0, 0.0, -1.0], (count, 1))
+        distances = intersect_triangles(origins, directions, triangles)
+        distance = distances.min()
+        if distance > MAX_DROP:
+            return None
+        return float(top - distance)
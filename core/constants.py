@@ -16,20 +16,91 @@ ENTITY_TYPE = {
     "MEDKIT": 2
 }
 
+# entity types drawn as camera facing sprites rather than models
+BILLBOARD_TYPES = frozenset((ENTITY_TYPE["POINTLIGHT"], ENTITY_TYPE["MEDKIT"]))
+
+MAX_LIGHTS = 8
+
 UNIFORM_TYPE = {
     "MODEL": 0,
-    "VIEW": 1,
-    "PROJECTION": 2,
-    "CAMERA_POS": 3,
-    "LIGHT_COLOR": 4,
-    "LIGHT_POS": 5,
-    "LIGHT_STRENGTH": 6,
-    "TINT": 7,
-    "LIGHT_MATRIX": 8,
+    "LIGHT_VOLUME": 2,
+    "LIGHT_INDEX": 3,
+    "INVERSE_VIEW_PROJECTION": 4,
+    "SCREEN_SIZE": 5,
+}
+
+UNIFORM_BLOCK = {
+    "FRAME": 0,
+    "LIGHTS": 1,
 }
 
 PIPELINE_TYPE = {
     "STANDARD": 0,
     "EMISSIVE": 1,
     "SHADOW": 2,
-}
\ No newline at end of file
+    "GBUFFER": 3,
+    "DEFERRED_AMBIENT": 4,
+    "DEFERRED_LIGHT": 5,
+    "BILLBOARD": 6,
+    "GBUFFER_BILLBOARD": 7,
+    "DEPTH": 8,
+}
+
+PRESENT_MODE = {
+    "VSYNC": 0,
+    "ADAPTIVE_VSYNC": 1,
+    "LIMITED": 2,
+    "UNCAPPED": 3,
+}
+
+TARGET_FPS = 120
+
+# length of one simulation step, in seconds
+FIXED_TIMESTEP = 1.0 / 60.0
+# player speed, in units per second
+PLAYER_SPEED = 5.0
+MAX_FRAMES_IN_FLIGHT = 2
+
+RENDER_PATH = {
+    "FORWARD": 0,
+    "DEFERRED": 1,
+}
+
+DEPTH_PREPASS = {
+    "OFF": 0,
+    "ON": 1,
+    "AUTO": 2,
+}
+
+# light contributions below this are not worth shading
+LIGHT_CUTOFF = 1.0 / 256.0
+# world streaming: cells load once the camera is within the first
+# distance of them and unload once it is past the second, so
+# walking along a cell border doesn't load and unload it repeatedly
+STREAM_LOAD_RADIUS = 60.0
+STREAM_UNLOAD_RADIUS = 80.0
+# memory the streamed cells may take up, in bytes
+STREAM_MEMORY_LIMIT = 512 * 1024 * 1024
+# how far ahead cells are prefetched, in seconds of movement
+STREAM_PREFETCH_TIME = 2.0
+
+# the player's body when colliding with the world, in world units
+PLAYER_RADIUS = 0.3
+EYE_HEIGHT = 1.6
+# tallest ledge walked up without jumping
+STEP_HEIGHT = 0.4
+# width of the collision spatial hash's cells
+COLLISION_CELL_SIZE = 2.0
+
+# overdraw, fragments passing the depth test per visible pixel, above
+# which the automatic depth prepass turns on and below which it turns
+# back off; the prepass costs a second geometry pass, so it has to
+# save more shading than that
+PREPASS_ENABLE_OVERDRAW = 1.5
+PREPASS_DISABLE_OVERDRAW = 1.2
+
+# dynamic resolution: the fractions of the window the scene may be
+# drawn at, render targets are only reallocated moving between them
+DYNAMIC_RESOLUTION_STEPS = (0.5, 0.625, 0.75, 0.875, 1.0)
+# GPU frame time the scale is adjusted to hold, in milliseconds
+DYNAMIC_RESOLUTION_TARGET = 1000.0 / 60.0
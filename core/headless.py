@@ -0,0 +1,295 @@
+import ctypes
+import json
+import time
+
+from OpenGL.GL import glFinish
+import numpy as np
+
+from core.constants import GLOBAL_Z
+from core.scene import Scene
+from graphics.engine import GraphicsEngine
+from graphics.framebuffer import Framebuffer
+from utils.gpu_memory import GPU_MEMORY
+
+# Mesa's surfaceless platform, from EGL_MESA_platform_surfaceless
+EGL_PLATFORM_SURFACELESS_MESA = 0x31DD
+
+HEADLESS_BACKENDS = ("egl", "osmesa")
+
+
+class EGLContext:
+    """
+        An OpenGL 3.3 core context without any window or surface,
+        through EGL.
+    """
+    __slots__ = ("display", "context")
+
+
+    def __init__(self):
+        """
+            Create the context and make it current.
+        """
+
+        from OpenGL import EGL
+
+        self.display = self._get_display(EGL)
+
+        major, minor = EGL.EGLint(), EGL.EGLint()
+        if not EGL.eglInitialize(
+            self.display, ctypes.pointer(major), ctypes.pointer(minor)):
+            raise RuntimeError("Couldn't initialize EGL")
+
+        config_attribs = self._make_attribs(EGL, [
+            EGL.EGL_SURFACE_TYPE, EGL.EGL_PBUFFER_BIT,
+            EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT,
+            EGL.EGL_RED_SIZE, 8,
+            EGL.EGL_GREEN_SIZE, 8,
+            EGL.EGL_BLUE_SIZE, 8,
+            EGL.EGL_DEPTH_SIZE, 24,
+            EGL.EGL_NONE
+        ])
+        config = EGL.EGLConfig()
+        config_count = EGL.EGLint()
+        if not EGL.eglChooseConfig(
+            self.display, config_attribs, ctypes.pointer(config), 1,
+            ctypes.pointer(config_count)) or config_count.value == 0:
+            raise RuntimeError("No suitable EGL config")
+
+        EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+        context_attribs = self._make_attribs(EGL, [
+            EGL.EGL_CONTEXT_MAJOR_VERSION, 3,
+            EGL.EGL_CONTEXT_MINOR_VERSION, 3,
+            EGL.EGL_CONTEXT_OPENGL_PROFILE_MASK,
+            EGL.EGL_CONTEXT_OPENGL_CORE_PROFILE_BIT,
+            EGL.EGL_NONE
+        ])
+        self.context = EGL.eglCreateContext(
+            self.display, config, EGL.EGL_NO_CONTEXT, context_attribs)
+        if not self.context:
+            raise RuntimeError("Couldn't create an EGL context")
+
+        # no surface at all, everything is drawn to framebuffer objects
+        if not EGL.eglMakeCurrent(
+            self.display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, self.context):
+            raise RuntimeError("Couldn't make the EGL context current")
+
+    def _get_display(self, EGL):
+        """
+            Returns the surfaceless display if the driver offers one,
+            the default display otherwise.
+        """
+
+        try:
+            from OpenGL.EGL.EXT.platform_base import eglGetPlatformDisplayEXT
+            display = eglGetPlatformDisplayEXT(
+                EGL_PLATFORM_SURFACELESS_MESA, EGL.EGL_DEFAULT_DISPLAY, None)
+            if display:
+                return display
+        except Exception:
+            pass
+        return EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+
+    def _make_attribs(self, EGL, values: list[int]):
+        """
+            Returns an EGL attribute list.
+        """
+
+        return (EGL.EGLint * len(values))(*values)
+
+    def destroy(self) -> None:
+        """
+            Release the context.
+        """
+
+        from OpenGL import EGL
+
+        EGL.eglMakeCurrent(
+            self.display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, EGL.EGL_NO_CONTEXT)
+        EGL.eglDestroyContext(self.display, self.context)
+        EGL.eglTerminate(self.display)
+
+class OSMesaContext:
+    """
+        An OpenGL 3.3 core context rendered in software by OSMesa
+        (llvmpipe).
+    """
+    __slots__ = ("context", "buffer")
+
+
+    def __init__(self, width: int, height: int):
+        """
+            Create the context and make it current.
+
+            Parameters:
+
+                width: width of the context's own buffer.
+
+                height: height of the context's own buffer.
+        """
+
+        from OpenGL import GL, arrays, osmesa
+
+        attribs = [
+            osmesa.OSMESA_FORMAT, osmesa.OSMESA_RGBA,
+            osmesa.OSMESA_DEPTH_BITS, 24,
+            osmesa.OSMESA_PROFILE, osmesa.OSMESA_CORE_PROFILE,
+            osmesa.OSMESA_CONTEXT_MAJOR_VERSION, 3,
+            osmesa.OSMESA_CONTEXT_MINOR_VERSION, 3,
+            0
+        ]
+        self.context = osmesa.OSMesaCreateContextAttribs(attribs, None)
+        if not self.context:
+            raise RuntimeError("Couldn't create an OSMesa context")
+
+        self.buffer = arrays.GLubyteArray.zeros((height, width, 4))
+        if not osmesa.OSMesaMakeCurrent(
+            self.context, self.buffer, GL.GL_UNSIGNED_BYTE, width, height):
+            raise RuntimeError("Couldn't make the OSMesa context current")
+
+    def destroy(self) -> None:
+        """
+            Release the context.
+        """
+
+        from OpenGL import osmesa
+
+        osmesa.OSMesaDestroyContext(self.context)
+
+def create_headless_context(backend: str, width: int, height: int):
+    """
+        Create and make current an offscreen OpenGL context.
+        PYOPENGL_PLATFORM must already name the same backend.
+
+        Parameters:
+
+            backend: "egl" or "osmesa"
+
+            width: width of the images to be drawn.
+
+            height: height of the images to be drawn.
+    """
+
+    match backend:
+        case "egl":
+            return EGLContext()
+        case "osmesa":
+            return OSMesaContext(width, height)
+    raise ValueError(f"Unknown headless backend: {backend}")
+
+class HeadlessApp:
+    """
+        Runs the renderer without a window or input,
+        drawing into an offscreen framebuffer.
+    """
+    __slots__ = (
+        "context", "renderer", "scene", "target",
+        "width", "height", "spin_rate")
+
+
+    def __init__(self,
+        width: int, height: int, backend: str = "egl",
+        spin_rate: float = 0.5):
+        """
+            Initialize the program.
+
+            Parameters:
+
+                width: width of the rendered images.
+
+                height: height of the rendered images.
+
+                backend: how to create the context, "egl" or "osmesa".
+
+                spin_rate: degrees the camera turns each frame,
+                    so consecutive frames see different geometry.
+        """
+
+        self.width = width
+        self.height = height
+        self.spin_rate = spin_rate
+
+        self.context = create_headless_context(backend, width, height)
+
+        self._create_assets()
+
+    def _create_assets(self) -> None:
+        """
+            Create the renderer, the scene and the render target.
+        """
+
+        self.renderer = GraphicsEngine()
+        self.scene = Scene()
+        self.renderer.build_static_batches(self.scene.entities)
+
+        self.target = Framebuffer(self.width, self.height, "headless target")
+        self.renderer.resize(self.width, self.height)
+        self.renderer.set_render_target(self.target.fbo)
+
+    def render_frame(self) -> None:
+        """
+            Advance the scene by one frame and draw it.
+        """
+
+        self.scene.spin_player(self.spin_rate * GLOBAL_Z)
+        self.scene.update(1.0)
+        self.renderer.render(
+            self.scene.player, self.scene.entities, self.scene.lights)
+
+    def run(self, frames: int) -> dict:
+        """
+            Draw the given number of frames as fast as possible.
+
+            Returns:
+
+                A summary of the run: frame count, time, framerate
+                and per pass timings.
+        """
+
+        start = time.perf_counter()
+        for _ in range(frames):
+            self.render_frame()
+        glFinish()
+        elapsed = time.perf_counter() - start
+
+        report = {
+            "frames": frames,
+            "width": self.width,
+            "height": self.height,
+            "seconds": elapsed,
+            "fps": frames / elapsed if elapsed > 0 else 0.0,
+            "passes": self.renderer.timer.stats(),
+            "depth_prepass": self.renderer.prepass.stats(),
+            "gpu_memory": {
+                "total": GPU_MEMORY.get_total(),
+                "by_kind": GPU_MEMORY.get_totals("kind"),
+                "by_owner": GPU_MEMORY.get_totals("owner"),
+            },
+        }
+        print(f"Rendered {frames} frames in {elapsed:.2f} s "
+              f"({report['fps']:.1f} fps)")
+        return report
+
+    def save_report(self, report: dict, filepath: str) -> None:
+        """
+            Write a run summary to a JSON file.
+        """
+
+        with open(filepath, "w") as f:
+            json.dump(report, f, indent = 2)
+
+    def save_frame(self, filepath: str) -> None:
+        """
+            Write the last rendered image to an image file.
+        """
+
+        from PIL import Image
+
+        pixels = self.target.read_pixels()
+        Image.fromarray(np.ascontiguousarray(pixels), "RGBA").save(filepath)
+
+    def quit(self) -> None:
+
+        self.target.destroy()
+        self.renderer.destroy()
+        GPU_MEMORY.check_leaks()
+        self.context.destroy()
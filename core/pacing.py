@@ -0,0 +1,103 @@
+from collections import deque
+import time
+
+from OpenGL.GL import *
+
+# below this, sleeping is too coarse and the limiter spins instead
+SPIN_THRESHOLD = 0.002
+# how long one glClientWaitSync call may block, in nanoseconds
+FENCE_TIMEOUT = 1_000_000
+
+
+class FrameLimiter:
+    """
+        Holds frames to a target rate. Most of the wait is spent
+        sleeping, the last couple of milliseconds spinning, since
+        sleep alone routinely overshoots.
+    """
+    __slots__ = ("period", "deadline")
+
+
+    def __init__(self, target_fps: float):
+        """
+            Initialize the limiter.
+
+            Parameters:
+
+                target_fps: the framerate to hold.
+        """
+
+        self.period = 1.0 / target_fps
+        self.deadline = time.perf_counter() + self.period
+
+    def set_target(self, target_fps: float) -> None:
+        """
+            Change the framerate to hold.
+        """
+
+        self.period = 1.0 / target_fps
+        self.deadline = time.perf_counter() + self.period
+
+    def wait(self) -> None:
+        """
+            Block until the current frame's slot is over.
+        """
+
+        remaining = self.deadline - time.perf_counter()
+        if remaining > SPIN_THRESHOLD:
+            time.sleep(remaining - SPIN_THRESHOLD)
+        while time.perf_counter() < self.deadline:
+            pass
+
+        # step from the deadline rather than from now, so
+        # oversleeping one frame doesn't delay every later one
+        self.deadline += self.period
+        now = time.perf_counter()
+        if now > self.deadline:
+            # too far behind to catch up, start over
+            self.deadline = now + self.period
+
+class FrameFences:
+    """
+        Limits how many frames the CPU may queue ahead of the GPU,
+        with a fence at the end of every frame.
+    """
+    __slots__ = ("fences", "max_frames_in_flight")
+
+
+    def __init__(self, max_frames_in_flight: int = 2):
+        """
+            Initialize the fences.
+
+            Parameters:
+
+                max_frames_in_flight: number of submitted frames the
+                    GPU may still be working on.
+        """
+
+        self.fences = deque()
+        self.max_frames_in_flight = max_frames_in_flight
+
+    def end_frame(self) -> None:
+        """
+            Fence the frame just submitted, then wait for
+            the GPU to finish the oldest frames in flight.
+        """
+
+        self.fences.append(glFenceSync(GL_SYNC_GPU_COMMANDS_COMPLETE, 0))
+
+        while len(self.fences) > self.max_frames_in_flight:
+            fence = self.fences.popleft()
+            while glClientWaitSync(
+                fence, GL_SYNC_FLUSH_COMMANDS_BIT, FENCE_TIMEOUT) \
+                == GL_TIMEOUT_EXPIRED:
+                pass
+            glDeleteSync(fence)
+
+    def destroy(self) -> None:
+        """
+            Free any remaining fences.
+        """
+
+        while self.fences:
+            glDeleteSync(self.fences.popleft())
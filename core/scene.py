@@ -3,7 +3,10 @@ import pyrr
 from entities.cube import Cube
 from entities.billboard import Billboard
 from entities.pointlight import PointLight
+from entities.archetype import Archetype
 from entities.base import Entity
+from entities.systems import spin
+from core.collision import PlayerCollider, TriangleGrid
 from core.constants import *
 
 
@@ -53,28 +56,81 @@ class Camera(Entity):
 
         self.up = np.cross(self.right, self.forwards)
 
-    def get_view_transform(self) -> np.ndarray:
+    def get_view_transform(self, alpha: float = 1.0) -> np.ndarray:
         """
             Returns the camera's world to view
             transformation matrix.
+
+            Parameters:
+
+                alpha: how far between the previous simulation step
+                    and the current one to place the camera. Only the
+                    position is blended, looking around stays immediate.
         """
 
+        position = self.get_render_position(alpha)
         return pyrr.matrix44.create_look_at(
-            eye = self.position,
-            target = self.position + self.forwards,
+            eye = position,
+            target = position + self.forwards,
             up = self.up, dtype = np.float32)
     
+    def get_ray(self,
+        x: float, y: float, width: int, height: int,
+        projection: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+            Returns the ray from the camera through a point
+            on the screen.
+
+            Parameters:
+
+                x, y: the point, in pixels from the top left.
+
+                width, height: the size of the screen.
+
+                projection: the renderer's projection.
+
+            Returns:
+
+                The ray's origin and unit direction.
+        """
+
+        inverse = np.linalg.inv(pyrr.matrix44.multiply(
+            self.get_view_transform(), projection).astype(np.float64))
+        ndc_x = 2.0 * x / width - 1.0
+        ndc_y = 1.0 - 2.0 * y / height
+        near = np.array([ndc_x, ndc_y, -1.0, 1.0]) @ inverse
+        far = np.array([ndc_x, ndc_y, 1.0, 1.0]) @ inverse
+        direction = far[:3] / far[3] - near[:3] / near[3]
+        return self.position.astype(np.float64), direction / np.linalg.norm(direction)
+
+    def get_displacement(self, d_pos, level: bool = False) -> np.ndarray:
+        """
+            Returns the world space movement for the given amount
+            in the (forwards, right, up) vectors.
+
+            Parameters:
+
+                d_pos: the amount along each vector.
+
+                level: keep the movement on the ground plane,
+                    for walking, whichever way the camera looks.
+        """
+
+        if not level:
+            return d_pos[0] * self.forwards \
+                + d_pos[1] * self.right \
+                + d_pos[2] * self.up
+
+        forwards = np.array([self.forwards[0], self.forwards[1], 0.0])
+        forwards /= max(np.linalg.norm(forwards), 1e-12)
+        return d_pos[0] * forwards + d_pos[1] * self.right
+
     def move(self, d_pos) -> None:
         """
             Move by the given amount in the (forwards, right, up) vectors.
         """
 
-        self.position += d_pos[0] * self.forwards \
-                        + d_pos[1] * self.right \
-                        + d_pos[2] * self.up
-    
-        #hard coding the z constraint
-        # self.position[2] = 2
+        self.position += self.get_displacement(d_pos)
     
     def spin(self, d_eulers) -> None:
         """
@@ -87,11 +143,45 @@ class Camera(Entity):
         self.eulers[1] = min(89, max(-89, self.eulers[1]))
         self.eulers[2] %= 360
 
+class RayHit:
+    """
+        Where a ray cast into the scene first hit an entity.
+    """
+    __slots__ = ("entity", "entity_type", "submesh", "material", "point", "distance")
+
+
+    def __init__(self,
+        entity: Entity, entity_type: int, submesh: int | None,
+        material, point: np.ndarray, distance: float):
+        """
+            Parameters:
+
+                entity: the entity hit.
+
+                entity_type: its type.
+
+                submesh: the range of its mesh hit, for
+                    multi material meshes.
+
+                material: that range's material.
+
+                point: the hit, in world space.
+
+                distance: from the ray's origin to the hit.
+        """
+
+        self.entity = entity
+        self.entity_type = entity_type
+        self.submesh = submesh
+        self.material = material
+        self.point = point
+        self.distance = distance
+
 class Scene:
     """
         Manages all objects and coordinates their interactions.
     """
-    __slots__ = ("entities", "player", "lights")
+    __slots__ = ("archetypes", "entities", "player", "lights", "player_motion", "cells", "meshes", "collider")
 
 
     def __init__(self):
@@ -99,51 +189,54 @@ class Scene:
             Initialize the scene.
         """
 
-        self.entities: dict[int, list[Entity]] = {
-            ENTITY_TYPE["CUBE"]: [
-                Cube(position = [4,0,0], eulers = [90,0,-90]),
-            ],
+        # entity type -> the packed components of its entities
+        self.archetypes: dict[int, Archetype] = {
+            ENTITY_TYPE["CUBE"]: Archetype(),
+            ENTITY_TYPE["MEDKIT"]: Archetype(),
+            ENTITY_TYPE["POINTLIGHT"]: Archetype(MAX_LIGHTS),
+        }
+        cubes = self.archetypes[ENTITY_TYPE["CUBE"]]
+        medkits = self.archetypes[ENTITY_TYPE["MEDKIT"]]
+        lights = self.archetypes[ENTITY_TYPE["POINTLIGHT"]]
 
-            ENTITY_TYPE["MEDKIT"]: [
-                Billboard(position = [3,0,-0.5])
-            ],
+        Cube(position = [4,0,0], eulers = [90,0,-90], static = True, archetype = cubes)
+        Billboard(position = [3,0,-0.5], archetype = medkits)
+
+        # entity type -> its entities, in row order
+        self.entities: dict[int, list[Entity]] = {
+            ENTITY_TYPE["CUBE"]: cubes.entities,
+            ENTITY_TYPE["MEDKIT"]: medkits.entities,
         }
 
-        self.lights: list[PointLight] = [
-            PointLight(
-                position = [1, 1, 1],
-                color = [1, 1, 1],
-                strength = 2),
+        for position, color, strength in (
+            ([1, 1, 1], [1, 1, 1], 2),
+            ([-10,30,10], [1.0, 1.0, 1.0], 8.0),
+            ([-10,27,10], [1.0, 1.0, 1.0], 8.0),
+            ([-10,33,10], [1.0, 1.0, 1.0], 8.0),
+            ([-14,30,10], [1.0, 1.0, 1.0], 8.0),
+            ([-14,27,10], [1.0, 1.0, 1.0], 8.0),
+            ([-14,33,10], [1.0, 1.0, 1.0], 8.0)):
             PointLight(
-                position = [-10,30,10],
-                color = [1.0, 1.0, 1.0],
-                strength = 8.0),
-            PointLight(
-                position = [-10,27,10],
-                color = [1.0, 1.0, 1.0],
-                strength = 8.0),
-            PointLight(
-                position = [-10,33,10],
-                color = [1.0, 1.0, 1.0],
-                strength = 8.0),
-            PointLight(
-                position = [-14,30,10],
-                color = [1.0, 1.0, 1.0],
-                strength = 8.0),
-            PointLight(
-                position = [-14,27,10],
-                color = [1.0, 1.0, 1.0],
-                strength = 8.0),
-            PointLight(
-                position = [-14,33,10],
-                color = [1.0, 1.0, 1.0],
-                strength = 8.0),
-        ]
+                position = position, color = color,
+                strength = strength, archetype = lights)
+        self.lights: list[PointLight] = lights.entities
 
         self.player = Camera(
             position = [0,0,0]
         )
 
+        # (forwards, right, up) movement per step, set from input
+        self.player_motion = np.zeros(3, dtype=np.float32)
+
+        # streamed world cell -> the entities it brought in
+        self.cells: dict[tuple[int, int], list[Entity]] = {}
+
+        # entity type -> the mesh rays are cast against
+        self.meshes: dict[int, object] = {}
+
+        # keeps the player out of the static geometry
+        self.collider = PlayerCollider(TriangleGrid())
+
     def update(self, dt: float) -> None:
         """
             Update all objects in the scene.
@@ -153,22 +246,210 @@ class Scene:
                 dt: framerate correction factor
         """
 
-        # for entities in self.entities.values():
-        #     for entity in entities:
-        #         entity.update(dt, self.player.position)
-        
-        for light in self.lights:
-            light.update(dt, self.player.position)
+        # static rows never change, so copying them along is harmless
+        for archetype in self.archetypes.values():
+            archetype.save_state()
+        self.player.save_state()
+
+        # moving cubes turn, a whole archetype at once;
+        # static ones are batched and left as they are
+        spin(self.archetypes[ENTITY_TYPE["CUBE"]], dt)
+
+        # lights are billboards, which the GPU turns towards
+        # the camera, so they need no update
 
+        if np.any(self.player_motion) or self.collider.walking:
+            self.move_player(dt * self.player_motion)
         self.player.update(dt)
 
+    def spawn(self, entity_type: int, *args, **kwargs) -> Entity:
+        """
+            Create an entity of the given type in the scene.
+
+            Parameters:
+
+                entity_type: which kind of entity.
+
+                args, kwargs: the entity's constructor arguments.
+
+            Returns:
+
+                The new entity.
+        """
+
+        kind = {
+            ENTITY_TYPE["CUBE"]: Cube,
+            ENTITY_TYPE["MEDKIT"]: Billboard,
+            ENTITY_TYPE["POINTLIGHT"]: PointLight,
+        }[entity_type]
+        return kind(*args, archetype = self.archetypes[entity_type], **kwargs)
+
+    def load_cell(self, key: tuple[int, int], descriptions: list[dict]) -> None:
+        """
+            Spawn the entities of a streamed world cell.
+
+            Parameters:
+
+                key: the cell.
+
+                descriptions: keyword arguments for spawn, each with
+                    the entity's "type" as named in ENTITY_TYPE.
+        """
+
+        self.unload_cell(key)
+        self.cells[key] = [
+            self.spawn(
+                ENTITY_TYPE[description["type"]],
+                **{name: value for name, value in description.items() if name != "type"})
+            for description in descriptions
+        ]
+
+    def unload_cell(self, key: tuple[int, int]) -> None:
+        """
+            Remove the entities a world cell brought in.
+        """
+
+        for entity in self.cells.pop(key, []):
+            entity.destroy()
+
+    def set_meshes(self, meshes: dict[int, object]) -> None:
+        """
+            Give the scene the shapes of its entities, for raycast
+            and collision. Meshes without triangles, such as
+            billboards, are skipped.
+        """
+
+        self.meshes = meshes
+
+        # static entities are in the collision grid from now on
+        for entity_type in self.entities:
+            self._add_entity_geometry(entity_type, meshes.get(entity_type))
+
+    def replace_static_geometry(self, entity_type: int, mesh) -> None:
+        """
+            Collide with a reloaded mesh's triangles instead of
+            the old ones, for every static entity of its type.
+        """
+
+        self.meshes[entity_type] = mesh
+        for entity in self.entities.get(entity_type, []):
+            self.remove_static_geometry(("entity", entity.archetype, entity.handle))
+        self._add_entity_geometry(entity_type, mesh)
+
+    def _add_entity_geometry(self, entity_type: int, mesh) -> None:
+        """
+            Put the static entities of a type into the collision
+            grid, in world space.
+        """
+
+        if not hasattr(mesh, "get_triangles"):
+            return
+        triangles = mesh.get_triangles().reshape(-1, 3)
+        for entity in self.entities.get(entity_type, []):
+            if entity.is_static:
+                model = entity.get_model_transform()
+                self.add_static_geometry(
+                    ("entity", entity.archetype, entity.handle),
+                    triangles @ model[:3, :3] + model[3, :3])
+
+    def add_static_geometry(self, owner, triangles: np.ndarray) -> None:
+        """
+            Make the player collide with world space triangles.
+
+            Parameters:
+
+                owner: names the triangles, for removing them.
+
+                triangles: (n, 3, 3) corners of each triangle.
+        """
+
+        self.collider.grid.add(owner, triangles)
+
+    def remove_static_geometry(self, owner) -> None:
+
+        self.collider.grid.remove(owner)
+
+    def toggle_walking(self) -> None:
+        """
+            Switch between flying and walking on the ground.
+        """
+
+        self.collider.walking = not self.collider.walking
+
+    def raycast(self,
+        origin: np.ndarray, direction: np.ndarray,
+        max_distance: float = np.inf) -> RayHit | None:
+        """
+            Find the first entity along a ray. Each entity type's
+            rays are brought into mesh space together and cast
+            through the mesh's BVH in one batch.
+
+            Parameters:
+
+                origin: where the ray starts.
+
+                direction: which way it goes.
+
+                max_distance: hits farther than this are ignored.
+
+            Returns:
+
+                The closest hit, or None.
+        """
+
+        origin = np.asarray(origin, dtype=np.float64)
+        direction = np.asarray(direction, dtype=np.float64)
+        direction = direction / np.linalg.norm(direction)
+
+        closest = None
+        for entity_type, archetype in self.archetypes.items():
+            mesh = self.meshes.get(entity_type)
+            if archetype.count == 0 or not hasattr(mesh, "get_bvh"):
+                continue
+
+            models = archetype.get_model_transforms().astype(np.float64)
+            rotations = models[:, :3, :3]
+            # world = local @ R + t with R orthonormal, so local = (world - t) @ R.T
+            origins = np.einsum("nj,nkj->nk", origin - models[:, 3, :3], rotations)
+            directions = np.einsum("j,nkj->nk", direction, rotations)
+
+            distances, triangles = mesh.get_bvh().intersect(
+                origins, directions, max_distance)
+            row = int(np.argmin(distances))
+            if triangles[row] < 0:
+                continue
+            max_distance = float(distances[row])
+            closest = (entity_type, archetype.entities[row], mesh, int(triangles[row]))
+
+        if closest is None:
+            return None
+
+        entity_type, entity, mesh, triangle = closest
+        submesh, material = None, None
+        if hasattr(mesh, "get_range"):
+            submesh, material = mesh.get_range(triangle)
+        return RayHit(
+            entity, entity_type, submesh, material,
+            origin + max_distance * direction, max_distance)
+
+    def set_player_motion(self, d_pos: np.ndarray) -> None:
+        """
+            Set how far the player moves each simulation step, in
+            the (forwards, right, up) vectors, at dt = 1.
+        """
+
+        self.player_motion[:] = d_pos
+
     def move_player(self, d_pos: list[float]) -> None:
         """
             move the player by the given amount in the 
-            (forwards, right, up) vectors.
+            (forwards, right, up) vectors, stopped and
+            slid along by the static geometry.
         """
 
-        self.player.move(d_pos)
+        collider = self.collider
+        displacement = self.player.get_displacement(d_pos, level = collider.walking)
+        self.player.position = collider.move(self.player.position, displacement)
     
     def spin_player(self, d_eulers: list[float]) -> None:
         """
@@ -0,0 +1,507 @@
+import queue
+import threading
+import time
+
+import numpy as np
+import pyrr
+
+from core.clock import FixedTimestep
+from core.constants import BILLBOARD_TYPES, FIXED_TIMESTEP, MAX_LIGHTS, WHITE
+from entities.archetype import FLAG_BATCHED, FLAG_MOVED
+from utils.frustum import extract_planes, spheres_in_frustum
+
+
+class RenderSnapshot:
+    """
+        Everything the renderer needs to draw one simulation step,
+        copied out of the scene into preallocated arrays. Once
+        published, a snapshot is only read until it is recycled.
+
+        A snapshot filled with both of its step's ends also keeps the
+        camera and the moving entities as they were at the previous
+        step and at this one, so the reader can place them anywhere
+        in between when it draws, with interpolate.
+    """
+    __slots__ = (
+        "step", "published", "view", "camera_position", "lights", "light_count",
+        "models", "model_counts", "visible", "visible_counts",
+        "sprites", "sprite_counts", "ends")
+
+
+    def __init__(self):
+        """
+            Allocate an empty snapshot.
+        """
+
+        self.step = -1
+        # perf_counter time the snapshot was published at
+        self.published = 0.0
+        self.view = np.identity(4, dtype=np.float32)
+        self.camera_position = np.zeros(3, dtype=np.float32)
+
+        # one row per light: x, y, z, _, r, g, b, strength,
+        # the same layout as the light uniform block
+        self.lights = np.zeros((MAX_LIGHTS, 8), dtype=np.float32)
+        self.light_count = 0
+
+        # entity type -> model matrices of its moving entities
+        self.models: dict[int, np.ndarray] = {}
+        self.model_counts: dict[int, int] = {}
+        # entity type -> indices into models of those the camera sees
+        self.visible: dict[int, np.ndarray] = {}
+        self.visible_counts: dict[int, int] = {}
+        # entity type -> billboard rows: x, y, z, r, g, b
+        self.sprites: dict[int, np.ndarray] = {}
+        self.sprite_counts: dict[int, int] = {}
+
+        # the previous step and this one: (view, camera position,
+        # entity type -> model matrices, entity type -> billboard rows)
+        self.ends = tuple(
+            (np.identity(4, dtype=np.float32), np.zeros(3, dtype=np.float32), {}, {})
+            for _ in range(2))
+
+    def _reserve(self,
+        buffers: dict[int, np.ndarray], entity_type: int,
+        count: int, shape: tuple, dtype = np.float32) -> np.ndarray:
+        """
+            Returns a buffer of at least count rows for the
+            entity type, growing it if needed.
+        """
+
+        buffer = buffers.get(entity_type)
+        if buffer is None or len(buffer) < count:
+            capacity = max(count, 2 * len(buffer) if buffer is not None else 1)
+            buffer = np.zeros((capacity, *shape), dtype=dtype)
+            buffers[entity_type] = buffer
+        return buffer
+
+    def reserve_models(self, entity_type: int, count: int) -> np.ndarray:
+
+        self._reserve(self.visible, entity_type, count, (), np.int32)
+        return self._reserve(self.models, entity_type, count, (4, 4))
+
+    def reserve_sprites(self, entity_type: int, count: int) -> np.ndarray:
+
+        return self._reserve(self.sprites, entity_type, count, (6,))
+
+    def reserve_end_models(self, end: int, entity_type: int, count: int) -> np.ndarray:
+
+        return self._reserve(self.ends[end][2], entity_type, count, (4, 4))
+
+    def reserve_end_sprites(self, end: int, entity_type: int, count: int) -> np.ndarray:
+
+        return self._reserve(self.ends[end][3], entity_type, count, (6,))
+
+    def interpolate(self, alpha: float) -> None:
+        """
+            Place the camera and the moving entities alpha of the way
+            from the previous step to this one. Only for snapshots
+            filled with both ends.
+
+            Matrices are blended element by element, which is exact
+            for positions; an entity turns too little in one step for
+            the blend to visibly skew it.
+        """
+
+        alpha = min(max(alpha, 0.0), 1.0)
+        view0, position0, models0, sprites0 = self.ends[0]
+        view1, position1, models1, sprites1 = self.ends[1]
+
+        self.view[:] = view0 + alpha * (view1 - view0)
+        self.camera_position[:] = position0 + alpha * (position1 - position0)
+
+        for entity_type, count in self.model_counts.items():
+            if not count:
+                continue
+            before = models0[entity_type][:count]
+            after = models1[entity_type][:count]
+            self.models[entity_type][:count] = before + alpha * (after - before)
+
+        for entity_type, count in self.sprite_counts.items():
+            if not count:
+                continue
+            before = sprites0[entity_type][:count]
+            after = sprites1[entity_type][:count]
+            sprites = self.sprites[entity_type]
+            sprites[:count, 0:3] = before[:, 0:3] + alpha * (after[:, 0:3] - before[:, 0:3])
+            sprites[:count, 3:6] = after[:, 3:6]
+
+    def get_models(self, entity_type: int, visible_only: bool) -> np.ndarray:
+        """
+            Returns the model matrices of an entity type, either all
+            of them or only those inside the camera's view.
+        """
+
+        models = self.models[entity_type]
+        if visible_only:
+            return models[self.visible[entity_type][:self.visible_counts[entity_type]]]
+        return models[:self.model_counts[entity_type]]
+
+class SnapshotBuilder:
+    """
+        Fills render snapshots from the scene: transforms,
+        lights and the camera's visible lists.
+
+        Batched entities which were moved are queued, with their new
+        model matrix, for the renderer to re-batch. Snapshots can be
+        skipped, so the queue is kept apart from them.
+    """
+    __slots__ = ("radii", "static_edits")
+
+
+    def __init__(self, radii: dict[int, float]):
+        """
+            Initialize the builder.
+
+            Parameters:
+
+                radii: bounding radius of each entity type's mesh,
+                    types without one are never culled.
+        """
+
+        self.radii = radii
+        # (entity type, entity, model matrix) of moved batched entities
+        self.static_edits = queue.SimpleQueue()
+
+    def fill(self,
+        snapshot: RenderSnapshot, camera, renderables: dict[int, list],
+        lights: list, projection: np.ndarray, alpha: float = 1.0,
+        both_ends: bool = False) -> None:
+        """
+            Copy the scene's state into a snapshot.
+
+            Parameters:
+
+                snapshot: the snapshot to overwrite.
+
+                camera: the scene's camera.
+
+                renderables: all the entities to draw. Lists with an
+                    archetype are read from its columns.
+
+                lights: all the lights in the scene.
+
+                projection: the renderer's projection, for culling.
+
+                alpha: how far between the last two simulation steps
+                    to place moving entities. Entities drawn as part
+                    of static batches are left out.
+
+                both_ends: also keep the previous step and the current
+                    one, for the snapshot's interpolate. Culling then
+                    keeps whatever is visible at either end.
+        """
+
+        view = camera.get_view_transform(alpha)
+        snapshot.view[:] = view
+        snapshot.camera_position[:] = camera.get_render_position(alpha)
+        if both_ends:
+            for end, end_alpha in enumerate((0.0, 1.0)):
+                snapshot.ends[end][0][:] = camera.get_view_transform(end_alpha)
+                snapshot.ends[end][1][:] = camera.get_render_position(end_alpha)
+
+        count = min(len(lights), MAX_LIGHTS)
+        snapshot.lights[:] = 0
+        archetype = getattr(lights, "archetype", None)
+        if archetype is not None:
+            snapshot.lights[:count, 0:3] = archetype.position[:count]
+            snapshot.lights[:count, 4:7] = archetype.color[:count]
+            snapshot.lights[:count, 7] = archetype.strength[:count]
+        else:
+            for i in range(count):
+                snapshot.lights[i, 0:3] = lights[i].position
+                snapshot.lights[i, 4:7] = lights[i].color
+                snapshot.lights[i, 7] = lights[i].strength
+        snapshot.light_count = count
+
+        # (alpha, end) of each copy to make, end None
+        # writing straight to what gets drawn
+        if both_ends:
+            copies = ((0.0, 0), (1.0, 1))
+            views = [
+                (extract_planes(pyrr.matrix44.multiply(end_view, projection)), models)
+                for end_view, _, models, _ in snapshot.ends]
+        else:
+            copies = ((alpha, None),)
+            views = [
+                (extract_planes(pyrr.matrix44.multiply(view, projection)), snapshot.models)]
+
+        for entity_type, entities in renderables.items():
+            # by type, so an emptied list still clears its count
+            if entity_type in BILLBOARD_TYPES:
+                for copy_alpha, end in copies:
+                    self._fill_sprites(snapshot, entity_type, entities, copy_alpha, end)
+            else:
+                self._queue_static_edits(entity_type, entities)
+                for copy_alpha, end in copies:
+                    self._fill_models(snapshot, entity_type, entities, copy_alpha, end)
+                self._cull(snapshot, entity_type, views)
+
+    def _queue_static_edits(self, entity_type: int, entities: list) -> None:
+        """
+            Queue the batched entities which were moved
+            and clear their flag.
+        """
+
+        archetype = getattr(entities, "archetype", None)
+        if archetype is not None:
+            flags = archetype.get_column("flags")
+            rows = np.flatnonzero(flags & FLAG_MOVED)
+            if len(rows) == 0:
+                return
+            flags[rows] &= ~np.uint8(FLAG_MOVED)
+            models = archetype.get_model_transforms(1.0, rows)
+            for row, model in zip(rows, models):
+                self.static_edits.put((entity_type, entities[row], model))
+        else:
+            for entity in entities:
+                flags = entity.archetype.flags
+                if flags[entity.row] & FLAG_MOVED:
+                    flags[entity.row] &= ~np.uint8(FLAG_MOVED)
+                    self.static_edits.put(
+                        (entity_type, entity, entity.get_model_transform()))
+
+    def _fill_sprites(self,
+        snapshot: RenderSnapshot, entity_type: int, entities: list,
+        alpha: float, end: int | None = None) -> None:
+        """
+            Copy billboards' positions and colors, into one of the
+            snapshot's ends if given, leaving room to draw them.
+        """
+
+        count = len(entities)
+        sprites = snapshot.reserve_sprites(entity_type, count)
+        if end is not None:
+            sprites = snapshot.reserve_end_sprites(end, entity_type, count)
+        archetype = getattr(entities, "archetype", None)
+        if archetype is not None:
+            sprites[:count, 0:3] = archetype.get_render_positions(alpha)
+            sprites[:count, 3:6] = archetype.color[:count]
+        else:
+            for i, entity in enumerate(entities):
+                sprites[i, 0:3] = entity.get_render_position(alpha)
+                sprites[i, 3:6] = getattr(entity, "color", WHITE)
+        snapshot.sprite_counts[entity_type] = count
+
+    def _fill_models(self,
+        snapshot: RenderSnapshot, entity_type: int, entities: list,
+        alpha: float, end: int | None = None) -> None:
+        """
+            Compute the model matrices of moving entities, into one
+            of the snapshot's ends if given, leaving room to draw them.
+        """
+
+        models = snapshot.reserve_models(entity_type, len(entities))
+        if end is not None:
+            models = snapshot.reserve_end_models(end, entity_type, len(entities))
+        archetype = getattr(entities, "archetype", None)
+        if archetype is not None:
+            flags = archetype.get_column("flags")
+            rows = None
+            if np.any(flags & FLAG_BATCHED):
+                rows = np.flatnonzero((flags & FLAG_BATCHED) == 0)
+            count = archetype.count if rows is None else len(rows)
+            if count:
+                models[:count] = archetype.get_model_transforms(alpha, rows)
+        else:
+            count = 0
+            for entity in entities:
+                if entity.is_batched:
+                    continue
+                models[count] = entity.get_model_transform(alpha)
+                count += 1
+        snapshot.model_counts[entity_type] = count
+
+    def _cull(self,
+        snapshot: RenderSnapshot, entity_type: int,
+        views: list[tuple[np.ndarray, dict[int, np.ndarray]]]) -> None:
+        """
+            List the moving entities the camera sees, in any of the
+            given (frustum planes, model matrices) pairs.
+        """
+
+        count = snapshot.model_counts[entity_type]
+        visible = snapshot.visible[entity_type]
+        if entity_type in self.radii and count:
+            radii = np.full(count, self.radii[entity_type])
+            mask = np.zeros(count, dtype=bool)
+            for planes, models in views:
+                # the translation sits in the bottom row
+                mask |= spheres_in_frustum(
+                    planes, models[entity_type][:count, 3, :3], radii)
+            indices = np.flatnonzero(mask)
+        else:
+            indices = np.arange(count)
+        visible[:len(indices)] = indices
+        snapshot.visible_counts[entity_type] = len(indices)
+
+class SimulationWorker:
+    """
+        Runs the scene's fixed steps on a worker thread, publishing
+        a render snapshot after each. The GL thread takes the latest
+        one; with three snapshots the worker always has one free to
+        write while another is published and a third is being drawn.
+
+        In deterministic mode there is no thread: steps only run
+        inside advance, on the caller's thread, so a given sequence
+        of inputs and frame times always gives the same snapshots.
+    """
+    __slots__ = (
+        "scene", "builder", "projection", "deterministic",
+        "snapshots", "latest", "reading", "lock", "commands",
+        "timestep", "step", "thread", "running")
+
+
+    def __init__(self,
+        scene, builder: SnapshotBuilder, projection: np.ndarray,
+        deterministic: bool = False):
+        """
+            Initialize the worker.
+
+            Parameters:
+
+                scene: the scene to simulate. Once started, only
+                    the worker may change it, through post.
+
+                builder: fills the snapshots.
+
+                projection: the renderer's projection, for culling.
+
+                deterministic: run steps on the caller's thread
+                    instead of a worker.
+        """
+
+        self.scene = scene
+        self.builder = builder
+        self.projection = projection
+        self.deterministic = deterministic
+
+        self.snapshots = [RenderSnapshot() for _ in range(3)]
+        self.latest: int | None = None
+        self.reading: int | None = None
+        self.lock = threading.Lock()
+        self.commands = queue.SimpleQueue()
+
+        self.timestep = FixedTimestep(FIXED_TIMESTEP)
+        self.step = 0
+        self.thread: threading.Thread | None = None
+        self.running = threading.Event()
+
+    def start(self) -> None:
+        """
+            Publish a first snapshot, then start stepping.
+        """
+
+        self._run_step(simulate = False)
+        if self.deterministic:
+            return
+
+        self.running.set()
+        self.thread = threading.Thread(
+            target = self._loop, name = "simulation", daemon = True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        """
+            Stop the worker thread, if any.
+        """
+
+        self.running.clear()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def post(self, command, *args) -> None:
+        """
+            Queue a change to the scene, applied at the
+            start of the next step.
+        """
+
+        self.commands.put((command, args))
+
+    def set_projection(self, projection: np.ndarray) -> None:
+
+        self.projection = projection
+
+    def advance(self, delta: float) -> int:
+        """
+            Deterministic mode: run as many steps as delta seconds
+            hold. Does nothing when running on a thread.
+
+            Returns:
+
+                The number of steps run.
+        """
+
+        if not self.deterministic:
+            return 0
+
+        steps = self.timestep.advance(delta)
+        for _ in range(steps):
+            self._run_step()
+        return steps
+
+    def acquire(self) -> RenderSnapshot | None:
+        """
+            Returns the newest snapshot, which stays untouched
+            until the next call, interpolated to the present: by
+            the time left over from advance in deterministic mode,
+            otherwise by the time since the worker published it.
+        """
+
+        with self.lock:
+            self.reading = self.latest
+        if self.reading is None:
+            return None
+        snapshot = self.snapshots[self.reading]
+        if self.deterministic:
+            alpha = self.timestep.alpha
+        else:
+            alpha = (time.perf_counter() - snapshot.published) / FIXED_TIMESTEP
+        snapshot.interpolate(alpha)
+        return snapshot
+
+    def _loop(self) -> None:
+        """
+            Step the scene in real time until stopped.
+        """
+
+        next_step = time.perf_counter()
+        while self.running.is_set():
+            next_step += FIXED_TIMESTEP
+            self._run_step()
+
+            remaining = next_step - time.perf_counter()
+            if remaining > 0:
+                time.sleep(remaining)
+            elif remaining < -self.timestep.max_steps * FIXED_TIMESTEP:
+                # too far behind to catch up, start over
+                next_step = time.perf_counter()
+
+    def _run_step(self, simulate: bool = True) -> None:
+        """
+            Apply queued commands, advance the scene by one
+            step and publish a snapshot of it.
+        """
+
+        while not self.commands.empty():
+            command, args = self.commands.get()
+            command(*args)
+
+        if simulate:
+            self.scene.update(1000.0 * FIXED_TIMESTEP / 16.67)
+            self.step += 1
+
+        with self.lock:
+            index = next(
+                i for i in range(len(self.snapshots))
+                if i != self.latest and i != self.reading)
+        snapshot = self.snapshots[index]
+        self.builder.fill(
+            snapshot, self.scene.player, self.scene.entities,
+            self.scene.lights, self.projection, both_ends = True)
+        snapshot.step = self.step
+        snapshot.published = time.perf_counter()
+
+        with self.lock:
+            self.latest = index
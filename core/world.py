@@ -0,0 +1,126 @@
+import json
+import os
+
+import numpy as np
+
+
+class CellDescription:
+    """
+        What one grid cell of the world holds: a mesh, already
+        in world space, and the entities standing in it.
+    """
+    __slots__ = ("key", "mesh", "entities", "lo", "hi", "estimate")
+
+
+    def __init__(self,
+        key: tuple[int, int], cell_size: float,
+        mesh: str | None = None, entities: list[dict] | None = None):
+        """
+            Initialize the description.
+
+            Parameters:
+
+                key: the cell's (column, row) on the grid.
+
+                cell_size: width of every cell, in world units.
+
+                mesh: path to the cell's obj file, if it has one.
+
+                entities: keyword arguments for Scene.spawn, each
+                    with the entity's "type" as named in ENTITY_TYPE.
+        """
+
+        self.key = key
+        self.mesh = mesh
+        self.entities = entities or []
+        # the cell's square on the ground
+        self.lo = np.array(key, dtype=np.float32) * cell_size
+        self.hi = self.lo + cell_size
+        # bytes the cell is expected to take once loaded, until it has been
+        self.estimate = 0
+        if mesh is not None and os.path.exists(mesh):
+            self.estimate = os.path.getsize(mesh)
+
+class WorldPartition:
+    """
+        Divides a world on the ground plane into square cells,
+        each loaded and unloaded as a whole.
+    """
+    __slots__ = ("cell_size", "cells")
+
+
+    def __init__(self, cell_size: float, cells: list[CellDescription]):
+        """
+            Initialize the partition.
+
+            Parameters:
+
+                cell_size: width of every cell, in world units.
+
+                cells: the cells which hold anything, empty
+                    cells can be left out.
+        """
+
+        self.cell_size = cell_size
+        self.cells: dict[tuple[int, int], CellDescription] = {
+            cell.key: cell for cell in cells}
+
+    @classmethod
+    def from_json(cls, filepath: str) -> "WorldPartition":
+        """
+            Load a partition from a JSON manifest, holding the
+            "cell_size" and a list of "cells", each with its grid
+            "cell", an optional "mesh" and optional "entities".
+            Paths are relative to the manifest.
+        """
+
+        with open(filepath, "r") as f:
+            manifest = json.load(f)
+
+        directory = os.path.dirname(filepath)
+        cell_size = float(manifest["cell_size"])
+        cells = []
+        for cell in manifest["cells"]:
+            mesh = cell.get("mesh")
+            if mesh is not None:
+                mesh = os.path.join(directory, mesh)
+            cells.append(CellDescription(
+                tuple(cell["cell"]), cell_size, mesh, cell.get("entities")))
+        return cls(cell_size, cells)
+
+    def get_cell_key(self, position: np.ndarray) -> tuple[int, int]:
+        """
+            Returns the cell a point is in.
+        """
+
+        return (
+            int(np.floor(position[0] / self.cell_size)),
+            int(np.floor(position[1] / self.cell_size)))
+
+    def get_distance(self, position: np.ndarray, key: tuple[int, int]) -> float:
+        """
+            Returns the distance on the ground from a point to
+            a cell, zero when the point is inside it.
+        """
+
+        lo = np.array(key, dtype=np.float32) * self.cell_size
+        gap = np.maximum(np.maximum(lo - position[0:2], 0.0),
+                         position[0:2] - (lo + self.cell_size))
+        return float(np.hypot(*gap))
+
+    def get_cells_near(self,
+        position: np.ndarray, radius: float) -> list[tuple[int, int]]:
+        """
+            Returns the cells within a distance of a point,
+            looking only at the grid squares that could be.
+        """
+
+        first = self.get_cell_key(position[0:2] - radius)
+        last = self.get_cell_key(position[0:2] + radius)
+        return [
+            (i, j)
+            for i in range(first[0], last[0] + 1)
+            for j in range(first[1], last[1] + 1)
+            if (i, j) in self.cells
+            and self.get_distance(position, (i, j)) <= radius
+        ]
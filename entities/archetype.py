@@ -0,0 +1,233 @@
+import numpy as np
+
+from core.constants import WHITE
+
+# bits of the flags column
+FLAG_STATIC = 1
+# set while the entity's geometry is part of a static batch
+FLAG_BATCHED = 2
+# set when a batched entity was moved, until its batch is rebuilt
+FLAG_MOVED = 4
+
+# every column, with the shape of one row and its type
+COLUMNS = {
+    "position": ((3,), np.float32),
+    "eulers": ((3,), np.float32),
+    "previous_position": ((3,), np.float32),
+    "previous_eulers": ((3,), np.float32),
+    "color": ((3,), np.float32),
+    "strength": ((), np.float32),
+    "flags": ((), np.uint8),
+}
+
+############################## helper functions ###############################
+
+def axis_rotations(axis: np.ndarray, theta: np.ndarray) -> np.ndarray:
+    """
+        Returns one 3x3 rotation per angle about a unit axis, laid
+        out as pyrr.matrix33.create_from_axis_rotation does.
+
+        Parameters:
+
+            axis: (3,) unit axis.
+
+            theta: (n,) angles in radians.
+    """
+
+    x, y, z = axis
+    s = np.sin(theta)
+    c = np.cos(theta)
+    t = 1.0 - c
+    return np.stack([
+        np.stack([x * x * t + c, y * x * t + z * s, z * x * t - y * s], axis = -1),
+        np.stack([x * y * t - z * s, y * y * t + c, z * y * t + x * s], axis = -1),
+        np.stack([x * z * t + y * s, y * z * t - x * s, z * z * t + c], axis = -1),
+    ], axis = -2)
+
+def create_model_transforms(positions: np.ndarray, eulers: np.ndarray) -> np.ndarray:
+    """
+        Returns the model matrices of many entities at once, equal
+        to Rx @ Ry @ Rz @ T for each, in pyrr's row vector layout.
+
+        Parameters:
+
+            positions: (n, 3) translations.
+
+            eulers: (n, 3) rotations about x, y and z, in degrees.
+    """
+
+    radians = np.radians(eulers)
+    rotation = axis_rotations(np.array([1.0, 0.0, 0.0]), radians[:, 0])
+    rotation = rotation @ axis_rotations(np.array([0.0, 1.0, 0.0]), radians[:, 1])
+    rotation = rotation @ axis_rotations(np.array([0.0, 0.0, 1.0]), radians[:, 2])
+
+    models = np.zeros((len(positions), 4, 4), dtype=np.float32)
+    models[:, :3, :3] = rotation
+    # the translation sits in the bottom row
+    models[:, 3, :3] = positions
+    models[:, 3, 3] = 1.0
+    return models
+
+class EntityList(list):
+    """
+        The entities of one archetype, one per row and in row order,
+        so code written for lists of entities keeps working while
+        systems and the renderer read the archetype's columns.
+    """
+    __slots__ = ("archetype",)
+
+
+    def __init__(self, archetype: "Archetype"):
+
+        super().__init__()
+        self.archetype = archetype
+
+class Archetype:
+    """
+        Stores the components of one kind of entity in packed columns,
+        one row per entity. Rows move when entities are removed, so
+        entities are referred to by handles, which never change.
+    """
+    __slots__ = ("count", "rows", "entities", "next_handle", *COLUMNS)
+
+
+    def __init__(self, capacity: int = 16):
+        """
+            Initialize an empty archetype.
+
+            Parameters:
+
+                capacity: rows allocated up front, doubled when full.
+        """
+
+        self.count = 0
+        # handle -> row
+        self.rows: dict[int, int] = {}
+        # row -> the entity facing it
+        self.entities = EntityList(self)
+        self.next_handle = 0
+        for name, (shape, dtype) in COLUMNS.items():
+            setattr(self, name, np.zeros((max(1, capacity), *shape), dtype=dtype))
+
+    def _grow(self) -> None:
+        """
+            Double every column's capacity. Views of the old
+            columns stop tracking the entities.
+        """
+
+        for name in COLUMNS:
+            column = getattr(self, name)
+            grown = np.zeros((2 * len(column), *column.shape[1:]), dtype=column.dtype)
+            grown[:self.count] = column[:self.count]
+            setattr(self, name, grown)
+
+    def add(self,
+        entity, position, eulers, color = WHITE,
+        strength: float = 0.0, flags: int = 0) -> int:
+        """
+            Add a row.
+
+            Parameters:
+
+                entity: the object standing for the row.
+
+                position, eulers, color, strength, flags: its components.
+
+            Returns:
+
+                The new row's handle.
+        """
+
+        if self.count == len(self.position):
+            self._grow()
+
+        row = self.count
+        self.position[row] = position
+        self.eulers[row] = eulers
+        self.previous_position[row] = position
+        self.previous_eulers[row] = eulers
+        self.color[row] = color
+        self.strength[row] = strength
+        self.flags[row] = flags
+        self.count += 1
+
+        handle = self.next_handle
+        self.next_handle += 1
+        self.rows[handle] = row
+        self.entities.append(entity)
+        return handle
+
+    def remove(self, entity) -> None:
+        """
+            Remove an entity's row, moving the last row into its place.
+        """
+
+        row = self.rows.pop(entity.handle)
+        last = self.count - 1
+        if row != last:
+            for name in COLUMNS:
+                column = getattr(self, name)
+                column[row] = column[last]
+            moved = self.entities[last]
+            self.entities[row] = moved
+            self.rows[moved.handle] = row
+        self.entities.pop()
+        self.count -= 1
+
+    def get_column(self, name: str) -> np.ndarray:
+        """
+            Returns the used part of a column, as a view.
+        """
+
+        return getattr(self, name)[:self.count]
+
+    def save_state(self) -> None:
+        """
+            Remember every row's current state, call at
+            the start of each simulation step.
+        """
+
+        self.previous_position[:self.count] = self.position[:self.count]
+        self.previous_eulers[:self.count] = self.eulers[:self.count]
+
+    def get_render_positions(self, alpha: float = 1.0, rows = None) -> np.ndarray:
+        """
+            Returns positions blended between the previous simulation
+            step (alpha 0) and the current one (alpha 1).
+
+            Parameters:
+
+                alpha: how far between the two steps.
+
+                rows: which rows, all of them by default.
+        """
+
+        rows = slice(0, self.count) if rows is None else rows
+        position = self.position[rows]
+        if alpha >= 1.0:
+            return position
+        previous = self.previous_position[rows]
+        return previous + alpha * (position - previous)
+
+    def get_render_eulers(self, alpha: float = 1.0, rows = None) -> np.ndarray:
+        """
+            Returns rotations blended between the previous simulation
+            step and the current one, the short way round.
+        """
+
+        rows = slice(0, self.count) if rows is None else rows
+        eulers = self.eulers[rows]
+        if alpha >= 1.0:
+            return eulers
+        previous = self.previous_eulers[rows]
+        delta = (eulers - previous + 180) % 360 - 180
+        return previous + alpha * delta
+
+    def get_model_transforms(self, alpha: float = 1.0, rows = None) -> np.ndarray:
+        """
+            Returns the (n, 4, 4) model matrices of the given rows,
+            or of every row.
+        """
+
+        return create_model_transforms(
+            self.get_render_positions(alpha, rows), self.get_render_eulers(alpha, rows))
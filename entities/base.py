@@ -1,15 +1,22 @@
 import numpy as np
-import pyrr
 from core.constants import *
+from entities.archetype import Archetype, FLAG_BATCHED, FLAG_MOVED, FLAG_STATIC
 
 class Entity:
     """
         A basic object in the world, with a position and rotation.
+
+        The entity's components live in a row of an Archetype,
+        shared with the other entities of its kind; the entity
+        is a handle to that row, and its attributes are views
+        into the archetype's columns.
     """
-    __slots__ = ("position", "eulers")
+    __slots__ = ("archetype", "handle")
 
 
-    def __init__(self, position: list[float], eulers: list[float]):
+    def __init__(self,
+        position: list[float], eulers: list[float], static: bool = False,
+        archetype: Archetype | None = None):
         """
             Initialize the entity.
 
@@ -19,10 +26,89 @@ class Entity:
 
                 eulers: the rotation of the entity
                         about each axis.
+
+                static: whether the entity never moves, static
+                        entities are merged into batched geometry.
+
+                archetype: where the entity's components are stored,
+                        by default an archetype of its own.
+        """
+
+        self.archetype = archetype if archetype is not None else Archetype(1)
+        self.handle = self.archetype.add(
+            self, position, eulers, flags = FLAG_STATIC if static else 0)
+
+    @property
+    def row(self) -> int:
+        """
+            The entity's current row in its archetype.
+        """
+
+        return self.archetype.rows[self.handle]
+
+    @property
+    def position(self) -> np.ndarray:
+
+        return self.archetype.position[self.row]
+
+    @position.setter
+    def position(self, value) -> None:
+
+        self.archetype.position[self.row] = value
+        self._mark_moved()
+
+    @property
+    def eulers(self) -> np.ndarray:
+
+        return self.archetype.eulers[self.row]
+
+    @eulers.setter
+    def eulers(self, value) -> None:
+
+        self.archetype.eulers[self.row] = value
+        self._mark_moved()
+
+    def _mark_moved(self) -> None:
+        """
+            Flag a batched entity for re-batching, its batch still
+            holds it where it was. Only assigning to position or
+            eulers does this, editing them in place doesn't.
+        """
+
+        row = self.row
+        if self.archetype.flags[row] & FLAG_BATCHED:
+            self.archetype.flags[row] |= FLAG_MOVED
+
+    @property
+    def previous_position(self) -> np.ndarray:
+
+        return self.archetype.previous_position[self.row]
+
+    @property
+    def previous_eulers(self) -> np.ndarray:
+
+        return self.archetype.previous_eulers[self.row]
+
+    @property
+    def is_static(self) -> bool:
+
+        return bool(self.archetype.flags[self.row] & FLAG_STATIC)
+
+    @property
+    def is_batched(self) -> bool:
+        """
+            Whether the entity is drawn as part of a static batch.
         """
 
-        self.position = np.array(position, dtype=np.float32)
-        self.eulers = np.array(eulers, dtype=np.float32)
+        return bool(self.archetype.flags[self.row] & FLAG_BATCHED)
+
+    @is_batched.setter
+    def is_batched(self, value: bool) -> None:
+
+        if value:
+            self.archetype.flags[self.row] |= FLAG_BATCHED
+        else:
+            self.archetype.flags[self.row] &= ~np.uint8(FLAG_BATCHED)
 
     def update(self, dt: float, camera_pos: np.ndarray) -> None:
         """
@@ -38,44 +124,48 @@ class Entity:
 
         pass
 
-    def get_model_transform(self) -> np.ndarray:
+    def save_state(self) -> None:
+        """
+            Remember the current state, call at the start
+            of each simulation step.
+        """
+
+        row = self.row
+        self.archetype.previous_position[row] = self.archetype.position[row]
+        self.archetype.previous_eulers[row] = self.archetype.eulers[row]
+
+    def get_render_position(self, alpha: float = 1.0) -> np.ndarray:
+        """
+            Returns the position blended between the previous
+            simulation step (alpha 0) and the current one (alpha 1).
+        """
+
+        return self.archetype.get_render_positions(alpha, self.row)
+
+    def get_render_eulers(self, alpha: float = 1.0) -> np.ndarray:
+        """
+            Returns the rotation blended between the previous
+            simulation step and the current one, the short way round.
+        """
+
+        return self.archetype.get_render_eulers(alpha, self.row)
+
+    def get_model_transform(self, alpha: float = 1.0) -> np.ndarray:
         """
             Returns the entity's model to world
             transformation matrix.
+
+            Parameters:
+
+                alpha: how far between the previous simulation
+                    step and the current one to place the entity.
+        """
+
+        return self.archetype.get_model_transforms(alpha, [self.row])[0]
+
+    def destroy(self) -> None:
+        """
+            Remove the entity from its archetype.
         """
 
-        model_transform = pyrr.matrix44.create_identity(dtype=np.float32)
-
-        model_transform = pyrr.matrix44.multiply(
-            m1=model_transform, 
-            m2=pyrr.matrix44.create_from_axis_rotation(
-                axis = GLOBAL_X,
-                theta = np.radians(self.eulers[0]), 
-                dtype = np.float32
-            )
-        )
-
-        model_transform = pyrr.matrix44.multiply(
-            m1=model_transform, 
-            m2=pyrr.matrix44.create_from_axis_rotation(
-                axis = GLOBAL_Y,
-                theta = np.radians(self.eulers[1]), 
-                dtype = np.float32
-            )
-        )
-
-        model_transform = pyrr.matrix44.multiply(
-            m1=model_transform, 
-            m2=pyrr.matrix44.create_from_axis_rotation(
-                axis = GLOBAL_Z,
-                theta = np.radians(self.eulers[2]), 
-                dtype = np.float32
-            )
-        )
-
-        return pyrr.matrix44.multiply(
-            m1=model_transform, 
-            m2=pyrr.matrix44.create_from_translation(
-                vec=np.array(self.position),dtype=np.float32
-            )
-        )
\ No newline at end of file
+        self.archetype.remove(self)
@@ -1,6 +1,6 @@
+from entities.archetype import Archetype
 from entities.base import Entity
 import numpy as np
-import pyrr
 
 class Billboard(Entity):
     """
@@ -9,20 +9,23 @@ class Billboard(Entity):
     __slots__ = tuple()
 
 
-    def __init__(self, position: list[float]):
+    def __init__(self, position: list[float], archetype: Archetype | None = None):
         """
             Initialize the billboard.
 
             Parameters:
 
                 position: the position of the entity.
+
+                archetype: where the billboard's components are stored.
         """
 
-        super().__init__(position, eulers=[0,0,0])
+        super().__init__(position, eulers=[0,0,0], archetype=archetype)
     
     def update(self, dt: float, camera_pos: np.ndarray) -> None:
         """
-            Update the billboard.
+            Update the billboard. Billboards are turned towards
+            the camera by the vertex shader, so there's nothing to do.
 
             Parameters:
 
@@ -31,7 +34,4 @@ class Billboard(Entity):
                 camera_pos: the position of the camera in the scene
         """
 
-        self_to_camera = camera_pos - self.position
-        self.eulers[2] = -np.degrees(np.arctan2(-self_to_camera[1], self_to_camera[0]))
-        dist2d = pyrr.vector.length(self_to_camera)
-        self.eulers[1] = -np.degrees(np.arctan2(self_to_camera[2], dist2d))
+        pass
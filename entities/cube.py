@@ -1,3 +1,4 @@
+from entities.archetype import Archetype
 from entities.base import Entity
 import numpy as np
 
@@ -8,7 +9,9 @@ class Cube(Entity):
     __slots__ = tuple()
 
 
-    def __init__(self, position: list[float], eulers: list[float]):
+    def __init__(self, 
+        position: list[float], eulers: list[float], static: bool = False,
+        archetype: Archetype | None = None):
         """
             Initialize the cube.
 
@@ -18,13 +21,18 @@ class Cube(Entity):
 
                 eulers: the rotation of the entity
                         about each axis.
+
+                static: whether the entity never moves.
+
+                archetype: where the cube's components are stored.
         """
 
-        super().__init__(position, eulers)
+        super().__init__(position, eulers, static, archetype)
     
     def update(self, dt: float, camera_pos: np.ndarray) -> None:
         """
-            Update the cube.
+            Update the cube. A scene turns its cubes with
+            entities.systems.spin instead, all in one go.
 
             Parameters:
 
@@ -1,3 +1,4 @@
+from entities.archetype import Archetype
 from entities.billboard import Billboard
 import numpy as np
 
@@ -5,12 +6,13 @@ class PointLight(Billboard):
     """
         A simple pointlight.
     """
-    __slots__ = ("color", "strength")
+    __slots__ = tuple()
 
 
     def __init__(
         self, position: list[float], 
-        color: list[float], strength: float):
+        color: list[float], strength: float,
+        archetype: Archetype | None = None):
         """
             Initialize the light.
 
@@ -21,9 +23,31 @@ class PointLight(Billboard):
                 color: (r,g,b) color of the light.
 
                 strength: strength of the light.
+
+                archetype: where the light's components are stored.
         """
 
-        super().__init__(position)
-        self.color = np.array(color, dtype=np.float32)
+        super().__init__(position, archetype)
+        self.color = color
         self.strength = strength
+
+    @property
+    def color(self) -> np.ndarray:
+
+        return self.archetype.color[self.row]
+
+    @color.setter
+    def color(self, value) -> None:
+
+        self.archetype.color[self.row] = value
+
+    @property
+    def strength(self) -> float:
+
+        return float(self.archetype.strength[self.row])
+
+    @strength.setter
+    def strength(self, value: float) -> None:
+
+        self.archetype.strength[self.row] = value
         
\ No newline at end of file
@@ -0,0 +1,33 @@
+import numpy as np
+
+from entities.archetype import Archetype, FLAG_STATIC
+
+############################## helper functions ###############################
+
+def get_moving_rows(archetype: Archetype) -> np.ndarray:
+    """
+        Returns the rows of an archetype's non static entities.
+    """
+
+    return np.flatnonzero((archetype.get_column("flags") & FLAG_STATIC) == 0)
+
+def spin(archetype: Archetype, dt: float, rate: float = 0.25) -> None:
+    """
+        Turn every moving entity about its z axis, as Cube.update
+        does for one cube.
+
+        Parameters:
+
+            archetype: the entities to turn.
+
+            dt: framerate correction factor.
+
+            rate: degrees per unit of dt.
+    """
+
+    rows = get_moving_rows(archetype)
+    if len(rows) == 0:
+        return
+
+    angles = archetype.eulers[rows, 2] + rate * dt
+    archetype.eulers[rows, 2] = np.where(angles > 360, angles - 360, angles)
@@ -0,0 +1,138 @@
+from OpenGL.GL import *
+import numpy as np
+
+from utils.gpu_memory import GPU_MEMORY
+
+
+class BillboardBatch:
+    """
+        Camera facing sprites drawn with one instanced call.
+        Each instance is a position, a color and a size; the vertex
+        shader turns the quad towards the camera.
+    """
+    __slots__ = ("vao", "quad_vbo", "instance_vbo", "instances", "count")
+
+
+    def __init__(self, capacity: int = 16):
+        """
+            Initialize the batch.
+
+            Parameters:
+
+                capacity: number of instances to allocate room for,
+                    the batch grows as needed.
+        """
+
+        # one row per instance: x, y, z, r, g, b, width, height
+        self.instances = np.zeros((capacity, 8), dtype=np.float32)
+        self.count = 0
+
+        self.vao = glGenVertexArrays(1)
+        glBindVertexArray(self.vao)
+
+        # a unit quad in the y-z plane, laid out like RectMesh
+        # x, y, z, s, t, nx, ny, nz
+        quad = np.array((
+            0, -0.5,  0.5, 0, 0, 1, 0, 0,
+            0, -0.5, -0.5, 0, 1, 1, 0, 0,
+            0,  0.5, -0.5, 1, 1, 1, 0, 0,
+
+            0, -0.5,  0.5, 0, 0, 1, 0, 0,
+            0,  0.5, -0.5, 1, 1, 1, 0, 0,
+            0,  0.5,  0.5, 1, 0, 1, 0, 0
+        ), dtype=np.float32)
+        self.quad_vbo = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, self.quad_vbo)
+        glBufferData(GL_ARRAY_BUFFER, quad.nbytes, quad, GL_STATIC_DRAW)
+        GPU_MEMORY.track_buffer(self.quad_vbo, quad.nbytes, "vertices", "billboards")
+        #position
+        glEnableVertexAttribArray(0)
+        glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 32, ctypes.c_void_p(0))
+        #texture
+        glEnableVertexAttribArray(1)
+        glVertexAttribPointer(1, 2, GL_FLOAT, GL_FALSE, 32, ctypes.c_void_p(12))
+
+        self.instance_vbo = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, self.instance_vbo)
+        glBufferData(GL_ARRAY_BUFFER, self.instances.nbytes, None, GL_STREAM_DRAW)
+        GPU_MEMORY.track_buffer(
+            self.instance_vbo, self.instances.nbytes, "instances", "billboards")
+        #instance position
+        glEnableVertexAttribArray(3)
+        glVertexAttribPointer(3, 3, GL_FLOAT, GL_FALSE, 32, ctypes.c_void_p(0))
+        glVertexAttribDivisor(3, 1)
+        #instance color
+        glEnableVertexAttribArray(4)
+        glVertexAttribPointer(4, 3, GL_FLOAT, GL_FALSE, 32, ctypes.c_void_p(12))
+        glVertexAttribDivisor(4, 1)
+        #instance size
+        glEnableVertexAttribArray(5)
+        glVertexAttribPointer(5, 2, GL_FLOAT, GL_FALSE, 32, ctypes.c_void_p(24))
+        glVertexAttribDivisor(5, 1)
+
+        glBindVertexArray(0)
+
+    def _reserve(self, count: int) -> None:
+        """
+            Make room for at least the given number of instances.
+        """
+
+        if count <= len(self.instances):
+            return
+
+        capacity = len(self.instances)
+        while capacity < count:
+            capacity *= 2
+        self.instances = np.zeros((capacity, 8), dtype=np.float32)
+
+        glBindBuffer(GL_ARRAY_BUFFER, self.instance_vbo)
+        glBufferData(GL_ARRAY_BUFFER, self.instances.nbytes, None, GL_STREAM_DRAW)
+        GPU_MEMORY.track_buffer(
+            self.instance_vbo, self.instances.nbytes, "instances", "billboards")
+
+    def set_instances(self,
+        positions: np.ndarray, colors: np.ndarray, size: tuple[float, float]) -> None:
+        """
+            Replace the batch's contents and upload them.
+
+            Parameters:
+
+                positions: (n, 3) sprite centres.
+
+                colors: (n, 3) sprite tints.
+
+                size: (width, height) shared by every sprite.
+        """
+
+        count = len(positions)
+        self._reserve(count)
+        self.count = count
+        if count == 0:
+            return
+
+        self.instances[:count, 0:3] = positions
+        self.instances[:count, 3:6] = colors
+        self.instances[:count, 6:8] = size
+
+        glBindBuffer(GL_ARRAY_BUFFER, self.instance_vbo)
+        glBufferSubData(GL_ARRAY_BUFFER, 0, count * 32, self.instances[:count])
+
+    def draw(self) -> None:
+        """
+            Draw every instance.
+        """
+
+        if self.count == 0:
+            return
+
+        glBindVertexArray(self.vao)
+        glDrawArraysInstanced(GL_TRIANGLES, 0, 6, self.count)
+
+    def destroy(self) -> None:
+        """
+            Free any allocated memory.
+        """
+
+        glDeleteVertexArrays(1, (self.vao,))
+        glDeleteBuffers(2, (self.quad_vbo, self.instance_vbo))
+        GPU_MEMORY.release("buffer", self.quad_vbo, self.instance_vbo)
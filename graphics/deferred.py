@@ -0,0 +1,145 @@
+from OpenGL.GL import *
+import numpy as np
+
+from utils.gpu_memory import GPU_MEMORY
+
+
+class GBuffer:
+    """
+        The geometry buffer used by the deferred path:
+        albedo, world space normal and depth.
+    """
+    __slots__ = ("fbo", "albedo", "normal", "depth", "width", "height")
+
+
+    def __init__(self, width: int, height: int):
+        """
+            Allocate the render targets.
+
+            Parameters:
+
+                width: width of the targets in pixels.
+
+                height: height of the targets in pixels.
+        """
+
+        self.fbo = None
+        self._allocate(width, height)
+
+    def _allocate(self, width: int, height: int) -> None:
+        """
+            Create the framebuffer and its attachments.
+        """
+
+        self.width = max(1, width)
+        self.height = max(1, height)
+
+        self.fbo = glGenFramebuffers(1)
+        glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+
+        self.albedo = self._make_target(
+            GL_RGBA8, GL_RGBA, GL_UNSIGNED_BYTE)
+        glFramebufferTexture2D(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0,
+                            GL_TEXTURE_2D, self.albedo, 0)
+
+        self.normal = self._make_target(
+            GL_RGB16F, GL_RGB, GL_FLOAT)
+        glFramebufferTexture2D(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT1,
+                            GL_TEXTURE_2D, self.normal, 0)
+
+        # same format as the usual default framebuffer, so depth can be blitted
+        self.depth = self._make_target(
+            GL_DEPTH24_STENCIL8, GL_DEPTH_STENCIL, GL_UNSIGNED_INT_24_8)
+        glFramebufferTexture2D(GL_FRAMEBUFFER, GL_DEPTH_STENCIL_ATTACHMENT,
+                            GL_TEXTURE_2D, self.depth, 0)
+
+        glDrawBuffers(2, [GL_COLOR_ATTACHMENT0, GL_COLOR_ATTACHMENT1])
+
+        status = glCheckFramebufferStatus(GL_FRAMEBUFFER)
+        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+        if status != GL_FRAMEBUFFER_COMPLETE:
+            raise RuntimeError(f"G-buffer is incomplete: {status}")
+
+    def _make_target(self,
+        internal_format: int, pixel_format: int, pixel_type: int) -> int:
+        """
+            Returns a screen sized texture which is sampled 1:1.
+        """
+
+        texture = glGenTextures(1)
+        glBindTexture(GL_TEXTURE_2D, texture)
+        glTexImage2D(GL_TEXTURE_2D, 0, internal_format,
+                    self.width, self.height, 0,
+                    pixel_format, pixel_type, None)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_EDGE)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP_TO_EDGE)
+        GPU_MEMORY.track_texture(texture, self.width, self.height, internal_format, "G-buffer")
+        return texture
+
+    def resize(self, width: int, height: int) -> None:
+        """
+            Reallocate the targets for a new screen size.
+        """
+
+        self.destroy()
+        self._allocate(width, height)
+
+    def bind(self) -> None:
+        """
+            Draw into the G-buffer.
+        """
+
+        glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+        glViewport(0, 0, self.width, self.height)
+
+    def bind_textures(self, first_unit: int) -> None:
+        """
+            Bind albedo, normal and depth to consecutive texture units.
+        """
+
+        for i, texture in enumerate((self.albedo, self.normal, self.depth)):
+            glActiveTexture(GL_TEXTURE0 + first_unit + i)
+            glBindTexture(GL_TEXTURE_2D, texture)
+
+    def blit_depth(self, target_fbo: int) -> None:
+        """
+            Copy the G-buffer's depth into another framebuffer,
+            so forward passes can depth test against the scene.
+        """
+
+        glBindFramebuffer(GL_READ_FRAMEBUFFER, self.fbo)
+        glBindFramebuffer(GL_DRAW_FRAMEBUFFER, target_fbo)
+        glBlitFramebuffer(
+            0, 0, self.width, self.height,
+            0, 0, self.width, self.height,
+            GL_DEPTH_BUFFER_BIT, GL_NEAREST)
+        glBindFramebuffer(GL_FRAMEBUFFER, target_fbo)
+
+    def destroy(self) -> None:
+        """
+            Free the framebuffer and its attachments.
+        """
+
+        glDeleteFramebuffers(1, [self.fbo])
+        glDeleteTextures(3, [self.albedo, self.normal, self.depth])
+        GPU_MEMORY.release("texture", self.albedo, self.normal, self.depth)
+
+
+def get_light_radius(color: np.ndarray, strength: float, cutoff: float) -> float:
+    """
+        Returns the distance beyond which a point light's
+        contribution falls below the given cutoff.
+
+        Parameters:
+
+            color: (r,g,b) color of the light.
+
+            strength: strength of the light.
+
+            cutoff: smallest contribution worth shading.
+    """
+
+    intensity = float(strength) * float(np.max(color))
+    return float(np.sqrt(max(intensity, 0.0) / cutoff))
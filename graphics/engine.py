@@ -1,61 +1,134 @@
+import logging
+
 from OpenGL.GL import *
 import numpy as np
 import pyrr
 
 from core.constants import *
-from graphics.shader import Shader
+from graphics.shader import Shader, ShaderVariants, ShaderBinder
 from graphics.mesh import *
 from graphics.material import Material
 from graphics.skybox import Skybox
+from graphics.uniform_buffer import FrameBlock, LightBlock
+from graphics.deferred import GBuffer, get_light_radius
+from graphics.timing import PassTimer
+from graphics.prepass import DepthPrepass
+from graphics.resolution import DynamicResolution
+from graphics.framebuffer import Framebuffer
+from graphics.billboards import BillboardBatch
+from graphics.static_batch import IDENTITY, StaticBatcher
+from graphics.hot_reload import AssetReloader
+from utils.frustum import aabb_in_frustum, extract_planes
 from core.scene import Camera
+from core.snapshot import RenderSnapshot, SnapshotBuilder
 from entities.pointlight import PointLight
 from entities.base import Entity
+from entities.billboard import Billboard
 from utils.colors import *
+from utils.gpu_memory import GPU_MEMORY
+from utils.trace import TRACER
+
+log = logging.getLogger(__name__)
+
+# texture unit of each sampler, by pipeline family
+LIT_SAMPLERS = {"imageTexture": 0, "shadowMap": 1}
+DEFERRED_SAMPLERS = {"gAlbedo": 0, "gNormal": 1, "gDepth": 2, "shadowMap": 3}
+
+UNIFORM_NAMES = {
+    UNIFORM_TYPE["MODEL"]: "model",
+    UNIFORM_TYPE["LIGHT_VOLUME"]: "lightVolume",
+    UNIFORM_TYPE["LIGHT_INDEX"]: "lightIndex",
+    UNIFORM_TYPE["INVERSE_VIEW_PROJECTION"]: "inverseViewProjection",
+    UNIFORM_TYPE["SCREEN_SIZE"]: "screenSize",
+}
 
 class GraphicsEngine:
     """
         Draws entities and stuff.
     """
-    __slots__ = ("meshes", "materials", "shaders", "skybox_mesh", "skybox_shader", "skybox", "shadow_fbo", "shadow_depth_texture", "shadow_width", "shadow_height", "shadows_enabled", "window_width", "window_height")
+    __slots__ = ("meshes", "materials", "shaders", "skybox_mesh", "skybox_shader", "skybox", "shadow_fbo", "shadow_depth_texture", "shadow_width", "shadow_height", "shadows_enabled", "window_width", "window_height", "frame_block", "light_block", "projection", "render_path", "gbuffer", "light_volume_mesh", "screen_mesh", "timer", "target_framebuffer", "billboards", "light_sprites", "static_batches", "snapshot_builder", "snapshot", "reloader", "world_cells", "prepass", "resolution", "scaled_target", "render_width", "render_height", "scene", "send")
 
-    def __init__(self):
+    def __init__(self, watch_files: bool = False, dynamic_resolution: bool = False):
         """
             Initializes the rendering system.
+
+            Parameters:
+                watch_files: rebuild shaders, meshes and textures
+                    when their files change on disk
+                dynamic_resolution: draw the scene at a lower
+                    resolution when frames take too long
         """
 
         self.window_width = SCREEN_WIDTH
         self.window_height = SCREEN_HEIGHT
+        self.render_width = SCREEN_WIDTH
+        self.render_height = SCREEN_HEIGHT
+
+        self.shadows_enabled = True
+        self.render_path = RENDER_PATH["FORWARD"]
+        self.timer = PassTimer()
+        self.prepass = DepthPrepass()
+        self.resolution = DynamicResolution(dynamic_resolution)
+        self.target_framebuffer = 0
+        # what the scene is drawn into when it's drawn scaled down
+        self.scaled_target: Framebuffer | None = None
+        # the scene colliding with and picking against the meshes,
+        # and how to apply changes to it, see attach_scene
+        self.scene = None
+        self.send = None
+
+        with TRACER.span("opengl state"):
+            self._set_up_opengl()
+
+        with TRACER.span("assets"):
+            self._create_assets()
 
-        self._set_up_opengl()
+        ## set up skybox
+        with TRACER.span("skybox"):
+            self.skybox_mesh = SkyboxMesh()
+            self.skybox_shader = Shader("shaders/skybox_vertex.txt", "shaders/skybox_fragment.txt")
+            self.skybox = Skybox([
+                "gfx/texture.png",
+                "gfx/texture.png",
+                "gfx/texture.png",
+                "gfx/texture.png",
+                "gfx/texture.png",
+                "gfx/texture.png"
+            ])
 
-        self._create_assets()
+        with TRACER.span("uniform blocks"):
+            self._create_uniform_blocks()
 
-        self._set_onetime_uniforms()
+            self._set_up_skybox_shader()
 
-        self._get_uniform_locations()
+        with TRACER.span("shader variants"):
+            self._build_shader_variants()
 
-        self._create_shadow_map()
+        with TRACER.span("render targets"):
+            self._create_shadow_map()
 
-        self.shadows_enabled = True
+            self._create_deferred_targets()
 
-        ## set up skybox
-        self.skybox_mesh = SkyboxMesh()
-        self.skybox_shader = Shader("shaders/skybox_vertex.txt", "shaders/skybox_fragment.txt")
-        self.skybox = Skybox([
-            "gfx/texture.png",
-            "gfx/texture.png",
-            "gfx/texture.png",
-            "gfx/texture.png",
-            "gfx/texture.png",
-            "gfx/texture.png"
-        ])
+            self._apply_render_scale()
+
+        self.billboards: dict[int, BillboardBatch] = {}
+        self.light_sprites = BillboardBatch()
+
+        self.static_batches = StaticBatcher()
+        # streamed world cell -> (mesh, bounds minimum, bounds maximum)
+        self.world_cells: dict[tuple[int, int], tuple] = {}
+
+        self.snapshot_builder = SnapshotBuilder(self._get_bounding_radii())
+        self.snapshot = RenderSnapshot()
+
+        with TRACER.span("file watcher"):
+            self.reloader = AssetReloader(self, watch_files)
     
     def _set_up_opengl(self) -> None:
         """
             Configure any desired OpenGL options
         """
         r,g,b = hex_to_rgb("#028058")
-        print(r,g,b)
         glClearColor(r, g, b, 1)
         glEnable(GL_DEPTH_TEST)
         glEnable(GL_BLEND)
@@ -71,83 +144,150 @@ class GraphicsEngine:
         # monkey_model = ObjMesh("models/monkeyTextured.obj")
         
 
-        self.meshes: dict[int, Mesh] = {
-            # ENTITY_TYPE["CUBE"]: monkey_model,
-            ENTITY_TYPE["MEDKIT"]: RectMesh(w = 0.6, h = 0.5),
-            ENTITY_TYPE["POINTLIGHT"]: RectMesh(w = 0.2, h = 0.1),
-        }
-        self.meshes[ENTITY_TYPE["CUBE"]] = MultiMaterialMesh("models/assembler.obj")
-
-        self.materials: dict[int, Material] = {
-            # ENTITY_TYPE["CUBE"]: Material(monkey_model.texture_path),
-            ENTITY_TYPE["MEDKIT"]: Material("gfx/medkit.png"),
-            ENTITY_TYPE["POINTLIGHT"]: Material("gfx/Light-bulb.png"),
-        }
+        with TRACER.span("meshes"):
+            self.meshes: dict[int, Mesh] = {
+                # ENTITY_TYPE["CUBE"]: monkey_model,
+                ENTITY_TYPE["MEDKIT"]: RectMesh(w = 0.6, h = 0.5),
+                ENTITY_TYPE["POINTLIGHT"]: RectMesh(w = 0.2, h = 0.1),
+            }
+            self.meshes[ENTITY_TYPE["CUBE"]] = MultiMaterialMesh("models/assembler.obj")
+
+        with TRACER.span("materials"):
+            self.materials: dict[int, Material] = {
+                # ENTITY_TYPE["CUBE"]: Material(monkey_model.texture_path),
+                ENTITY_TYPE["MEDKIT"]: Material("gfx/medkit.png"),
+                ENTITY_TYPE["POINTLIGHT"]: Material("gfx/Light-bulb.png"),
+            }
         
-        self.shaders: dict[int, Shader] = {
-            PIPELINE_TYPE["STANDARD"]: Shader(
-                "shaders/vertex.txt", "shaders/fragment.txt"),
-            PIPELINE_TYPE["EMISSIVE"]: Shader(
-                "shaders/vertex_light.txt", "shaders/fragment_light.txt"),
-            PIPELINE_TYPE["SHADOW"]: Shader(
-                "shaders/shadow_vertex.txt", "shaders/shadow_fragment.txt")
+        self._create_shaders()
+
+    def _create_shaders(self) -> None:
+        """
+            Describe every pipeline's shader variants. Variants are
+            built when first drawn with, or ahead of time by
+            _build_shader_variants.
+        """
+
+        lit = lambda shader: self._prepare_shader(shader, LIT_SAMPLERS)
+        deferred = lambda shader: self._prepare_shader(shader, DEFERRED_SAMPLERS)
+
+        self.shaders: dict[int, ShaderVariants] = {
+            PIPELINE_TYPE["STANDARD"]: ShaderVariants(
+                "shaders/vertex.txt", "shaders/fragment.txt", on_create = lit),
+            PIPELINE_TYPE["EMISSIVE"]: ShaderVariants(
+                "shaders/vertex_light.txt", "shaders/fragment_light.txt", on_create = lit),
+            PIPELINE_TYPE["SHADOW"]: ShaderVariants(
+                "shaders/shadow_vertex.txt", "shaders/shadow_fragment.txt", on_create = lit),
+            PIPELINE_TYPE["DEPTH"]: ShaderVariants(
+                "shaders/shadow_vertex.txt", "shaders/shadow_fragment.txt",
+                {"CAMERA": 1}, on_create = lit),
+            PIPELINE_TYPE["GBUFFER"]: ShaderVariants(
+                "shaders/vertex.txt", "shaders/gbuffer_fragment.txt", on_create = lit),
+            PIPELINE_TYPE["DEFERRED_AMBIENT"]: ShaderVariants(
+                "shaders/screen_vertex.txt", "shaders/deferred_ambient_fragment.txt",
+                on_create = deferred),
+            PIPELINE_TYPE["DEFERRED_LIGHT"]: ShaderVariants(
+                "shaders/deferred_light_vertex.txt", "shaders/deferred_light_fragment.txt",
+                on_create = deferred),
+            PIPELINE_TYPE["BILLBOARD"]: ShaderVariants(
+                "shaders/vertex.txt", "shaders/fragment.txt",
+                {"INSTANCED": 1}, on_create = lit),
+            PIPELINE_TYPE["GBUFFER_BILLBOARD"]: ShaderVariants(
+                "shaders/vertex.txt", "shaders/gbuffer_fragment.txt",
+                {"INSTANCED": 1}, on_create = lit),
         }
     
-    def _set_onetime_uniforms(self) -> None:
+    def _create_uniform_blocks(self) -> None:
         """
-            Some shader data only needs to be set once.
+            Create the uniform buffers shared by every program.
         """
 
-        ratio = self.window_width / self.window_height
-        projection_transform = pyrr.matrix44.create_perspective_projection(
-            fovy=45, aspect=ratio, near=0.1, far=1000, dtype=np.float32
-        )
+        self.frame_block = FrameBlock(UNIFORM_BLOCK["FRAME"])
+        self.light_block = LightBlock(UNIFORM_BLOCK["LIGHTS"])
+        self._set_projection()
 
-        for shader in self.shaders.values():
-            shader.use()
-            glUniform1i(glGetUniformLocation(shader.program, "imageTexture"), 0)
+    def _prepare_shader(self, shader: Shader, samplers: dict[str, int]) -> None:
+        """
+            Set up a newly built variant: attach the shared uniform
+            blocks, point its samplers at their texture units and
+            cache its uniform locations.
+        """
 
-            glUniformMatrix4fv(
-                glGetUniformLocation(shader.program,"projection"),
-                1, GL_FALSE, projection_transform
-            )
+        for block in (self.frame_block, self.light_block):
+            shader.bind_uniform_block(
+                block.name, block.binding, block.layout, block.size)
+
+        shader.use()
+        for name, unit in samplers.items():
+            location = glGetUniformLocation(shader.program, name)
+            if location != -1:
+                glUniform1i(location, unit)
 
-    def _get_uniform_locations(self) -> None:
+        for uniform_type, name in UNIFORM_NAMES.items():
+            shader.cache_single_location(uniform_type, name)
+
+    def _build_shader_variants(self) -> None:
         """
-            Query and store the locations of shader uniforms
+            Build the variants which don't depend on the scene up
+            front, so the first frames don't stall on compiling.
+            Lit forward variants also depend on the light count and
+            are built on first use.
         """
 
-        shader = self.shaders[PIPELINE_TYPE["STANDARD"]]
-        shader.use()
+        surfaces = [{}, {"TEXTURED": 1}]
+        shadows = [{}, {"SHADOWS": 1}]
+        self.shaders[PIPELINE_TYPE["SHADOW"]].build([{}])
+        self.shaders[PIPELINE_TYPE["DEPTH"]].build([{}])
+        self.shaders[PIPELINE_TYPE["GBUFFER"]].build(surfaces)
+        self.shaders[PIPELINE_TYPE["GBUFFER_BILLBOARD"]].build([{"TEXTURED": 1}])
+        self.shaders[PIPELINE_TYPE["EMISSIVE"]].build([{"TEXTURED": 1}])
+        self.shaders[PIPELINE_TYPE["DEFERRED_AMBIENT"]].build([{}])
+        self.shaders[PIPELINE_TYPE["DEFERRED_LIGHT"]].build(shadows)
+
+    def _set_up_skybox_shader(self) -> None:
+        """
+            The skybox program isn't a variant, set it up once.
+        """
 
-        shader.cache_single_location(
-            UNIFORM_TYPE["CAMERA_POS"], "cameraPosition")
-        shader.cache_single_location(UNIFORM_TYPE["MODEL"], "model")
-        shader.cache_single_location(UNIFORM_TYPE["VIEW"], "view")
+        for block in (self.frame_block, self.light_block):
+            self.skybox_shader.bind_uniform_block(
+                block.name, block.binding, block.layout, block.size)
 
-        for i in range(8):
+        self.skybox_shader.use()
+        glUniform1i(glGetUniformLocation(self.skybox_shader.program, "skybox"), 0)
 
-            shader.cache_multi_location(
-                UNIFORM_TYPE["LIGHT_COLOR"], f"Lights[{i}].color")
-            shader.cache_multi_location(
-                UNIFORM_TYPE["LIGHT_POS"], f"Lights[{i}].position")
-            shader.cache_multi_location(
-                UNIFORM_TYPE["LIGHT_STRENGTH"], f"Lights[{i}].strength")
-        
-        shader = self.shaders[PIPELINE_TYPE["EMISSIVE"]]
-        shader.use()
+    def _set_projection(self) -> None:
+        """
+            Store the camera projection for the current window size,
+            it goes out with the next frame's data.
+        """
 
-        shader.cache_single_location(UNIFORM_TYPE["MODEL"], "model")
-        shader.cache_single_location(UNIFORM_TYPE["VIEW"], "view")
-        shader.cache_single_location(UNIFORM_TYPE["TINT"], "tint")
+        aspect = self.window_width / max(1, self.window_height)
+        projection = pyrr.matrix44.create_perspective_projection(
+            fovy=45, aspect=aspect, near=0.1, far=1000, dtype=np.float32
+        )
+        self.projection = projection
+        self.frame_block.write("projection", projection)
 
-        shader = self.shaders[PIPELINE_TYPE["SHADOW"]]
-        shader.use()
+    def _get_lit_defines(self, snapshot: RenderSnapshot) -> dict[str, int]:
+        """
+            Returns the variant symbols of this frame's lit passes.
+        """
 
-        shader.cache_single_location(UNIFORM_TYPE["MODEL"], "model")
-        shader.cache_single_location(UNIFORM_TYPE["LIGHT_MATRIX"], "lightSpaceMatrix")
+        defines = {"LIGHT_COUNT": snapshot.light_count}
+        if self.shadows_enabled:
+            defines["SHADOWS"] = 1
+        return defines
 
+    def _create_deferred_targets(self) -> None:
+        """
+            Create the G-buffer and the meshes used by the
+            deferred lighting passes.
+        """
 
+        self.gbuffer = GBuffer(self.window_width, self.window_height)
+        self.light_volume_mesh = SphereMesh()
+        self.screen_mesh = ScreenMesh()
     
     def _create_shadow_map(self):
         self.shadow_width = 1024
@@ -163,6 +303,9 @@ class GraphicsEngine:
         glTexImage2D(GL_TEXTURE_2D, 0, GL_DEPTH_COMPONENT,
                     self.shadow_width, self.shadow_height, 0,
                     GL_DEPTH_COMPONENT, GL_FLOAT, None)
+        GPU_MEMORY.track_texture(
+            self.shadow_depth_texture, self.shadow_width, self.shadow_height,
+            GL_DEPTH_COMPONENT, "shadow map")
 
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
@@ -199,23 +342,26 @@ class GraphicsEngine:
 
         return pyrr.matrix44.multiply(light_view, light_proj)
     
-    def _update_projection_matrices(self) -> None:
-        aspect = self.window_width / self.window_height
-        projection = pyrr.matrix44.create_perspective_projection(
-            fovy=45, aspect=aspect, near=0.1, far=1000, dtype=np.float32
-        )
-        for shader in self.shaders.values():
-            shader.use()
-            loc = glGetUniformLocation(shader.program, "projection")
-            if loc != -1:  # Only update if the shader uses this uniform
-                glUniformMatrix4fv(loc, 1, GL_FALSE, projection)
+    def _upload_frame_data(self,
+        snapshot: RenderSnapshot, light_space_matrix: np.ndarray) -> None:
+        """
+            Send this frame's camera and light data to the shared
+            uniform blocks, one upload per block.
+        """
 
+        self.frame_block.write("view", snapshot.view)
+        self.frame_block.write("lightSpaceMatrix", light_space_matrix)
+        self.frame_block.write("cameraPosition", snapshot.camera_position)
+        self.frame_block.upload()
 
+        self.light_block.set_light_rows(snapshot.lights, snapshot.light_count)
+        self.light_block.upload()
 
     def _recreate_shadow_map(self, width: int, height: int) -> None:
         # Delete old framebuffer and texture
         glDeleteFramebuffers(1, [self.shadow_fbo])
         glDeleteTextures(1, [self.shadow_depth_texture])
+        GPU_MEMORY.release("texture", self.shadow_depth_texture)
 
         self.shadow_width = width
         self.shadow_height = height
@@ -230,6 +376,9 @@ class GraphicsEngine:
         glTexImage2D(GL_TEXTURE_2D, 0, GL_DEPTH_COMPONENT,
                     self.shadow_width, self.shadow_height, 0,
                     GL_DEPTH_COMPONENT, GL_FLOAT, None)
+        GPU_MEMORY.track_texture(
+            self.shadow_depth_texture, self.shadow_width, self.shadow_height,
+            GL_DEPTH_COMPONENT, "shadow map")
 
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
@@ -249,16 +398,184 @@ class GraphicsEngine:
         # Unbind framebuffer
         glBindFramebuffer(GL_FRAMEBUFFER, 0)
 
+    def build_static_batches(self, renderables: dict[int, list[Entity]]) -> None:
+        """
+            Merge the geometry of every static entity into
+            per material batches. Call once the scene is built.
+        """
+
+        self.static_batches.build(self.meshes, self.materials, renderables)
+
+    def update_static_entity(self,
+        entity_type: int, entity: Entity, model: np.ndarray | None = None) -> None:
+        """
+            Rebuild the batches a static entity belongs to,
+            after it was moved or edited.
+
+            Parameters:
+
+                model: the entity's model matrix, when the
+                    entity belongs to another thread.
+        """
+
+        self.static_batches.update_entity(
+            entity, self.meshes.get(entity_type),
+            self.materials.get(entity_type), model)
+
+    def _apply_static_edits(self) -> None:
+        """
+            Re-batch the static entities the snapshot
+            builder saw move.
+        """
+
+        edits = self.snapshot_builder.static_edits
+        while not edits.empty():
+            entity_type, entity, model = edits.get()
+            if entity.handle not in entity.archetype.rows:
+                # destroyed since
+                continue
+            self.update_static_entity(entity_type, entity, model)
+
+    def attach_scene(self, scene, send = None) -> None:
+        """
+            Keep a scene's collision and picking in step with
+            reloaded meshes.
+
+            Parameters:
+
+                scene: the Scene, which must share the engine's
+                    meshes, see Scene.set_meshes.
+
+                send: applies a change to the scene, by default
+                    at once; pass App._send when the simulation
+                    runs on its own thread.
+        """
+
+        self.scene = scene
+        self.send = send or (lambda command, *args: command(*args))
+
+    def replace_mesh(self, entity_type: int, data) -> None:
+        """
+            Swap in a reloaded mesh, re-batching the static
+            entities drawn with it and freeing the old one.
+            An attached scene collides with and picks against
+            the new triangles from its next step.
+
+            Parameters:
+                entity_type: whose mesh was reloaded
+                data: the obj file, as parsed by the mesh's loader
+        """
+
+        old = self.meshes[entity_type]
+        mesh = type(old)(old.filename, data)
+        # before it is shared, so picking never builds it mid step
+        if hasattr(mesh, "get_bvh"):
+            mesh.get_bvh()
+        self.meshes[entity_type] = mesh
+
+        self.static_batches.replace_mesh(old, mesh, self.materials.get(entity_type))
+        self.snapshot_builder.radii.update(self._get_bounding_radii())
+        if self.scene is not None:
+            self.send(self.scene.replace_static_geometry, entity_type, mesh)
+        old.destroy()
+
+    def add_world_cell(self, key: tuple[int, int], mesh: MultiMaterialMesh) -> None:
+        """
+            Draw a streamed world cell's mesh, which is
+            already in world space, from now on.
+        """
+
+        self.remove_world_cell(key)
+        if len(mesh.vertices):
+            lo = mesh.vertices[:, 0:3].min(axis = 0)
+            hi = mesh.vertices[:, 0:3].max(axis = 0)
+        else:
+            lo = hi = np.zeros(3, dtype=np.float32)
+        self.world_cells[key] = (mesh, lo, hi)
+
+    def remove_world_cell(self, key: tuple[int, int]) -> None:
+        """
+            Stop drawing a world cell and free its mesh.
+        """
+
+        cell = self.world_cells.pop(key, None)
+        if cell is not None:
+            cell[0].destroy()
+
+    def _get_bounding_radii(self) -> dict[int, float]:
+        """
+            Returns the radius of a sphere around the origin enclosing
+            each mesh, for culling.
+        """
+
+        radii = {}
+        for entity_type, mesh in self.meshes.items():
+            if isinstance(mesh, (ObjMesh, MultiMaterialMesh)) and len(mesh.vertices):
+                radii[entity_type] = float(
+                    np.linalg.norm(mesh.vertices[:, 0:3], axis = 1).max())
+            elif isinstance(mesh, RectMesh):
+                radii[entity_type] = float(np.hypot(*mesh.size) / 2)
+        return radii
+
+    def set_render_target(self, framebuffer: int) -> None:
+        """
+            Choose the framebuffer the final image is drawn to,
+            0 being the window.
+        """
+
+        self.target_framebuffer = framebuffer
+
+    def _get_render_framebuffer(self) -> int:
+        """
+            Returns the framebuffer the scene is drawn into,
+            before any upscaling.
+        """
+
+        if self.scaled_target is not None:
+            return self.scaled_target.fbo
+        return self.target_framebuffer
+
+    def _bind_render_target(self) -> None:
+        """
+            Draw into the final image, or the scaled
+            down one standing in for it.
+        """
+
+        glBindFramebuffer(GL_FRAMEBUFFER, self._get_render_framebuffer())
+        glViewport(0, 0, self.render_width, self.render_height)
+
+    def _apply_render_scale(self) -> None:
+        """
+            Size the scene's render targets for the current
+            window size and resolution scale.
+        """
+
+        width, height = self.resolution.get_size(self.window_width, self.window_height)
+        if (width, height) == (self.window_width, self.window_height):
+            if self.scaled_target is not None:
+                self.scaled_target.destroy()
+                self.scaled_target = None
+        elif self.scaled_target is None:
+            self.scaled_target = Framebuffer(width, height, "scaled scene")
+        elif (self.scaled_target.width, self.scaled_target.height) != (width, height):
+            self.scaled_target.resize(width, height)
+
+        if (self.gbuffer.width, self.gbuffer.height) != (width, height):
+            self.gbuffer.resize(width, height)
+        self.render_width = width
+        self.render_height = height
+
     def resize(self, width: int, height: int) -> None:
         self.window_width = width
         self.window_height = height
-        self._update_projection_matrices()
+        self._set_projection()
         self._recreate_shadow_map(width, height)
+        self._apply_render_scale()
     
     def render(self, 
         camera: Camera, 
         renderables: dict[int, list[Entity]],
-        lights: list[PointLight]) -> None:
+        lights: list[PointLight], alpha: float = 1.0) -> None:
         """
             Draw everything.
 
@@ -266,173 +583,470 @@ class GraphicsEngine:
                 camera: the scene's camera
                 renderables: all the entities to draw
                 lights: all the lights in the scene
+                alpha: how far between the last two simulation
+                    steps to draw moving entities
         """
-        if self.shadows_enabled:
-            # STEP 1: Render shadow map
-            glViewport(0, 0, self.shadow_width, self.shadow_height)
-            glBindFramebuffer(GL_FRAMEBUFFER, self.shadow_fbo)
-            glClear(GL_DEPTH_BUFFER_BIT)
 
-            shadow_shader = self.shaders[PIPELINE_TYPE["SHADOW"]]
-            shadow_shader.use()
-            glUniform1i(glGetUniformLocation(shadow_shader.program, "shadowsEnabled"), int(self.shadows_enabled))
+        self.snapshot_builder.fill(
+            self.snapshot, camera, renderables, lights,
+            self.projection, alpha)
+        self.render_snapshot(self.snapshot)
 
-            light_pos = lights[0].position  # Use the first light
-            light_space_matrix = self._get_light_space_matrix(light_pos)
-
-            glUniformMatrix4fv(
-                shadow_shader.fetch_single_location(UNIFORM_TYPE["LIGHT_MATRIX"]),
-                1, GL_FALSE, light_space_matrix
-            )
+    def render_snapshot(self, snapshot: RenderSnapshot) -> None:
+        """
+            Draw a snapshot of the scene, as published
+            by the simulation.
+        """
 
-            for entity_type, entities in renderables.items():
-                mesh = self.meshes[entity_type]
-                if isinstance(mesh, MultiMaterialMesh):
-                    for entity in entities:
-                        glUniformMatrix4fv(
-                            shadow_shader.fetch_single_location(UNIFORM_TYPE["MODEL"]),
-                            1, GL_FALSE, entity.get_model_transform()
-                        )
-                        mesh.render()
-                else:
-                    mesh.arm_for_drawing()
-                    for entity in entities:
-                        glUniformMatrix4fv(
-                            shadow_shader.fetch_single_location(UNIFORM_TYPE["MODEL"]),
-                            1, GL_FALSE, entity.get_model_transform()
-                        )
-                        mesh.draw()
-
-            glBindFramebuffer(GL_FRAMEBUFFER, 0)
-            glViewport(0, 0, self.window_width, self.window_height)
+        # between frames, so nothing is drawn half reloaded
+        self.reloader.update()
+        self._apply_static_edits()
+        self.resolution.begin_frame()
 
+        if self.shadows_enabled and snapshot.light_count:
+            light_pos = snapshot.lights[0, 0:3]  # Use the first light
+            light_space_matrix = self._get_light_space_matrix(light_pos)
         else:
             light_space_matrix = np.identity(4, dtype=np.float32)
 
+        view = snapshot.view
+        self._upload_frame_data(snapshot, light_space_matrix)
+        self._update_billboards(snapshot)
+
+        # STEP 1: Render shadow map
+        if self.shadows_enabled:
+            with self.timer.section("shadow"):
+                self._render_shadow_map(snapshot, light_space_matrix)
+
+        # sprites are drawn after upscaling, at full resolution
+        native_overlays = self.scaled_target is not None and self.resolution.native_overlays
+
         # STEP 2: Main geometry render
-        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
-        view = camera.get_view_transform()
-        shader = self.shaders[PIPELINE_TYPE["STANDARD"]]
-        shader.use()
-        glUniform1i(glGetUniformLocation(shader.program, "shadowsEnabled"), int(self.shadows_enabled))
+        if self.render_path == RENDER_PATH["DEFERRED"]:
+            self._render_deferred(snapshot)
+        else:
+            prepass = self.prepass.should_run()
+            if prepass:
+                with self.timer.section("prepass"):
+                    self._render_depth_prepass(snapshot)
+            with self.timer.section("main"):
+                self._render_forward(snapshot, prepass, not native_overlays)
 
+        # STEP 3: Emissive objects (e.g., point lights)
+        if not native_overlays:
+            with self.timer.section("emissive"):
+                self._render_emissive()
 
-        # Pass light-space matrix and shadow map
-        glUniformMatrix4fv(
-            glGetUniformLocation(shader.program, "lightSpaceMatrix"),
-            1, GL_FALSE, light_space_matrix
-        )
+        # STEP 4: Draw skybox
+        with self.timer.section("skybox"):
+            self._render_skybox()
+
+        # STEP 5: Scale the image up to the window
+        if self.scaled_target is not None:
+            with self.timer.section("upscale"):
+                self._upscale(native_overlays)
+            if native_overlays:
+                with self.timer.section("overlays"):
+                    self._render_overlays(snapshot)
+
+        self.timer.end_frame()
+        self.prepass.end_frame()
+        if self.resolution.end_frame():
+            self._apply_render_scale()
+
+    def _draw_entities(self,
+        binder: ShaderBinder, snapshot: RenderSnapshot,
+        use_materials: bool, view_projection: np.ndarray,
+        visible_only: bool = True) -> None:
+        """
+            Draw every entity with the given pass's shaders.
 
-        glActiveTexture(GL_TEXTURE1)
-        glBindTexture(GL_TEXTURE_2D, self.shadow_depth_texture)
-        glUniform1i(glGetUniformLocation(shader.program, "shadowMap"), 1)
+            Parameters:
 
-        glUniformMatrix4fv(
-            shader.fetch_single_location(UNIFORM_TYPE["VIEW"]),
-            1, GL_FALSE, view
-        )
-        glUniform3fv(
-            shader.fetch_single_location(UNIFORM_TYPE["CAMERA_POS"]),
-            1, camera.position
-        )
+                binder: picks the variant for each material.
+
+                snapshot: the scene to draw
+
+                use_materials: whether single material meshes
+                    should bind their material.
 
-        for i, light in enumerate(lights):
-            glUniform3fv(shader.fetch_multi_location(UNIFORM_TYPE["LIGHT_POS"], i), 1, light.position)
-            glUniform3fv(shader.fetch_multi_location(UNIFORM_TYPE["LIGHT_COLOR"], i), 1, light.color)
-            glUniform1f(shader.fetch_multi_location(UNIFORM_TYPE["LIGHT_STRENGTH"], i), light.strength)
+                view_projection: the pass's world to clip transform,
+                    used to skip static batches out of view.
 
-        for entity_type, entities in renderables.items():
+                visible_only: draw only the moving entities the
+                    camera sees, rather than all of them.
+        """
+
+        bind_material = binder.bind_material if use_materials else None
+
+        planes = extract_planes(view_projection)
+        self.static_batches.draw(binder.set_model, bind_material, planes)
+
+        if self.world_cells:
+            binder.set_model(IDENTITY)
+            for mesh, lo, hi in self.world_cells.values():
+                if aabb_in_frustum(planes, lo, hi):
+                    mesh.render(bind_material)
+
+        for entity_type in snapshot.model_counts:
+            models = snapshot.get_models(entity_type, visible_only)
+            if len(models) == 0:
+                continue
             mesh = self.meshes[entity_type]
             if isinstance(mesh, MultiMaterialMesh):
-                for entity in entities:
-                    glUniformMatrix4fv(
-                        shader.fetch_single_location(UNIFORM_TYPE["MODEL"]),
-                        1, GL_FALSE, entity.get_model_transform()
-                    )
-                    mesh.render()
+                for model in models:
+                    binder.set_model(model)
+                    mesh.render(bind_material)
             else:
-                if entity_type not in self.materials:
-                    continue
-                self.materials[entity_type].use()
+                if use_materials:
+                    if entity_type not in self.materials:
+                        continue
+                    binder.bind_material(self.materials[entity_type])
                 mesh.arm_for_drawing()
-                for entity in entities:
-                    glUniformMatrix4fv(
-                        shader.fetch_single_location(UNIFORM_TYPE["MODEL"]),
-                        1, GL_FALSE, entity.get_model_transform()
-                    )
+                for model in models:
+                    binder.set_model(model)
                     mesh.draw()
 
-        # STEP 3: Emissive objects (e.g., point lights)
-        emissive_shader = self.shaders[PIPELINE_TYPE["EMISSIVE"]]
-        emissive_shader.use()
-        glUniformMatrix4fv(
-            emissive_shader.fetch_single_location(UNIFORM_TYPE["VIEW"]),
-            1, GL_FALSE, view
-        )
+    def _draw_depth(self,
+        binder: ShaderBinder, snapshot: RenderSnapshot,
+        view_projection: np.ndarray, visible_only: bool = True) -> None:
+        """
+            Draw every entity's positions only, for passes which
+            just write depth: one call per mesh, no materials.
+
+            Parameters:
+
+                binder: the pass's depth only shaders.
+
+                snapshot: the scene to draw
+
+                view_projection: the pass's world to clip transform,
+                    used to skip static geometry out of view.
+
+                visible_only: draw only the moving entities the
+                    camera sees, rather than all of them.
+        """
+
+        planes = extract_planes(view_projection)
+        self.static_batches.draw_depth(binder.set_model, planes)
+
+        if self.world_cells:
+            binder.set_model(IDENTITY)
+            for mesh, lo, hi in self.world_cells.values():
+                if aabb_in_frustum(planes, lo, hi):
+                    mesh.render_depth()
+
+        for entity_type in snapshot.model_counts:
+            models = snapshot.get_models(entity_type, visible_only)
+            if len(models) == 0:
+                continue
+            mesh = self.meshes[entity_type]
+            if hasattr(mesh, "render_depth"):
+                for model in models:
+                    binder.set_model(model)
+                    mesh.render_depth()
+            else:
+                mesh.arm_for_drawing()
+                for model in models:
+                    binder.set_model(model)
+                    mesh.draw()
+
+    def _update_billboards(self, snapshot: RenderSnapshot) -> None:
+        """
+            Refresh the instance data of every sprite batch.
+            Billboards are turned towards the camera by the vertex
+            shader, so only their positions go over.
+        """
 
-        material = self.materials[ENTITY_TYPE["POINTLIGHT"]]
         mesh = self.meshes[ENTITY_TYPE["POINTLIGHT"]]
-        material.use()
-        mesh.arm_for_drawing()
-        for light in lights:
-            glUniform3fv(
-                emissive_shader.fetch_single_location(UNIFORM_TYPE["TINT"]), 
-                1, light.color
-            )
+        lights = snapshot.lights[:snapshot.light_count]
+        self.light_sprites.set_instances(lights[:, 0:3], lights[:, 4:7], mesh.size)
+
+        for entity_type, count in snapshot.sprite_counts.items():
+            if entity_type not in self.billboards:
+                self.billboards[entity_type] = BillboardBatch()
+            sprites = snapshot.sprites[entity_type][:count]
+            self.billboards[entity_type].set_instances(
+                sprites[:, 0:3], sprites[:, 3:6], self.meshes[entity_type].size)
+
+    def _draw_billboards(self, binder: ShaderBinder) -> None:
+        """
+            Draw the billboard entities, one instanced call
+            per entity type.
+        """
+
+        for entity_type, batch in self.billboards.items():
+            if entity_type not in self.materials:
+                continue
+            binder.bind_material(self.materials[entity_type])
+            batch.draw()
+
+    def _render_shadow_map(self, 
+        snapshot: RenderSnapshot, light_space_matrix: np.ndarray) -> None:
+        """
+            Draw the scene's depth from the first light's point of view.
+        """
+
+        glViewport(0, 0, self.shadow_width, self.shadow_height)
+        glBindFramebuffer(GL_FRAMEBUFFER, self.shadow_fbo)
+        glClear(GL_DEPTH_BUFFER_BIT)
+
+        binder = ShaderBinder(self.shaders[PIPELINE_TYPE["SHADOW"]])
+        binder.use()
+        # casters outside the camera's view still cast into it
+        self._draw_depth(
+            binder, snapshot, light_space_matrix, visible_only = False)
+
+        self._bind_render_target()
+
+    def _render_depth_prepass(self, snapshot: RenderSnapshot) -> None:
+        """
+            Write the opaque geometry's depth from the camera,
+            positions only, ahead of the forward pass.
+        """
+
+        self._bind_render_target()
+        glClear(GL_DEPTH_BUFFER_BIT)
+        glColorMask(GL_FALSE, GL_FALSE, GL_FALSE, GL_FALSE)
+
+        binder = ShaderBinder(self.shaders[PIPELINE_TYPE["DEPTH"]])
+        binder.use()
+        with self.prepass.measure("depth"):
+            self._draw_depth(
+                binder, snapshot, pyrr.matrix44.multiply(snapshot.view, self.projection))
+
+        glColorMask(GL_TRUE, GL_TRUE, GL_TRUE, GL_TRUE)
+
+    def _render_forward(self,
+        snapshot: RenderSnapshot, prepass: bool = False, billboards: bool = True) -> None:
+        """
+            Draw and light the scene's geometry in one pass.
+
+            Parameters:
+
+                snapshot: the scene to draw
+
+                prepass: whether the depth prepass has already
+                    been drawn, so only the nearest surface of
+                    each pixel needs shading.
+
+                billboards: whether to draw the sprites too,
+                    rather than leaving them for later.
+        """
+
+        self._bind_render_target()
+        if prepass:
+            glClear(GL_COLOR_BUFFER_BIT)
+            glDepthFunc(self.prepass.depth_func)
+            glDepthMask(GL_FALSE)
+        else:
+            glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+        defines = self._get_lit_defines(snapshot)
+
+        glActiveTexture(GL_TEXTURE1)
+        glBindTexture(GL_TEXTURE_2D, self.shadow_depth_texture)
+
+        with self.prepass.measure("lit"):
+            self._draw_entities(
+                ShaderBinder(self.shaders[PIPELINE_TYPE["STANDARD"]], defines),
+                snapshot, True, pyrr.matrix44.multiply(snapshot.view, self.projection))
+
+        if prepass:
+            glDepthMask(GL_TRUE)
+            glDepthFunc(GL_LESS)
+        # sprites are cut out and blended, they aren't in the prepass
+        if billboards:
+            self._draw_billboards(
+                ShaderBinder(self.shaders[PIPELINE_TYPE["BILLBOARD"]], defines))
+
+    def _render_deferred(self, snapshot: RenderSnapshot) -> None:
+        """
+            Write the scene's surfaces to the G-buffer, then light
+            them with one volume per light, so lighting cost follows
+            the number of lit pixels.
+        """
+
+        # Geometry
+        with self.timer.section("gbuffer"):
+            self.gbuffer.bind()
+            glDisable(GL_BLEND)
+            glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+            self._draw_entities(
+                ShaderBinder(self.shaders[PIPELINE_TYPE["GBUFFER"]]),
+                snapshot, True, pyrr.matrix44.multiply(snapshot.view, self.projection))
+            self._draw_billboards(
+                ShaderBinder(self.shaders[PIPELINE_TYPE["GBUFFER_BILLBOARD"]]))
+
+        with self.timer.section("lighting"):
+            self._bind_render_target()
+            glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+
+            self.gbuffer.bind_textures(0)
+            glActiveTexture(GL_TEXTURE3)
+            glBindTexture(GL_TEXTURE_2D, self.shadow_depth_texture)
+
+            glDisable(GL_DEPTH_TEST)
+            glDepthMask(GL_FALSE)
+
+            # Ambient
+            self.shaders[PIPELINE_TYPE["DEFERRED_AMBIENT"]].get().use()
+            self.screen_mesh.arm_for_drawing()
+            self.screen_mesh.draw()
+
+            # Lights, added on top of each other
+            glEnable(GL_BLEND)
+            glBlendFunc(GL_ONE, GL_ONE)
+            # back faces still cover the screen when the camera is inside
+            glEnable(GL_CULL_FACE)
+            glCullFace(GL_FRONT)
+
+            shader = self.shaders[PIPELINE_TYPE["DEFERRED_LIGHT"]].get(
+                {"SHADOWS": 1} if self.shadows_enabled else {})
+            shader.use()
+            inverse_view_projection = np.linalg.inv(
+                pyrr.matrix44.multiply(snapshot.view, self.projection)).astype(np.float32)
             glUniformMatrix4fv(
-                emissive_shader.fetch_single_location(UNIFORM_TYPE["MODEL"]),
-                1, GL_FALSE, light.get_model_transform()
+                shader.fetch_single_location(UNIFORM_TYPE["INVERSE_VIEW_PROJECTION"]),
+                1, GL_FALSE, inverse_view_projection
+            )
+            glUniform2f(
+                shader.fetch_single_location(UNIFORM_TYPE["SCREEN_SIZE"]),
+                self.gbuffer.width, self.gbuffer.height
             )
-            mesh.draw()
 
-        # STEP 4: Draw skybox
-        glDepthFunc(GL_LEQUAL)
-        self.skybox_shader.use()
+            self.light_volume_mesh.arm_for_drawing()
+            for i, light in enumerate(snapshot.lights[:snapshot.light_count]):
+                radius = get_light_radius(light[4:7], light[7], LIGHT_CUTOFF)
+                if radius <= 0:
+                    continue
+                glUniform4f(
+                    shader.fetch_single_location(UNIFORM_TYPE["LIGHT_VOLUME"]),
+                    *light[0:3], radius
+                )
+                glUniform1i(
+                    shader.fetch_single_location(UNIFORM_TYPE["LIGHT_INDEX"]), i)
+                self.light_volume_mesh.draw()
+
+            glCullFace(GL_BACK)
+            glDisable(GL_CULL_FACE)
+            glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+            glDepthMask(GL_TRUE)
+            glEnable(GL_DEPTH_TEST)
+            glActiveTexture(GL_TEXTURE0)
+
+            # Forward passes after this depth test against the scene
+            self.gbuffer.blit_depth(self._get_render_framebuffer())
+
+    def _upscale(self, with_depth: bool) -> None:
+        """
+            Stretch the scaled down image over the final one,
+            bilinearly filtered.
 
-        skybox_view = pyrr.matrix44.create_from_matrix33(
-            pyrr.matrix33.create_from_matrix44(view)
-        )
-        aspect = self.window_width / self.window_height
-        projection = pyrr.matrix44.create_perspective_projection(
-            fovy=45, aspect=aspect, near=0.1, far=1000
-        )
+            Parameters:
 
-        glUniformMatrix4fv(
-            glGetUniformLocation(self.skybox_shader.program, "view"),
-            1, GL_FALSE, skybox_view
-        )
-        glUniformMatrix4fv(
-            glGetUniformLocation(self.skybox_shader.program, "projection"),
-            1, GL_FALSE, projection
-        )
+                with_depth: copy the depth too, for the
+                    passes drawn after at full resolution.
+        """
+
+        glBindFramebuffer(GL_READ_FRAMEBUFFER, self.scaled_target.fbo)
+        glBindFramebuffer(GL_DRAW_FRAMEBUFFER, self.target_framebuffer)
+        glBlitFramebuffer(
+            0, 0, self.render_width, self.render_height,
+            0, 0, self.window_width, self.window_height,
+            GL_COLOR_BUFFER_BIT, GL_LINEAR)
+        if with_depth:
+            glBlitFramebuffer(
+                0, 0, self.render_width, self.render_height,
+                0, 0, self.window_width, self.window_height,
+                GL_DEPTH_BUFFER_BIT, GL_NEAREST)
+        glBindFramebuffer(GL_FRAMEBUFFER, self.target_framebuffer)
+        glViewport(0, 0, self.window_width, self.window_height)
+
+    def _render_overlays(self, snapshot: RenderSnapshot) -> None:
+        """
+            Draw the sprites over the upscaled image,
+            at the window's resolution.
+        """
+
+        # deferred billboards are lit in the G-buffer, at the scene's scale
+        if self.render_path == RENDER_PATH["FORWARD"]:
+            glActiveTexture(GL_TEXTURE1)
+            glBindTexture(GL_TEXTURE_2D, self.shadow_depth_texture)
+            self._draw_billboards(ShaderBinder(
+                self.shaders[PIPELINE_TYPE["BILLBOARD"]],
+                self._get_lit_defines(snapshot)))
+        self._render_emissive()
+
+    def _render_emissive(self) -> None:
+        """
+            Draw the light sprites, unlit.
+        """
 
+        binder = ShaderBinder(self.shaders[PIPELINE_TYPE["EMISSIVE"]])
+        binder.bind_material(self.materials[ENTITY_TYPE["POINTLIGHT"]])
+        self.light_sprites.draw()
+
+    def _render_skybox(self) -> None:
+        """
+            Fill the background with the skybox.
+        """
+
+        glDepthFunc(GL_LEQUAL)
+        self.skybox_shader.use()
+        glActiveTexture(GL_TEXTURE0)
         self.skybox.use()
         self.skybox_mesh.arm_for_drawing()
         self.skybox_mesh.draw()
         glDepthFunc(GL_LESS)
 
-        glFlush()
+    def toggle_render_path(self) -> None:
+        """
+            Switch between forward and deferred shading.
+        """
+
+        if self.render_path == RENDER_PATH["FORWARD"]:
+            self.render_path = RENDER_PATH["DEFERRED"]
+        else:
+            self.render_path = RENDER_PATH["FORWARD"]
+        log.info("Deferred shading: %s", self.render_path == RENDER_PATH["DEFERRED"])
+
+    def cycle_depth_prepass(self) -> None:
+        """
+            Switch the forward depth prepass between
+            off, on and following the overdraw.
+        """
+
+        names = list(DEPTH_PREPASS)
+        mode = (self.prepass.mode + 1) % len(names)
+        self.prepass.set_mode(mode)
+        log.info("Depth prepass: %s", names[mode])
+
+    def toggle_dynamic_resolution(self) -> None:
+        """
+            Switch between a fixed full resolution and one
+            following the frame time.
+        """
+
+        self.resolution.set_enabled(not self.resolution.enabled)
+        self._apply_render_scale()
+        log.info("Dynamic resolution: %s", self.resolution.enabled)
 
     def toggle_shadows(self):
+        # the lit passes pick their SHADOWS variant from this
         self.shadows_enabled = not self.shadows_enabled
-        print("Shadows enabled:", self.shadows_enabled)
+        log.info("Shadows enabled: %s", self.shadows_enabled)
 
     def reload_shaders(self):
-        print("Reloading shaders...")
-
-        # Destroy old programs
-        for shader in self.shaders.values():
-            shader.destroy()
-
-        # Rebuild everything
-        self._create_assets()
-        self._get_uniform_locations()
-        self._set_onetime_uniforms()
+        # the new programs are swapped in once they're linked,
+        # meshes and materials are left alone
+        log.info("Reloading shaders...")
+        self.reloader.reload_shaders()
 
 
     def destroy(self) -> None:
         """ free any allocated memory """
 
+        self.reloader.destroy()
         for mesh in self.meshes.values():
             mesh.destroy()
         for material in self.materials.values():
@@ -442,6 +1056,24 @@ class GraphicsEngine:
 
         glDeleteFramebuffers(1, [self.shadow_fbo])
         glDeleteTextures(1, [self.shadow_depth_texture])
+        GPU_MEMORY.release("texture", self.shadow_depth_texture)
+        self.frame_block.destroy()
+        self.light_block.destroy()
+        self.gbuffer.destroy()
+        self.timer.destroy()
+        self.prepass.destroy()
+        self.resolution.destroy()
+        if self.scaled_target is not None:
+            self.scaled_target.destroy()
+        self.light_volume_mesh.destroy()
+        self.screen_mesh.destroy()
+        self.light_sprites.destroy()
+        self.static_batches.destroy()
+        for mesh, _, _ in self.world_cells.values():
+            mesh.destroy()
+        self.world_cells.clear()
+        for batch in self.billboards.values():
+            batch.destroy()
         self.skybox.destroy()
         self.skybox_mesh.destroy()
         self.skybox_shader.destroy()
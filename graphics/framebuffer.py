@@ -0,0 +1,110 @@
+from OpenGL.GL import *
+import numpy as np
+
+from utils.gpu_memory import GPU_MEMORY
+
+
+class Framebuffer:
+    """
+        An offscreen render target with a color texture
+        and a depth/stencil renderbuffer.
+    """
+    __slots__ = ("fbo", "color", "depth", "width", "height", "owner")
+
+
+    def __init__(self, width: int, height: int, owner: str = "framebuffer"):
+        """
+            Allocate the render target.
+
+            Parameters:
+
+                width: width of the target in pixels.
+
+                height: height of the target in pixels.
+
+                owner: what the target's memory is accounted to.
+        """
+
+        self.owner = owner
+        self.fbo = None
+        self._allocate(width, height)
+
+    def _allocate(self, width: int, height: int) -> None:
+        """
+            Create the framebuffer and its attachments.
+        """
+
+        self.width = max(1, width)
+        self.height = max(1, height)
+
+        self.fbo = glGenFramebuffers(1)
+        glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+
+        self.color = glGenTextures(1)
+        glBindTexture(GL_TEXTURE_2D, self.color)
+        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA8,
+                    self.width, self.height, 0,
+                    GL_RGBA, GL_UNSIGNED_BYTE, None)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_EDGE)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP_TO_EDGE)
+        glFramebufferTexture2D(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0,
+                            GL_TEXTURE_2D, self.color, 0)
+        GPU_MEMORY.track_texture(self.color, self.width, self.height, GL_RGBA8, self.owner)
+
+        self.depth = glGenRenderbuffers(1)
+        glBindRenderbuffer(GL_RENDERBUFFER, self.depth)
+        glRenderbufferStorage(GL_RENDERBUFFER, GL_DEPTH24_STENCIL8,
+                            self.width, self.height)
+        glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_DEPTH_STENCIL_ATTACHMENT,
+                            GL_RENDERBUFFER, self.depth)
+        GPU_MEMORY.track_renderbuffer(
+            self.depth, self.width, self.height, GL_DEPTH24_STENCIL8, self.owner)
+
+        status = glCheckFramebufferStatus(GL_FRAMEBUFFER)
+        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+        if status != GL_FRAMEBUFFER_COMPLETE:
+            raise RuntimeError(f"Framebuffer is incomplete: {status}")
+
+    def resize(self, width: int, height: int) -> None:
+        """
+            Reallocate the target at a new size.
+        """
+
+        self.destroy()
+        self._allocate(width, height)
+
+    def bind(self) -> None:
+        """
+            Draw into the target.
+        """
+
+        glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+        glViewport(0, 0, self.width, self.height)
+
+    def read_pixels(self) -> np.ndarray:
+        """
+            Returns the target's color as a (height, width, 4) array,
+            top row first.
+        """
+
+        glBindFramebuffer(GL_READ_FRAMEBUFFER, self.fbo)
+        glReadBuffer(GL_COLOR_ATTACHMENT0)
+        glPixelStorei(GL_PACK_ALIGNMENT, 1)
+        data = glReadPixels(
+            0, 0, self.width, self.height, GL_RGBA, GL_UNSIGNED_BYTE)
+        pixels = np.frombuffer(data, dtype=np.uint8).reshape(
+            self.height, self.width, 4)
+        return pixels[::-1]
+
+    def destroy(self) -> None:
+        """
+            Free the framebuffer and its attachments.
+        """
+
+        glDeleteFramebuffers(1, [self.fbo])
+        glDeleteTextures(1, [self.color])
+        glDeleteRenderbuffers(1, [self.depth])
+        GPU_MEMORY.release("texture", self.color)
+        GPU_MEMORY.release("renderbuffer", self.depth)
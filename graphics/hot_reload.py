@@ -0,0 +1,277 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+import logging
+import os
+
+from OpenGL.GL import *
+
+from graphics.material import Material, load_image
+from graphics.mesh import MultiMaterialMesh
+from utils.file_watch import FileWatcher
+from utils.obj_loader import (
+    PROGRAM_CACHE, get_mtl_path, load_mesh, load_multi_material_mesh, submit_shaders)
+from utils.program_cache import PendingProgram, finish_program, is_parallel
+from utils.trace import TRACER
+
+log = logging.getLogger(__name__)
+
+############################## helper functions ###############################
+
+def parse_mesh(mesh) -> object:
+    """
+        Parse a mesh's obj file again, off the GL thread.
+
+        Returns:
+
+            The data its constructor takes.
+    """
+
+    if isinstance(mesh, MultiMaterialMesh):
+        return load_multi_material_mesh(mesh.filename)
+    return load_mesh(mesh.filename)
+
+def discard_programs(jobs: list) -> None:
+    """
+        Free programs, finished or pending, which won't be used.
+    """
+
+    for job in jobs:
+        if isinstance(job, PendingProgram):
+            job.discard()
+        else:
+            glDeleteProgram(job)
+
+class AssetReloader:
+    """
+        Rebuilds the engine's shaders, meshes and textures when the
+        files they were made from change. Only the affected resource
+        is rebuilt: files are parsed and decoded on a loader thread,
+        shaders compile on the driver's threads where it has them,
+        and the results are swapped in between frames by update.
+
+        Resources are named ("shader", pipeline type),
+        ("mesh", entity type) or ("texture", image path).
+    """
+    __slots__ = ("engine", "watcher", "dependents", "executor", "loads", "builds")
+
+
+    def __init__(self, engine, watch_files: bool = False):
+        """
+            Initialize the reloader.
+
+            Parameters:
+
+                engine: the GraphicsEngine whose assets are reloaded.
+
+                watch_files: poll the asset files for changes,
+                    otherwise only reload_shaders triggers a rebuild.
+        """
+
+        self.engine = engine
+        self.watcher = FileWatcher()
+        # file -> resources built from it
+        self.dependents: dict[str, set[tuple]] = {}
+        self.executor = ThreadPoolExecutor(
+            max_workers = 1, thread_name_prefix = "asset loader")
+        # resource -> its file being parsed or decoded
+        self.loads: dict[tuple, Future] = {}
+        # pipeline type -> (variant keys, programs or pending programs)
+        self.builds: dict[int, tuple[list[tuple], list]] = {}
+
+        if not watch_files:
+            return
+
+        for pipeline_type in engine.shaders:
+            self._track_shader(pipeline_type)
+        for entity_type in engine.meshes:
+            self._track_mesh(entity_type)
+        for material in engine.materials.values():
+            self._track_texture(material)
+        self.watcher.start()
+
+    def _watch(self, resource: tuple, paths) -> None:
+        """
+            Record the files a resource is built from,
+            replacing what was recorded before.
+        """
+
+        for dependents in self.dependents.values():
+            dependents.discard(resource)
+        for path in paths:
+            path = os.path.normpath(path)
+            self.dependents.setdefault(path, set()).add(resource)
+            self.watcher.watch(path)
+
+    def _track_shader(self, pipeline_type: int) -> None:
+
+        self._watch(
+            ("shader", pipeline_type),
+            self.engine.shaders[pipeline_type].get_dependencies())
+
+    def _track_mesh(self, entity_type: int) -> None:
+
+        mesh = self.engine.meshes[entity_type]
+        filename = getattr(mesh, "filename", None)
+        if filename is None:
+            return
+
+        paths = [filename]
+        mtl_path = get_mtl_path(filename)
+        if mtl_path is not None:
+            paths.append(mtl_path)
+        self._watch(("mesh", entity_type), paths)
+
+        if isinstance(mesh, MultiMaterialMesh):
+            for material in mesh.get_materials():
+                self._track_texture(material)
+
+    def _track_texture(self, material) -> None:
+
+        if isinstance(material, Material):
+            self._watch(("texture", material.filepath), [material.filepath])
+
+    def _get_textures(self, filepath: str) -> list[Material]:
+        """
+            Returns every material made from an image.
+        """
+
+        materials = list(self.engine.materials.values())
+        for mesh in self.engine.meshes.values():
+            if isinstance(mesh, MultiMaterialMesh):
+                materials.extend(mesh.get_materials())
+        return [
+            material for material in materials
+            if isinstance(material, Material) and material.filepath == filepath]
+
+    def request(self, resource: tuple) -> None:
+        """
+            Start rebuilding a resource, superseding any
+            rebuild of it still in progress.
+        """
+
+        kind, name = resource
+        if kind == "shader":
+            self._submit_shader(name)
+        elif kind == "mesh":
+            self.loads[resource] = self.executor.submit(
+                parse_mesh, self.engine.meshes[name])
+        elif kind == "texture":
+            self.loads[resource] = self.executor.submit(load_image, name)
+
+    def reload_shaders(self) -> None:
+        """
+            Rebuild every shader variant built so far.
+        """
+
+        for pipeline_type in self.engine.shaders:
+            self._submit_shader(pipeline_type)
+
+    def _submit_shader(self, pipeline_type: int) -> None:
+        """
+            Hand a pipeline's variants to the driver for rebuilding.
+            Variants which were never built will read the new
+            sources when they are.
+        """
+
+        previous = self.builds.pop(pipeline_type, None)
+        if previous is not None:
+            discard_programs(previous[1])
+
+        variants = self.engine.shaders[pipeline_type]
+        keys = variants.get_keys()
+        if not keys:
+            return
+
+        try:
+            jobs = submit_shaders([
+                (variants.vertex_filepath, variants.fragment_filepath, dict(key))
+                for key in keys])
+        except (OSError, RuntimeError) as error:
+            log.error("Reloading %s failed: %s", variants.fragment_filepath, error)
+            return
+        self.builds[pipeline_type] = (keys, jobs)
+
+    def update(self) -> None:
+        """
+            Start rebuilding whatever changed and swap in whatever
+            finished. Call between frames, on the GL thread.
+        """
+
+        for path in self.watcher.get_changes():
+            log.info("Changed: %s", path)
+            for resource in list(self.dependents.get(path, ())):
+                self.request(resource)
+
+        self._finish_loads()
+        self._finish_builds()
+
+    def _finish_loads(self) -> None:
+        """
+            Upload the meshes and textures the loader thread is done with.
+        """
+
+        for resource, future in list(self.loads.items()):
+            if not future.done():
+                continue
+            del self.loads[resource]
+
+            kind, name = resource
+            try:
+                data = future.result()
+            except Exception as error:
+                # a half saved file can fail to parse in any number of ways
+                log.error("Reloading %s failed: %s", name, error)
+                continue
+
+            with TRACER.span("reload", "reload", resource = resource):
+                if kind == "mesh":
+                    self.engine.replace_mesh(name, data)
+                    self._track_mesh(name)
+                else:
+                    for material in self._get_textures(name):
+                        material.upload(*data)
+
+    def _finish_builds(self) -> None:
+        """
+            Swap in the pipelines whose programs are all linked.
+            If any variant fails, the pipeline keeps its old programs.
+        """
+
+        parallel = is_parallel()
+        swapped = False
+        for pipeline_type, (keys, jobs) in list(self.builds.items()):
+            if parallel and any(
+                isinstance(job, PendingProgram) and not job.is_done() for job in jobs):
+                continue
+            del self.builds[pipeline_type]
+
+            programs = []
+            try:
+                for job in jobs:
+                    if isinstance(job, PendingProgram):
+                        job = finish_program(job, PROGRAM_CACHE)
+                    programs.append(job)
+            except RuntimeError as error:
+                log.error("%s", error)
+                discard_programs(programs + jobs[len(programs) + 1:])
+                continue
+
+            self.engine.shaders[pipeline_type].replace(dict(zip(keys, programs)))
+            swapped = True
+            if self.watcher.thread is not None:
+                # the sources may include different files now
+                self._track_shader(pipeline_type)
+
+        if swapped:
+            PROGRAM_CACHE.log_report("hot reload")
+
+    def destroy(self) -> None:
+        """
+            Stop watching and drop any rebuild in progress.
+        """
+
+        self.watcher.stop()
+        self.executor.shutdown(wait = False, cancel_futures = True)
+        self.loads.clear()
+        for _, jobs in self.builds.values():
+            discard_programs(jobs)
+        self.builds.clear()
@@ -1,36 +1,80 @@
+import logging
+
 from OpenGL.GL import *
-from PIL import Image
 
+from utils.gpu_memory import GPU_MEMORY
+from utils.trace import TRACER
+
+log = logging.getLogger(__name__)
+
+############################## helper functions ###############################
+
+def load_image(filepath: str) -> tuple[int, int, bytes]:
+    """
+        Decode an image file, safe to call off the GL thread.
+
+        Returns:
+
+            The width, height and RGBA pixels of the image.
+    """
+
+    # PIL is only needed once something is decoded
+    from PIL import Image
+
+    with Image.open(filepath, mode = "r") as img:
+        image_width,image_height = img.size
+        img = img.convert("RGBA")
+        return image_width, image_height, bytes(img.tobytes())
 
 class Material:
     """
         A basic texture.
     """
-    __slots__ = ("texture",)
+    __slots__ = ("texture", "filepath")
+
+    # shader variant symbols for textured surfaces
+    defines = {"TEXTURED": 1}
 
     
-    def __init__(self, filepath: str):
+    def __init__(self,
+        filepath: str, image: tuple[int, int, bytes] | None = None):
         """
             Initialize and load the texture.
 
             Parameters:
 
                 filepath: path to the image file.
+
+                image: the file already decoded by load_image.
         """
 
+        self.filepath = filepath
         self.texture = glGenTextures(1)
         glBindTexture(GL_TEXTURE_2D, self.texture)
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_REPEAT)
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_REPEAT)
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST_MIPMAP_LINEAR)
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
-        print(filepath)
-        with Image.open(filepath, mode = "r") as img:
-            image_width,image_height = img.size
-            img = img.convert("RGBA")
-            img_data = bytes(img.tobytes())
+        log.debug("Loading texture %s", filepath)
+        if image is None:
+            with TRACER.span("decode texture", file = filepath):
+                image = load_image(filepath)
+        self.upload(*image)
+
+    def upload(self, image_width: int, image_height: int, img_data: bytes) -> None:
+        """
+            Replace the texture's pixels, keeping its handle so
+            everything drawing with it picks up the new image.
+        """
+
+        glBindTexture(GL_TEXTURE_2D, self.texture)
+        with TRACER.span("upload texture", file = self.filepath):
             glTexImage2D(GL_TEXTURE_2D,0,GL_RGBA,image_width,image_height,0,GL_RGBA,GL_UNSIGNED_BYTE,img_data)
-        glGenerateMipmap(GL_TEXTURE_2D)
+        with TRACER.span("generate mipmaps", file = self.filepath):
+            glGenerateMipmap(GL_TEXTURE_2D)
+        GPU_MEMORY.track_texture(
+            self.texture, image_width, image_height, GL_RGBA, self.filepath,
+            mipmaps = True)
 
     def use(self) -> None:
         """
@@ -39,7 +83,6 @@ class Material:
 
         glActiveTexture(GL_TEXTURE0)
         glBindTexture(GL_TEXTURE_2D,self.texture)
-        glUniform1i(glGetUniformLocation(glGetInteger(GL_CURRENT_PROGRAM), "useTexture"), GL_TRUE)
 
 
     def destroy(self) -> None:
@@ -48,8 +91,11 @@ class Material:
         """
 
         glDeleteTextures(1, (self.texture,))
+        GPU_MEMORY.release("texture", self.texture)
 
 class ColorMaterial:
+    defines = {}
+
     def __init__(self, rgb: list[float]):
         self.color = rgb
 
@@ -57,8 +103,6 @@ class ColorMaterial:
         location = glGetUniformLocation(glGetInteger(GL_CURRENT_PROGRAM), "tintColor")
         glUniform3fv(location, 1, self.color)
 
-        use_texture_location = glGetUniformLocation(glGetInteger(GL_CURRENT_PROGRAM), "useTexture")
-        glUniform1i(use_texture_location, GL_FALSE)
         glUniform3fv(glGetUniformLocation(glGetInteger(GL_CURRENT_PROGRAM), "tint"), 1, self.color)
 
     def destroy(self):
@@ -1,9 +1,15 @@
+import logging
+
 from OpenGL.GL import *
 import numpy as np
 from utils.obj_loader import load_mesh
 from utils.obj_loader import load_multi_material_mesh
+from utils.bvh import TriangleBVH, load_or_build
+from utils.trace import TRACER
+from utils.gpu_memory import GPU_MEMORY
 from graphics.material import *
 
+log = logging.getLogger(__name__)
 
 
 class Mesh:
@@ -53,37 +59,167 @@ class Mesh:
         
         glDeleteVertexArrays(1,(self.vao,))
         glDeleteBuffers(1,(self.vbo,))
+        GPU_MEMORY.release("buffer", self.vbo)
+
+class DepthStream:
+    """
+        A mesh's positions alone, deduplicated and indexed, with a
+        vertex array of its own for passes which only write depth.
+        Every material's triangles are in it, so it draws in one call.
+    """
+    __slots__ = ("vao", "vbo", "ebo", "index_count", "lo", "hi", "owner")
+
+
+    def __init__(self, positions: np.ndarray | None = None, owner: str = "depth stream"):
+        """
+            Initialize the stream.
+
+            Parameters:
+
+                positions: (n, 3) corners of the triangles, three
+                    per triangle, repeated corners are merged.
+
+                owner: what the stream's memory is accounted to.
+        """
+
+        self.owner = owner
+
+        self.vao = glGenVertexArrays(1)
+        glBindVertexArray(self.vao)
+        self.vbo = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        #position only, 12 bytes a vertex
+        glEnableVertexAttribArray(0)
+        glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 12, ctypes.c_void_p(0))
+        self.ebo = glGenBuffers(1)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.ebo)
+        glBindVertexArray(0)
+
+        self.index_count = 0
+        self.lo = np.zeros(3, dtype=np.float32)
+        self.hi = np.zeros(3, dtype=np.float32)
+        if positions is not None:
+            self.upload(positions)
+
+    def upload(self, positions: np.ndarray) -> None:
+        """
+            Replace the stream's triangles.
+        """
+
+        positions = np.asarray(positions, dtype=np.float32).reshape(-1, 3)
+        vertices, indices = np.unique(positions, axis = 0, return_inverse = True)
+        vertices = np.ascontiguousarray(vertices, dtype=np.float32)
+        indices = indices.reshape(-1).astype(np.uint32)
+        self.index_count = len(indices)
+        if len(vertices):
+            self.lo = vertices.min(axis = 0)
+            self.hi = vertices.max(axis = 0)
+
+        glBindVertexArray(self.vao)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_STATIC_DRAW)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.ebo)
+        glBufferData(GL_ELEMENT_ARRAY_BUFFER, indices.nbytes, indices, GL_STATIC_DRAW)
+        glBindVertexArray(0)
+        GPU_MEMORY.track_buffer(self.vbo, vertices.nbytes, "depth positions", self.owner)
+        GPU_MEMORY.track_buffer(self.ebo, indices.nbytes, "depth indices", self.owner)
+
+    def draw(self) -> None:
+        """
+            Draw every triangle.
+        """
+
+        if self.index_count == 0:
+            return
+        glBindVertexArray(self.vao)
+        glDrawElements(GL_TRIANGLES, self.index_count, GL_UNSIGNED_INT, ctypes.c_void_p(0))
+
+    def destroy(self) -> None:
+        """
+            Free the stream's buffers.
+        """
+
+        glDeleteVertexArrays(1, (self.vao,))
+        glDeleteBuffers(2, (self.vbo, self.ebo))
+        GPU_MEMORY.release("buffer", self.vbo, self.ebo)
 
 class ObjMesh(Mesh):
     """
         A mesh which is initialized from an obj file.
     """
-    __slots__ = ("texture_path",)
+    __slots__ = ("filename", "texture_path", "vertices", "bvh", "depth")
 
 
-    def __init__(self, filename: str):
+    def __init__(self, filename: str, data: tuple | None = None):
         """
             Initialize the mesh.
+
+            Parameters:
+
+                filename: path to the obj file.
+
+                data: the file already parsed by load_mesh.
         """
-        print(f"Loading mesh from {filename}")
+        log.debug("Loading mesh from %s", filename)
         super().__init__()
-        print("init done")
 
+        self.filename = filename
         # x, y, z, s, t, nx, ny, nz
-        vertices, texture_path = load_mesh(filename)
-        print("texturepath= ", texture_path)
+        if data is None:
+            with TRACER.span("parse obj", file = filename):
+                data = load_mesh(filename)
+        vertices, texture_path = data
+        log.debug("%s uses texture %s", filename, texture_path)
         self.texture_path = texture_path or "gfx/wood.jpg"
         self.vertex_count = len(vertices)//8 
         vertices = np.array(vertices, dtype=np.float32)
+        # kept for static batching
+        self.vertices = vertices.reshape(-1, 8)
+        self.bvh: TriangleBVH | None = None
 
-        glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_STATIC_DRAW)
+        with TRACER.span("upload mesh", file = filename):
+            glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_STATIC_DRAW)
+            GPU_MEMORY.track_buffer(self.vbo, vertices.nbytes, "vertices", filename)
+            self.depth = DepthStream(self.vertices[:, 0:3], filename)
+
+    def render_depth(self) -> None:
+        """
+            Draw the mesh's positions only, for depth passes.
+        """
+
+        self.depth.draw()
+
+    def destroy(self) -> None:
+        """
+            Free any allocated memory.
+        """
+
+        super().destroy()
+        self.depth.destroy()
+
+    def get_triangles(self) -> np.ndarray:
+        """
+            Returns the (n, 3, 3) corners of every triangle.
+        """
+
+        return self.vertices[:, 0:3].reshape(-1, 3, 3)
+
+    def get_bvh(self) -> TriangleBVH:
+        """
+            Returns the mesh's triangle BVH, built or read
+            from the cache on first use.
+        """
+
+        if self.bvh is None:
+            self.bvh = load_or_build(self.get_triangles())
+        return self.bvh
 
 class RectMesh(Mesh):
     """
         A mesh which constructs its vertices to represent
         a rectangle.
     """
-    __slots__ = tuple()
+    __slots__ = ("size",)
 
 
     def __init__(self, w: float, h: float):
@@ -94,6 +230,8 @@ class RectMesh(Mesh):
 
         super().__init__()
 
+        self.size = (w, h)
+
         vertices = (
             0, -w/2,  h/2, 0, 0, 1, 0, 0,
             0, -w/2, -h/2, 0, 1, 1, 0, 0,
@@ -107,60 +245,313 @@ class RectMesh(Mesh):
         self.vertex_count = 6
         
         glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_STATIC_DRAW)
+        GPU_MEMORY.track_buffer(self.vbo, vertices.nbytes, "vertices", f"rect {w}x{h}")
+
+class SphereMesh(Mesh):
+    """
+        A low poly sphere, used as a light volume.
+        The faces circumscribe the unit sphere, so nothing inside
+        radius 1 is ever missed.
+    """
+    __slots__ = tuple()
+
+
+    def __init__(self, rings: int = 8, segments: int = 12):
+        """
+            Build the sphere.
+
+            Parameters:
+
+                rings: number of latitude bands.
+
+                segments: number of longitude bands.
+        """
+
+        super().__init__()
+
+        # push the vertices out so the flat faces enclose the unit sphere
+        radius = 1.0 / (np.cos(np.pi / rings) * np.cos(np.pi / segments))
+
+        phi = np.linspace(0, np.pi, rings + 1)
+        theta = np.linspace(0, 2 * np.pi, segments + 1)
+        corners = np.stack([
+            np.outer(np.sin(phi), np.cos(theta)),
+            np.outer(np.sin(phi), np.sin(theta)),
+            np.outer(np.cos(phi), np.ones_like(theta)),
+        ], axis = -1)
+
+        a = corners[:-1, :-1].reshape(-1, 3)
+        b = corners[1:, :-1].reshape(-1, 3)
+        c = corners[1:, 1:].reshape(-1, 3)
+        d = corners[:-1, 1:].reshape(-1, 3)
+        positions = np.stack([a, b, c, a, c, d], axis = 1).reshape(-1, 3)
+
+        # x, y, z, s, t, nx, ny, nz
+        vertices = np.zeros((len(positions), 8), dtype=np.float32)
+        vertices[:, 0:3] = radius * positions
+        vertices[:, 5:8] = positions
+        self.vertex_count = len(vertices)
+
+        glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_STATIC_DRAW)
+        GPU_MEMORY.track_buffer(self.vbo, vertices.nbytes, "vertices", "light volume")
+
+class ScreenMesh(Mesh):
+    """
+        A single triangle covering the whole screen,
+        for full screen passes.
+    """
+    __slots__ = tuple()
+
+
+    def __init__(self):
+        """
+            Build the triangle.
+        """
+
+        super().__init__()
+
+        vertices = np.array((
+            -1, -1, 0, 0, 0, 0, 0, 1,
+             3, -1, 0, 2, 0, 0, 0, 1,
+            -1,  3, 0, 0, 2, 0, 0, 1,
+        ), dtype=np.float32)
+        self.vertex_count = 3
+
+        glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_STATIC_DRAW)
+        GPU_MEMORY.track_buffer(self.vbo, vertices.nbytes, "vertices", "screen triangle")
 
 class MultiMaterialMesh:
-    def __init__(self, filename: str):
-        self.submeshes = []  # list of dicts with vao, vbo, vertex_count, texture
+    """
+        A mesh whose faces use several materials. Every group lives
+        in one shared vertex and index buffer, drawn as a table of
+        (offset, count, material) ranges.
+    """
+    __slots__ = ("filename", "vao", "vbo", "ebo", "vertices", "indices", "ranges", "runs", "index_count", "bvh", "depth")
 
-        
 
-        groups = load_multi_material_mesh(filename)
+    def __init__(self,
+        filename: str, groups: dict[str, dict] | None = None,
+        images: dict[str, tuple] | None = None):
+        """
+            Load the model and upload all of its groups at once.
 
-        for mat_name, data in groups.items():
-            vao = glGenVertexArrays(1)
-            vbo = glGenBuffers(1)
+            Parameters:
 
-            glBindVertexArray(vao)
-            glBindBuffer(GL_ARRAY_BUFFER, vbo)
+                filename: path to the obj file.
 
-            glEnableVertexAttribArray(0)
-            glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 32, ctypes.c_void_p(0))
-            glEnableVertexAttribArray(1)
-            glVertexAttribPointer(1, 2, GL_FLOAT, GL_FALSE, 32, ctypes.c_void_p(12))
-            glEnableVertexAttribArray(2)
-            glVertexAttribPointer(2, 3, GL_FLOAT, GL_FALSE, 32, ctypes.c_void_p(20))
+                groups: the file already parsed by
+                    load_multi_material_mesh.
 
-            vertices = np.array(data["vertices"], dtype=np.float32)
-            glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_STATIC_DRAW)
+                images: texture path -> the image already decoded
+                    by load_image, the rest are decoded here.
+        """
 
-            texture_path = data.get("texture")
-            color = data.get("color", [1.0, 1.0, 1.0])
-            print("texture_path= ", texture_path)
-            print("color= ", color)
+        self.filename = filename
+        if groups is None:
+            with TRACER.span("parse obj", file = filename):
+                groups = load_multi_material_mesh(filename)
+
+        # groups sharing a texture or color share one material
+        with TRACER.span("build materials", file = filename):
+            materials = {}
+            group_materials = []
+            group_vertices = []
+            for mat_name, data in groups.items():
+                vertices = np.array(data["vertices"], dtype=np.float32).reshape(-1, 8)
+                if len(vertices) == 0:
+                    continue
+
+                texture_path = data.get("texture")
+                color = data.get("color", [1.0, 1.0, 1.0])
+                key = ("texture", texture_path) if texture_path else ("color", tuple(color))
+                if key not in materials:
+                    log.debug(
+                        "%s: material %s, texture %s, color %s",
+                        filename, mat_name, texture_path, color)
+                    if texture_path:
+                        materials[key] = Material(
+                            texture_path, (images or {}).get(texture_path))
+                    else:
+                        materials[key] = ColorMaterial(color)
+                group_materials.append(materials[key])
+                group_vertices.append(vertices)
+
+        # order the groups so ranges sharing a material are consecutive,
+        # materials in the order the file first uses them, so the same
+        # file always gives the same buffers
+        first_use: dict[int, int] = {}
+        for i, material in enumerate(group_materials):
+            first_use.setdefault(id(material), i)
+        order = sorted(
+            range(len(group_materials)),
+            key = lambda i: first_use[id(group_materials[i])])
+        group_materials = [group_materials[i] for i in order]
+        group_vertices = [group_vertices[i] for i in order]
+
+        # x, y, z, s, t, nx, ny, nz, shared by every group
+        if group_vertices:
+            corners = np.concatenate(group_vertices)
+        else:
+            corners = np.zeros((0, 8), dtype=np.float32)
+        self.vertices, indices = np.unique(corners, axis = 0, return_inverse = True)
+        self.vertices = np.ascontiguousarray(self.vertices, dtype=np.float32)
+        self.indices = indices.reshape(-1).astype(np.uint32)
+        self.index_count = len(self.indices)
+
+        # (first index, index count, material)
+        self.ranges: list[tuple[int, int, Material | ColorMaterial]] = []
+        offset = 0
+        for material, vertices in zip(group_materials, group_vertices):
+            self.ranges.append((offset, len(vertices), material))
+            offset += len(vertices)
+        self.runs = self._make_runs()
+        self.bvh: TriangleBVH | None = None
+
+        with TRACER.span("upload mesh", file = filename):
+            self._upload()
+
+    def _upload(self) -> None:
+        """
+            Create the vertex array and its two buffers.
+        """
 
-            if texture_path:
-                material = Material(texture_path)
-            else:
-                material = ColorMaterial(color)
+        self.vao = glGenVertexArrays(1)
+        glBindVertexArray(self.vao)
+        self.vbo = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBufferData(GL_ARRAY_BUFFER, self.vertices.nbytes, self.vertices, GL_STATIC_DRAW)
+        #position
+        glEnableVertexAttribArray(0)
+        glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 32, ctypes.c_void_p(0))
+        #texture
+        glEnableVertexAttribArray(1)
+        glVertexAttribPointer(1, 2, GL_FLOAT, GL_FALSE, 32, ctypes.c_void_p(12))
+        #normal
+        glEnableVertexAttribArray(2)
+        glVertexAttribPointer(2, 3, GL_FLOAT, GL_FALSE, 32, ctypes.c_void_p(20))
+        self.ebo = glGenBuffers(1)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.ebo)
+        glBufferData(GL_ELEMENT_ARRAY_BUFFER, self.indices.nbytes, self.indices, GL_STATIC_DRAW)
+        glBindVertexArray(0)
+        GPU_MEMORY.track_buffer(self.vbo, self.vertices.nbytes, "vertices", self.filename)
+        GPU_MEMORY.track_buffer(self.ebo, self.indices.nbytes, "indices", self.filename)
+
+        # corners differing only in texture coordinates or normals
+        # are one vertex here, and the materials' ranges are merged
+        self.depth = DepthStream(self.vertices[self.indices, 0:3], self.filename)
+
+    def _make_runs(self) -> list[tuple]:
+        """
+            Returns the ranges merged into runs of consecutive ranges
+            sharing a material, as (material, counts, byte offsets)
+            ready for glMultiDrawElements.
+        """
+
+        runs = []
+        i = 0
+        while i < len(self.ranges):
+            material = self.ranges[i][2]
+            j = i
+            while j < len(self.ranges) and self.ranges[j][2] is material:
+                j += 1
+            counts = np.array(
+                [count for _, count, _ in self.ranges[i:j]], dtype=np.int32)
+            offsets = (ctypes.c_void_p * (j - i))(
+                *(first * 4 for first, _, _ in self.ranges[i:j]))
+            runs.append((material, counts, offsets))
+            i = j
+        return runs
+
+    def get_materials(self) -> list[Material | ColorMaterial]:
+        """
+            Returns each distinct material of the mesh.
+        """
+
+        return [material for material, _, _ in self.runs]
 
-            self.submeshes.append({
-                "vao": vao,
-                "vbo": vbo,
-                "count": len(vertices) // 8,
-                "material": material
-            })
+    def get_groups(self) -> list[tuple[Material | ColorMaterial, np.ndarray]]:
+        """
+            Returns each material with its (n, 8) vertex data.
+        """
 
-    def render(self):
-        for sub in self.submeshes:
-            sub["material"].use()
-            glBindVertexArray(sub["vao"])
-            glDrawArrays(GL_TRIANGLES, 0, sub["count"])
+        # ranges of one material are consecutive in the index buffer
+        spans = {}
+        for first, count, material in self.ranges:
+            start, _ = spans.get(material, (first, first))
+            spans[material] = (start, first + count)
+        return [
+            (material, self.vertices[self.indices[start:end]])
+            for material, (start, end) in spans.items()
+        ]
+
+    def get_triangles(self) -> np.ndarray:
+        """
+            Returns the (n, 3, 3) corners of every triangle,
+            in index buffer order.
+        """
+
+        return self.vertices[self.indices, 0:3].reshape(-1, 3, 3)
+
+    def get_bvh(self) -> TriangleBVH:
+        """
+            Returns the mesh's triangle BVH, built or read
+            from the cache on first use.
+        """
+
+        if self.bvh is None:
+            self.bvh = load_or_build(self.get_triangles())
+        return self.bvh
+
+    def get_range(self, triangle: int) -> tuple[int, Material | ColorMaterial]:
+        """
+            Returns which range, and so which material,
+            a triangle belongs to.
+        """
+
+        first = 3 * triangle
+        for i, (start, count, material) in enumerate(self.ranges):
+            if start <= first < start + count:
+                return i, material
+        raise IndexError(f"{self.filename} has no triangle {triangle}")
+
+    def render(self, bind_material = None) -> None:
+        """
+            Draw the mesh.
+
+            Parameters:
+
+                bind_material: called with each range's material before
+                    it is drawn. Without it the whole mesh is one draw call.
+        """
+
+        glBindVertexArray(self.vao)
+        if bind_material is None:
+            glDrawElements(GL_TRIANGLES, self.index_count, GL_UNSIGNED_INT, ctypes.c_void_p(0))
+            return
+
+        for material, counts, offsets in self.runs:
+            bind_material(material)
+            glMultiDrawElements(GL_TRIANGLES, counts, GL_UNSIGNED_INT, offsets, len(counts))
+
+    def render_depth(self) -> None:
+        """
+            Draw the mesh's positions only, in one call and
+            without materials, for depth passes.
+        """
+
+        self.depth.draw()
+
+    def destroy(self) -> None:
+        """
+            Free the whole model.
+        """
 
-    def destroy(self):
-        for sub in self.submeshes:
-            glDeleteVertexArrays(1, (sub["vao"],))
-            glDeleteBuffers(1, (sub["vbo"],))
-            sub["material"].destroy()
+        glDeleteVertexArrays(1, (self.vao,))
+        glDeleteBuffers(2, (self.vbo, self.ebo))
+        GPU_MEMORY.release("buffer", self.vbo, self.ebo)
+        self.depth.destroy()
+        for material in self.get_materials():
+            material.destroy()
 
 
 
@@ -187,5 +578,6 @@ class SkyboxMesh(Mesh):
         glBindVertexArray(self.vao)
         glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
         glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_STATIC_DRAW)
+        GPU_MEMORY.track_buffer(self.vbo, vertices.nbytes, "vertices", "skybox")
         glEnableVertexAttribArray(0)
         glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 0, None)
@@ -0,0 +1,223 @@
+from OpenGL.GL import *
+from collections import deque
+from contextlib import contextmanager
+import logging
+
+import numpy as np
+
+from core.constants import *
+
+log = logging.getLogger(__name__)
+
+
+class DepthPrepass:
+    """
+        Decides whether the forward pass lays down the scene's depth
+        first, so the lit pass only shades the visible surface of
+        each pixel, and measures how much shading that saves.
+
+        Occlusion queries count the samples passing the depth test:
+        during the prepass, that's every fragment the lit pass would
+        shade without it, and during the lit pass after it, the
+        visible ones. Their ratio is the scene's overdraw. In the
+        automatic mode the prepass turns on when the overdraw is high
+        enough to pay for the extra geometry pass, and while it is
+        off it still runs now and then to keep the measurement fresh.
+        Query results are read back a few frames late, and only once
+        available, so measuring never stalls the pipeline.
+    """
+    __slots__ = (
+        "mode", "enabled", "depth_func", "enable_above", "disable_below",
+        "probe_interval", "latency", "frame", "since_probe",
+        "fragments", "visible", "shaded", "overdraw",
+        "_free_queries", "_pending", "_current")
+
+
+    def __init__(self,
+        mode: int = DEPTH_PREPASS["AUTO"], depth_func: int = GL_LEQUAL,
+        enable_above: float = PREPASS_ENABLE_OVERDRAW,
+        disable_below: float = PREPASS_DISABLE_OVERDRAW,
+        probe_interval: int = 120, latency: int = 3):
+        """
+            Initialize the prepass, off until overdraw is measured.
+
+            Parameters:
+
+                mode: one of DEPTH_PREPASS, always off, always on
+                    or following the measured overdraw.
+
+                depth_func: the lit pass's depth test after a prepass,
+                    GL_EQUAL or GL_LEQUAL.
+
+                enable_above, disable_below: overdraw at which the
+                    automatic mode turns the prepass on and off.
+
+                probe_interval: frames between the measuring
+                    prepasses while the prepass is off.
+
+                latency: number of frames to wait before asking
+                    for a query's result.
+        """
+
+        if disable_below > enable_above:
+            raise ValueError("The prepass would turn off above the overdraw it turns on at")
+
+        self.mode = mode
+        self.enabled = mode == DEPTH_PREPASS["ON"]
+        self.depth_func = depth_func
+        self.enable_above = enable_above
+        self.disable_below = disable_below
+        self.probe_interval = probe_interval
+        self.latency = latency
+        self.frame = 0
+        self.since_probe = 0
+
+        # fragments passing the depth test in draw order, visible pixels
+        # and fragments actually shaded, in the last measured frame
+        self.fragments: int | None = None
+        self.visible: int | None = None
+        self.shaded: int | None = None
+        self.overdraw: float | None = None
+
+        self._free_queries: list[int] = []
+        # (frame, whether the prepass ran, measurement name -> query)
+        self._pending: deque[tuple[int, bool, dict[str, int]]] = deque()
+        self._current: tuple[bool, dict[str, int]] | None = None
+
+    def set_mode(self, mode: int) -> None:
+        """
+            Force the prepass on or off, or let overdraw decide.
+        """
+
+        self.mode = mode
+        if mode != DEPTH_PREPASS["AUTO"]:
+            self.enabled = mode == DEPTH_PREPASS["ON"]
+
+    def should_run(self) -> bool:
+        """
+            Returns whether this frame's forward pass draws the
+            prepass. Call once per forward frame.
+        """
+
+        run = self.enabled
+        if not run and self.mode == DEPTH_PREPASS["AUTO"]:
+            # nothing tells how many pixels are visible but a prepass
+            self.since_probe += 1
+            if self.visible is None or self.since_probe >= self.probe_interval:
+                self.since_probe = 0
+                run = True
+        self._current = (run, {})
+        return run
+
+    @contextmanager
+    def measure(self, name: str):
+        """
+            Count the samples passing the depth test inside
+            the with block, as "depth" or "lit".
+        """
+
+        query = self._acquire_query()
+        glBeginQuery(GL_SAMPLES_PASSED, query)
+        try:
+            yield
+        finally:
+            glEndQuery(GL_SAMPLES_PASSED)
+            if self._current is not None:
+                self._current[1][name] = query
+
+    def end_frame(self) -> None:
+        """
+            Mark the end of a frame and take in any
+            measurements which have arrived.
+        """
+
+        if self._current is not None:
+            self._pending.append((self.frame, *self._current))
+            self._current = None
+        self.frame += 1
+
+        available = np.zeros(1, dtype=np.int32)
+        result = np.zeros(1, dtype=np.uint64)
+        while self._pending:
+            frame, ran, queries = self._pending[0]
+            if self.frame - frame < self.latency:
+                break
+            samples = {}
+            for name, query in queries.items():
+                glGetQueryObjectiv(query, GL_QUERY_RESULT_AVAILABLE, available)
+                if not available[0]:
+                    # queries finish in order, so the rest aren't ready either
+                    return
+                glGetQueryObjectui64v(query, GL_QUERY_RESULT, result)
+                samples[name] = int(result[0])
+            self._pending.popleft()
+            self._free_queries.extend(queries.values())
+            self._update(ran, samples)
+
+    def _update(self, ran: bool, samples: dict[str, int]) -> None:
+        """
+            Take in one frame's sample counts and, in the
+            automatic mode, turn the prepass on or off.
+        """
+
+        if "lit" not in samples:
+            return
+        self.shaded = samples["lit"]
+        if ran and "depth" in samples:
+            self.fragments = samples["depth"]
+            self.visible = samples["lit"]
+        else:
+            self.fragments = samples["lit"]
+        if self.visible is None:
+            return
+        self.overdraw = self.fragments / max(1, self.visible)
+
+        if self.mode != DEPTH_PREPASS["AUTO"]:
+            return
+        if not self.enabled and self.overdraw > self.enable_above:
+            self.enabled = True
+            log.info("Depth prepass on, overdraw %.2f", self.overdraw)
+        elif self.enabled and self.overdraw < self.disable_below:
+            self.enabled = False
+            self.since_probe = 0
+            log.info("Depth prepass off, overdraw %.2f", self.overdraw)
+
+    def stats(self) -> dict[str, object]:
+        """
+            Returns the last measurement: whether the prepass is on,
+            the overdraw, and the fragment counts behind it.
+        """
+
+        return {
+            "mode": [name for name, mode in DEPTH_PREPASS.items() if mode == self.mode][0],
+            "enabled": self.enabled,
+            "overdraw": self.overdraw,
+            "fragments": self.fragments,
+            "visible": self.visible,
+            "shaded": self.shaded,
+        }
+
+    def _acquire_query(self) -> int:
+        """
+            Returns a query object which isn't in flight.
+        """
+
+        if self._free_queries:
+            return self._free_queries.pop()
+        return int(glGenQueries(1))
+
+    def destroy(self) -> None:
+        """
+            Free the query objects.
+        """
+
+        queries = list(self._free_queries)
+        for _, _, pending in self._pending:
+            queries.extend(pending.values())
+        if self._current is not None:
+            queries.extend(self._current[1].values())
+        if queries:
+            glDeleteQueries(len(queries), queries)
+        self._free_queries = []
+        self._pending.clear()
+        self._current = None
@@ -0,0 +1,225 @@
+from OpenGL.GL import *
+from collections import deque
+import logging
+
+import numpy as np
+
+from core.constants import *
+
+log = logging.getLogger(__name__)
+
+# how quickly the GPU time estimate follows the measurements, per frame
+SMOOTHING = 0.2
+# fraction of the target a larger scale has to be expected to fit in
+HEADROOM = 0.85
+
+
+class DynamicResolution:
+    """
+        Picks the scale of the window the scene is drawn at, to hold
+        a target GPU frame time. The frame's GPU time is measured
+        with a pair of timestamp queries, read back a few frames late
+        so measuring never stalls the pipeline.
+
+        The scale only moves between a few fixed steps, so render
+        targets are reallocated rarely. Over the target, it drops
+        straight to the largest step expected to fit; under it, it
+        climbs one step at a time, once the next step is expected
+        to fit with room to spare. After each change it waits for
+        measurements taken at the new scale.
+    """
+    __slots__ = (
+        "enabled", "target", "steps", "step", "native_overlays",
+        "latency", "cooldown", "frame", "changed_at", "gpu_time",
+        "_free_queries", "_pending", "_start")
+
+
+    def __init__(self,
+        enabled: bool = True, target: float = DYNAMIC_RESOLUTION_TARGET,
+        steps: tuple[float, ...] = DYNAMIC_RESOLUTION_STEPS,
+        native_overlays: bool = True, latency: int = 3, cooldown: int = 30):
+        """
+            Initialize the controller, at full resolution.
+
+            Parameters:
+
+                enabled: whether the scale follows the frame time,
+                    otherwise it stays at full resolution.
+
+                target: GPU frame time to hold, in milliseconds.
+
+                steps: the scales allowed, smallest first.
+
+                native_overlays: draw sprites after upscaling,
+                    at the window's resolution.
+
+                latency: number of frames to wait before asking
+                    for a query's result.
+
+                cooldown: frames to wait after changing the scale
+                    before changing it again.
+        """
+
+        self.enabled = enabled
+        self.target = target
+        self.steps = tuple(sorted(steps))
+        self.step = len(self.steps) - 1
+        self.native_overlays = native_overlays
+        self.latency = latency
+        self.cooldown = cooldown
+        self.frame = 0
+        self.changed_at = 0
+        # smoothed GPU frame time at the current scale, in milliseconds
+        self.gpu_time: float | None = None
+
+        self._free_queries: list[int] = []
+        # (frame, start query, end query)
+        self._pending: deque[tuple[int, int, int]] = deque()
+        self._start: int | None = None
+
+    @property
+    def scale(self) -> float:
+        """
+            The fraction of the window's width and height drawn.
+        """
+
+        return self.steps[self.step] if self.enabled else 1.0
+
+    def get_size(self, width: int, height: int) -> tuple[int, int]:
+        """
+            Returns the size the scene is drawn at, for a window size.
+        """
+
+        scale = self.scale
+        return max(1, round(width * scale)), max(1, round(height * scale))
+
+    def set_enabled(self, enabled: bool) -> None:
+        """
+            Let the scale follow the frame time, or go back
+            to full resolution.
+        """
+
+        self.enabled = enabled
+        self.step = len(self.steps) - 1
+        self.changed_at = self.frame
+        self.gpu_time = None
+
+    def begin_frame(self) -> None:
+        """
+            Mark the start of the frame's GPU work.
+        """
+
+        if not self.enabled:
+            return
+        self._start = self._acquire_query()
+        glQueryCounter(self._start, GL_TIMESTAMP)
+
+    def end_frame(self) -> bool:
+        """
+            Mark the end of the frame's GPU work, take in any
+            measurements which have arrived and adjust the scale.
+
+            Returns:
+
+                Whether the scale changed, so the render targets
+                need reallocating.
+        """
+
+        if self._start is not None:
+            end = self._acquire_query()
+            glQueryCounter(end, GL_TIMESTAMP)
+            self._pending.append((self.frame, self._start, end))
+            self._start = None
+        self.frame += 1
+
+        available = np.zeros(1, dtype=np.int32)
+        start_time = np.zeros(1, dtype=np.uint64)
+        end_time = np.zeros(1, dtype=np.uint64)
+        while self._pending:
+            frame, start, end = self._pending[0]
+            if self.frame - frame < self.latency:
+                break
+            glGetQueryObjectiv(end, GL_QUERY_RESULT_AVAILABLE, available)
+            if not available[0]:
+                # queries finish in order, so the rest aren't ready either
+                break
+            glGetQueryObjectui64v(start, GL_QUERY_RESULT, start_time)
+            glGetQueryObjectui64v(end, GL_QUERY_RESULT, end_time)
+            self._pending.popleft()
+            self._free_queries.extend((start, end))
+            # frames drawn before the last change say nothing about this scale
+            if frame >= self.changed_at:
+                self._record((int(end_time[0]) - int(start_time[0])) / 1e6)
+
+        if not self.enabled:
+            return False
+        return self._adjust()
+
+    def _record(self, elapsed: float) -> None:
+        """
+            Add a frame's GPU time, in milliseconds, to the estimate.
+        """
+
+        if self.gpu_time is None:
+            self.gpu_time = elapsed
+        else:
+            self.gpu_time += SMOOTHING * (elapsed - self.gpu_time)
+
+    def _get_expected_time(self, step: int) -> float:
+        """
+            Returns the GPU time expected at another step, taking
+            the cost to follow the number of pixels drawn.
+        """
+
+        return self.gpu_time * (self.steps[step] / self.steps[self.step]) ** 2
+
+    def _adjust(self) -> bool:
+        """
+            Move to another step if the frame time calls for it.
+        """
+
+        if self.gpu_time is None or self.frame - self.changed_at < self.cooldown:
+            return False
+
+        step = self.step
+        if self.gpu_time > self.target:
+            step = max(0, step - 1)
+            while step > 0 and self._get_expected_time(step) > self.target * HEADROOM:
+                step -= 1
+        elif step + 1 < len(self.steps) \
+            and self._get_expected_time(step + 1) < self.target * HEADROOM:
+            step += 1
+        if step == self.step:
+            return False
+
+        log.debug("Render scale %.3f -> %.3f at %.2f ms",
+            self.steps[self.step], self.steps[step], self.gpu_time)
+        self.step = step
+        self.changed_at = self.frame
+        self.gpu_time = None
+        return True
+
+    def _acquire_query(self) -> int:
+        """
+            Returns a query object which isn't in flight.
+        """
+
+        if self._free_queries:
+            return self._free_queries.pop()
+        return int(glGenQueries(1))
+
+    def destroy(self) -> None:
+        """
+            Free the query objects.
+        """
+
+        queries = list(self._free_queries)
+        for _, start, end in self._pending:
+            queries.extend((start, end))
+        if self._start is not None:
+            queries.append(self._start)
+        if queries:
+            glDeleteQueries(len(queries), queries)
+        self._free_queries = []
+        self._pending.clear()
+        self._start = None
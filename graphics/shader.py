@@ -1,5 +1,8 @@
 from OpenGL.GL import *
-from utils.obj_loader import create_shader
+import numpy as np
+from core.constants import UNIFORM_TYPE
+from utils.glsl import load_source
+from utils.obj_loader import create_shader, create_shaders
 
 
 class Shader:
@@ -9,7 +12,9 @@ class Shader:
     __slots__ = ("program", "single_uniforms", "multi_uniforms")
 
 
-    def __init__(self, vertex_filepath: str, fragment_filepath: str):
+    def __init__(self, 
+        vertex_filepath: str, fragment_filepath: str,
+        program: int | None = None):
         """
             Initialize the shader.
 
@@ -18,9 +23,14 @@ class Shader:
                 vertex_filepath: filepath to the vertex source code.
 
                 fragment_filepath: filepath to the fragment source code.
+
+                program: an already built program for these sources,
+                    from create_shaders.
         """
 
-        self.program = create_shader(vertex_filepath, fragment_filepath)
+        if program is None:
+            program = create_shader(vertex_filepath, fragment_filepath)
+        self.program = program
 
         self.single_uniforms: dict[int, int] = {}
         self.multi_uniforms: dict[int, list[int]] = {}
@@ -69,6 +79,82 @@ class Shader:
 
         return self.multi_uniforms[uniform_type][index]
 
+    def bind_uniform_block(self,
+        block_name: str, binding: int,
+        layout: dict[str, int], size: int) -> bool:
+        """
+            Attach a uniform block to a binding point, after checking
+            that the program's layout of the block matches ours.
+
+            Parameters:
+
+                block_name: name of the block in the shader source.
+
+                binding: uniform buffer binding point.
+
+                layout: expected byte offset of each member.
+
+                size: expected size of the block in bytes.
+
+            Returns:
+
+                Whether the program uses the block.
+        """
+
+        index = glGetUniformBlockIndex(self.program, block_name)
+        if index == GL_INVALID_INDEX:
+            return False
+
+        data_size = np.zeros(1, dtype=np.int32)
+        glGetActiveUniformBlockiv(
+            self.program, index, GL_UNIFORM_BLOCK_DATA_SIZE, data_size)
+        if data_size[0] < size:
+            raise RuntimeError(
+                f"{block_name}: program block is {data_size[0]} bytes, "
+                f"expected at least {size}")
+
+        for name, offset in self._get_block_member_offsets(index).items():
+            expected = layout.get(name)
+            if expected is None:
+                raise RuntimeError(
+                    f"{block_name}: unexpected member {name}")
+            if offset != expected:
+                raise RuntimeError(
+                    f"{block_name}: {name} is at offset {offset}, "
+                    f"expected {expected}")
+
+        glUniformBlockBinding(self.program, index, binding)
+        return True
+
+    def _get_block_member_offsets(self, block_index: int) -> dict[str, int]:
+        """
+            Returns the byte offset of every active uniform
+            belonging to the given block.
+        """
+
+        count = glGetProgramiv(self.program, GL_ACTIVE_UNIFORMS)
+        if count == 0:
+            return {}
+
+        indices = np.arange(count, dtype=np.uint32)
+        block_indices = np.zeros(count, dtype=np.int32)
+        offsets = np.zeros(count, dtype=np.int32)
+        glGetActiveUniformsiv(
+            self.program, count, indices, GL_UNIFORM_BLOCK_INDEX, block_indices)
+        glGetActiveUniformsiv(
+            self.program, count, indices, GL_UNIFORM_OFFSET, offsets)
+
+        members = {}
+        for i in range(count):
+            if block_indices[i] != block_index:
+                continue
+            name = glGetActiveUniform(self.program, i)[0]
+            if isinstance(name, bytes):
+                name = name.decode()
+            # the struct members of an array come back as "Lights[0].color"
+            members[name] = int(offsets[i])
+        return members
+
     def use(self) -> None:
         """
             Use the program.
@@ -82,3 +168,185 @@ class Shader:
         """
 
         glDeleteProgram(self.program)
+
+class ShaderVariants:
+    """
+        The permutations of one pair of shader sources, each built
+        the first time it is asked for and kept afterwards.
+    """
+    __slots__ = ("vertex_filepath", "fragment_filepath", "defines", "variants", "on_create")
+
+
+    def __init__(self, 
+        vertex_filepath: str, fragment_filepath: str,
+        defines: dict[str, object] | None = None, on_create = None):
+        """
+            Initialize the variant set.
+
+            Parameters:
+
+                vertex_filepath: filepath to the vertex source code.
+
+                fragment_filepath: filepath to the fragment source code.
+
+                defines: symbols every variant gets.
+
+                on_create: called with each new variant, to set its
+                    one time uniforms and cache its locations.
+        """
+
+        self.vertex_filepath = vertex_filepath
+        self.fragment_filepath = fragment_filepath
+        self.defines = defines or {}
+        self.variants: dict[tuple, Shader] = {}
+        self.on_create = on_create
+
+    def _get_key(self, defines: dict[str, object]) -> tuple:
+
+        return tuple(sorted({**self.defines, **defines}.items()))
+
+    def get(self, defines: dict[str, object] | None = None) -> Shader:
+        """
+            Returns the variant for the given symbols, building it
+            if this is the first time.
+        """
+
+        key = self._get_key(defines or {})
+        shader = self.variants.get(key)
+        if shader is None:
+            shader = Shader(
+                self.vertex_filepath, self.fragment_filepath,
+                create_shader(self.vertex_filepath, self.fragment_filepath, dict(key)))
+            self._add(key, shader)
+        return shader
+
+    def build(self, permutations: list[dict[str, object]]) -> None:
+        """
+            Build several variants ahead of time, in one batch so
+            they can compile side by side.
+        """
+
+        keys = []
+        for defines in permutations:
+            key = self._get_key(defines)
+            if key not in self.variants and key not in keys:
+                keys.append(key)
+        if not keys:
+            return
+
+        programs = create_shaders(
+            [(self.vertex_filepath, self.fragment_filepath, dict(key)) for key in keys])
+        for key, program in zip(keys, programs):
+            self._add(key, Shader(self.vertex_filepath, self.fragment_filepath, program))
+
+    def _add(self, key: tuple, shader: Shader) -> None:
+
+        self.variants[key] = shader
+        if self.on_create is not None:
+            self.on_create(shader)
+
+    def get_keys(self) -> list[tuple]:
+        """
+            Returns the keys of the variants built so far.
+        """
+
+        return list(self.variants)
+
+    def get_dependencies(self) -> set[str]:
+        """
+            Returns every file the variants are built from,
+            included files too.
+        """
+
+        dependencies = set()
+        for filepath in (self.vertex_filepath, self.fragment_filepath):
+            dependencies.update(load_source(filepath)[1])
+        return dependencies
+
+    def replace(self, programs: dict[tuple, int]) -> None:
+        """
+            Swap in rebuilt programs for existing variants,
+            freeing the old ones.
+
+            Parameters:
+
+                programs: variant key -> its new program.
+        """
+
+        for key, program in programs.items():
+            old = self.variants.pop(key, None)
+            if old is not None:
+                old.destroy()
+            self._add(key, Shader(self.vertex_filepath, self.fragment_filepath, program))
+
+    def destroy(self) -> None:
+        """
+            Free every variant.
+        """
+
+        for shader in self.variants.values():
+            shader.destroy()
+        self.variants.clear()
+
+class ShaderBinder:
+    """
+        Tracks the program in use during a pass and switches variants
+        as materials ask for them, carrying the model matrix over
+        to each newly bound program.
+    """
+    __slots__ = ("variants", "defines", "shader", "model")
+
+
+    def __init__(self, variants: ShaderVariants, defines: dict[str, object] | None = None):
+        """
+            Start a pass.
+
+            Parameters:
+
+                variants: the pass's shader variants.
+
+                defines: the pass wide symbols, e.g. shadows or light count.
+        """
+
+        self.variants = variants
+        self.defines = defines or {}
+        self.shader: Shader | None = None
+        self.model: np.ndarray | None = None
+
+    def use(self, defines: dict[str, object] | None = None) -> Shader:
+        """
+            Make the variant for the pass's symbols plus the given
+            ones current, returning it.
+        """
+
+        shader = self.variants.get({**self.defines, **(defines or {})})
+        if shader is not self.shader:
+            shader.use()
+            self.shader = shader
+            if self.model is not None:
+                self._upload_model()
+        return shader
+
+    def set_model(self, model: np.ndarray) -> None:
+        """
+            Set the model matrix of the following draws.
+        """
+
+        if self.shader is None:
+            self.use()
+        self.model = model
+        self._upload_model()
+
+    def _upload_model(self) -> None:
+
+        location = self.shader.single_uniforms.get(UNIFORM_TYPE["MODEL"], -1)
+        if location != -1:
+            glUniformMatrix4fv(location, 1, GL_FALSE, self.model)
+
+    def bind_material(self, material) -> None:
+        """
+            Switch to the material's variant and arm the material.
+        """
+
+        self.use(material.defines)
+        material.use()
@@ -1,18 +1,25 @@
 from OpenGL.GL import *
-from PIL import Image
+
+from utils.gpu_memory import GPU_MEMORY
+from utils.trace import TRACER
 
 class Skybox:
     def __init__(self, faces: list[str]):
+        from PIL import Image
+
         self.texture_id = glGenTextures(1)
         glBindTexture(GL_TEXTURE_CUBE_MAP, self.texture_id)
 
         for i, face in enumerate(faces):
-            with Image.open(face) as img:
+            with TRACER.span("decode texture", file = face), Image.open(face) as img:
                 img = img.convert("RGB")
                 img_data = img.tobytes()
                 width, height = img.size
+            with TRACER.span("upload texture", file = face):
                 glTexImage2D(GL_TEXTURE_CUBE_MAP_POSITIVE_X + i, 0, GL_RGB,
                              width, height, 0, GL_RGB, GL_UNSIGNED_BYTE, img_data)
+        GPU_MEMORY.track_texture(
+            self.texture_id, width, height, GL_RGB, "skybox", layers = len(faces))
 
         glTexParameteri(GL_TEXTURE_CUBE_MAP, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
         glTexParameteri(GL_TEXTURE_CUBE_MAP, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
@@ -25,3 +32,4 @@ class Skybox:
 
     def destroy(self):
         glDeleteTextures(1, [self.texture_id])
+        GPU_MEMORY.release("texture", self.texture_id)
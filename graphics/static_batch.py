@@ -0,0 +1,378 @@
+from OpenGL.GL import *
+import numpy as np
+
+from entities.base import Entity
+from graphics.mesh import DepthStream, Mesh, MultiMaterialMesh, ObjMesh
+from utils.frustum import aabb_in_frustum
+from utils.gpu_memory import GPU_MEMORY
+
+IDENTITY = np.identity(4, dtype=np.float32)
+
+
+def transform_vertices(vertices: np.ndarray, model: np.ndarray) -> np.ndarray:
+    """
+        Returns a copy of (n, 8) vertex data moved into world space.
+
+        Parameters:
+
+            vertices: x, y, z, s, t, nx, ny, nz rows.
+
+            model: the model to world transform, as built by
+                Entity.get_model_transform.
+    """
+
+    result = vertices.copy()
+    rotation = model[:3, :3]
+    result[:, 0:3] = vertices[:, 0:3] @ rotation + model[3, :3]
+    # normals take the inverse transpose, in case of scaling
+    normal_matrix = np.linalg.inv(rotation).T
+    normals = vertices[:, 5:8] @ normal_matrix
+    lengths = np.linalg.norm(normals, axis = 1, keepdims = True)
+    result[:, 5:8] = normals / np.maximum(lengths, 1e-12)
+    return result
+
+class StaticBatch:
+    """
+        The world space geometry of every static entity
+        sharing one material, in a single buffer.
+    """
+    __slots__ = ("material", "vao", "vbo", "vertex_count", "lo", "hi")
+
+
+    def __init__(self, material):
+        """
+            Initialize an empty batch.
+
+            Parameters:
+
+                material: the material every vertex is drawn with.
+        """
+
+        self.material = material
+        self.vertex_count = 0
+        self.lo = np.zeros(3, dtype=np.float32)
+        self.hi = np.zeros(3, dtype=np.float32)
+
+        # x, y, z, s, t, nx, ny, nz
+        self.vao = glGenVertexArrays(1)
+        glBindVertexArray(self.vao)
+        self.vbo = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        #position
+        glEnableVertexAttribArray(0)
+        glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 32, ctypes.c_void_p(0))
+        #texture
+        glEnableVertexAttribArray(1)
+        glVertexAttribPointer(1, 2, GL_FLOAT, GL_FALSE, 32, ctypes.c_void_p(12))
+        #normal
+        glEnableVertexAttribArray(2)
+        glVertexAttribPointer(2, 3, GL_FLOAT, GL_FALSE, 32, ctypes.c_void_p(20))
+
+    def upload(self, vertices: np.ndarray) -> None:
+        """
+            Replace the batch's geometry.
+
+            Parameters:
+
+                vertices: (n, 8) world space vertex data.
+        """
+
+        vertices = np.ascontiguousarray(vertices, dtype=np.float32)
+        self.vertex_count = len(vertices)
+        if self.vertex_count:
+            self.lo = vertices[:, 0:3].min(axis = 0)
+            self.hi = vertices[:, 0:3].max(axis = 0)
+
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_STATIC_DRAW)
+        GPU_MEMORY.track_buffer(
+            self.vbo, vertices.nbytes, "vertices",
+            f"static batch of {getattr(self.material, 'filepath', 'a color')}")
+
+    def draw(self) -> None:
+        """
+            Draw the batch.
+        """
+
+        glBindVertexArray(self.vao)
+        glDrawArrays(GL_TRIANGLES, 0, self.vertex_count)
+
+    def destroy(self) -> None:
+        """
+            Free any allocated memory.
+        """
+
+        glDeleteVertexArrays(1, (self.vao,))
+        glDeleteBuffers(1, (self.vbo,))
+        GPU_MEMORY.release("buffer", self.vbo)
+
+class StaticBatcher:
+    """
+        Merges the geometry of entities which never move into
+        one batch per material, drawn with one call each.
+    """
+    __slots__ = ("batches", "chunks", "entities", "meshes", "depth", "depth_dirty")
+
+
+    def __init__(self):
+        """
+            Initialize the batcher.
+        """
+
+        self.batches: dict[object, StaticBatch] = {}
+        # material -> entity -> that entity's world space vertices
+        self.chunks: dict[object, dict[Entity, np.ndarray]] = {}
+        # entity -> materials it contributes to
+        self.entities: dict[Entity, list] = {}
+        # entity -> the mesh its geometry came from
+        self.meshes: dict[Entity, Mesh] = {}
+        # every batch's positions together, for depth passes,
+        # remade on the next depth draw after any batch changes
+        self.depth: DepthStream | None = None
+        self.depth_dirty = False
+
+    def __contains__(self, entity: Entity) -> bool:
+
+        return entity in self.entities
+
+    def build(self,
+        meshes: dict[int, Mesh], materials: dict[int, object],
+        renderables: dict[int, list[Entity]]) -> None:
+        """
+            Batch every static entity of the scene.
+
+            Parameters:
+
+                meshes: the mesh of each entity type.
+
+                materials: the material of each single
+                    material entity type.
+
+                renderables: all the entities in the scene.
+        """
+
+        for entity_type, entities in renderables.items():
+            mesh = meshes.get(entity_type)
+            groups = self._get_groups(mesh, materials.get(entity_type))
+            if not groups:
+                continue
+            for entity in entities:
+                if entity.is_static:
+                    self._add_chunks(entity, groups)
+                    self.meshes[entity] = mesh
+
+        for material in self.chunks:
+            self._rebuild(material)
+
+    def _get_groups(self, mesh: Mesh | None, material) -> list:
+        """
+            Returns the (material, vertices) groups of a mesh,
+            or nothing if the mesh can't be batched.
+        """
+
+        if isinstance(mesh, MultiMaterialMesh):
+            return mesh.get_groups()
+        if isinstance(mesh, ObjMesh) and material is not None:
+            return [(material, mesh.vertices)]
+        return []
+
+    def _add_chunks(self,
+        entity: Entity, groups: list, model: np.ndarray | None = None) -> None:
+        """
+            Move an entity's geometry into world space and
+            file it under each of its materials. The entity is
+            flagged, so the renderer doesn't draw it again.
+        """
+
+        if model is None:
+            model = entity.get_model_transform()
+        entity.is_batched = True
+        self.entities[entity] = []
+        for material, vertices in groups:
+            self.chunks.setdefault(material, {})[entity] = \
+                transform_vertices(vertices, model)
+            self.entities[entity].append(material)
+
+    def _rebuild(self, material) -> None:
+        """
+            Re-merge and upload one material's batch.
+        """
+
+        self.depth_dirty = True
+        chunks = self.chunks.get(material)
+        if not chunks:
+            batch = self.batches.pop(material, None)
+            if batch is not None:
+                batch.destroy()
+            self.chunks.pop(material, None)
+            return
+
+        if material not in self.batches:
+            self.batches[material] = StaticBatch(material)
+        self.batches[material].upload(np.concatenate(list(chunks.values())))
+
+    def update_entity(self,
+        entity: Entity, mesh: Mesh, material = None,
+        model: np.ndarray | None = None) -> None:
+        """
+            Re-batch a static entity after it was edited,
+            only its own materials' batches are rebuilt.
+
+            Parameters:
+
+                entity: the entity which changed.
+
+                mesh: the entity's mesh.
+
+                material: the entity's material, for single
+                    material meshes.
+
+                model: the entity's model matrix, read from
+                    the entity by default.
+        """
+
+        affected = set(self._remove_chunks(entity))
+        if entity.is_static:
+            groups = self._get_groups(mesh, material)
+            if groups:
+                self._add_chunks(entity, groups, model)
+                self.meshes[entity] = mesh
+                affected.update(self.entities[entity])
+
+        for affected_material in affected:
+            self._rebuild(affected_material)
+
+    def replace_mesh(self, old: Mesh, new: Mesh, material = None) -> None:
+        """
+            Re-batch every entity built from a mesh with its
+            replacement, rebuilding each affected batch once.
+
+            Parameters:
+
+                old: the mesh being replaced.
+
+                new: its replacement.
+
+                material: the entities' material, for single
+                    material meshes.
+        """
+
+        entities = [entity for entity, mesh in self.meshes.items() if mesh is old]
+        if not entities:
+            return
+
+        affected = set()
+        groups = self._get_groups(new, material)
+        for entity in entities:
+            affected.update(self._remove_chunks(entity))
+            if groups:
+                self._add_chunks(entity, groups)
+                self.meshes[entity] = new
+                affected.update(self.entities[entity])
+
+        for affected_material in affected:
+            self._rebuild(affected_material)
+
+    def remove_entity(self, entity: Entity) -> None:
+        """
+            Take an entity out of the batches.
+        """
+
+        for material in self._remove_chunks(entity):
+            self._rebuild(material)
+
+    def _remove_chunks(self, entity: Entity) -> list:
+        """
+            Forget an entity's geometry.
+
+            Returns:
+
+                The materials it contributed to.
+        """
+
+        materials = self.entities.pop(entity, [])
+        self.meshes.pop(entity, None)
+        entity.is_batched = False
+        for material in materials:
+            self.chunks[material].pop(entity, None)
+        return materials
+
+    def draw(self,
+        set_model, bind_material = None,
+        planes: np.ndarray | None = None) -> None:
+        """
+            Draw every batch.
+
+            Parameters:
+
+                set_model: sets the model matrix of the program in use.
+
+                bind_material: called with each batch's material,
+                    if materials are wanted.
+
+                planes: (6, 4) view volume planes, batches entirely
+                    outside them are skipped.
+        """
+
+        if not self.batches:
+            return
+
+        set_model(IDENTITY)
+        for batch in self.batches.values():
+            if batch.vertex_count == 0:
+                continue
+            if planes is not None \
+                and not aabb_in_frustum(planes, batch.lo, batch.hi):
+                continue
+            if bind_material is not None:
+                bind_material(batch.material)
+            batch.draw()
+
+    def draw_depth(self, set_model, planes: np.ndarray | None = None) -> None:
+        """
+            Draw every batch's positions in one call, without
+            materials, for depth passes.
+
+            Parameters:
+
+                set_model: sets the model matrix of the program in use.
+
+                planes: (6, 4) view volume planes, nothing is drawn
+                    if the batches are entirely outside them.
+        """
+
+        if self.depth_dirty:
+            self.depth_dirty = False
+            chunks = [
+                vertices[:, 0:3]
+                for material_chunks in self.chunks.values()
+                for vertices in material_chunks.values()]
+            if self.depth is None:
+                self.depth = DepthStream(owner = "static batches")
+            self.depth.upload(
+                np.concatenate(chunks) if chunks else np.zeros((0, 3), dtype=np.float32))
+
+        if self.depth is None or self.depth.index_count == 0:
+            return
+        if planes is not None \
+            and not aabb_in_frustum(planes, self.depth.lo, self.depth.hi):
+            return
+        set_model(IDENTITY)
+        self.depth.draw()
+
+    def destroy(self) -> None:
+        """
+            Free any allocated memory.
+        """
+
+        for batch in self.batches.values():
+            batch.destroy()
+        if self.depth is not None:
+            self.depth.destroy()
+            self.depth = None
+        for entity in self.entities:
+            entity.is_batched = False
+        self.batches.clear()
+        self.chunks.clear()
+        self.entities.clear()
+        self.meshes.clear()
@@ -0,0 +1,307 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+import logging
+import time
+
+import numpy as np
+
+from core.constants import *
+from core.world import CellDescription, WorldPartition
+from graphics.material import load_image
+from graphics.mesh import MultiMaterialMesh
+from utils.obj_loader import load_multi_material_mesh
+from utils.trace import TRACER
+
+log = logging.getLogger(__name__)
+
+# how quickly the movement estimate follows the camera, per update
+VELOCITY_SMOOTHING = 0.25
+
+############################## helper functions ###############################
+
+def load_cell(cell: CellDescription) -> tuple[dict | None, dict[str, tuple]]:
+    """
+        Parse a cell's mesh and decode its textures,
+        off the GL thread.
+
+        Returns:
+
+            The parsed groups, or None without a mesh, and
+            each texture path with its decoded image.
+    """
+
+    if cell.mesh is None:
+        return None, {}
+
+    groups = load_multi_material_mesh(cell.mesh)
+    images = {}
+    for data in groups.values():
+        texture_path = data.get("texture")
+        if texture_path and texture_path not in images:
+            images[texture_path] = load_image(texture_path)
+    return groups, images
+
+def get_cell_bytes(mesh: MultiMaterialMesh | None, images: dict[str, tuple]) -> int:
+    """
+        Returns the memory a loaded cell takes: its vertex and
+        index buffers, and its textures with their mipmaps.
+    """
+
+    total = 0
+    if mesh is not None:
+        total += mesh.vertices.nbytes + mesh.indices.nbytes
+    for width, height, _ in images.values():
+        total += 4 * width * height * 4 // 3
+    return total
+
+class WorldStreamer:
+    """
+        Keeps the cells of a large world near the camera loaded.
+        Cells are parsed and decoded on background workers and
+        uploaded on the GL thread, a few per frame. A cell loads
+        once the camera comes within the load radius and unloads
+        once it is past the larger unload radius; cells in the
+        direction the camera is heading are fetched early.
+
+        The cells kept loaded never take more than the memory
+        limit, unless the cells within the load radius alone do.
+    """
+    __slots__ = (
+        "partition", "engine", "scene", "send",
+        "load_radius", "unload_radius", "memory_limit", "prefetch_time",
+        "uploads_per_frame", "max_loads", "executor", "loads", "resident",
+        "sizes", "failed", "last_position", "last_time", "velocity")
+
+
+    def __init__(self,
+        partition: WorldPartition, engine, scene, send = None,
+        load_radius: float = STREAM_LOAD_RADIUS,
+        unload_radius: float = STREAM_UNLOAD_RADIUS,
+        memory_limit: int = STREAM_MEMORY_LIMIT,
+        prefetch_time: float = STREAM_PREFETCH_TIME,
+        workers: int = 2, uploads_per_frame: int = 1):
+        """
+            Initialize the streamer, with nothing loaded.
+
+            Parameters:
+
+                partition: the world's cells.
+
+                engine: the GraphicsEngine drawing the cells' meshes.
+
+                scene: the Scene receiving the cells' entities.
+
+                send: applies a change to the scene, by default
+                    at once; pass App._send when the simulation
+                    runs on its own thread.
+
+                load_radius, unload_radius: distances from the
+                    camera at which cells load and unload.
+
+                memory_limit: most bytes the cells may take.
+
+                prefetch_time: seconds of movement ahead of the
+                    camera to load cells for.
+
+                workers: background loading threads.
+
+                uploads_per_frame: most cells uploaded per update,
+                    to keep loading from hitching the frame rate.
+        """
+
+        if unload_radius < load_radius:
+            raise ValueError("The unload radius can't be inside the load radius")
+
+        self.partition = partition
+        self.engine = engine
+        self.scene = scene
+        self.send = send or (lambda command, *args: command(*args))
+        self.load_radius = load_radius
+        self.unload_radius = unload_radius
+        self.memory_limit = memory_limit
+        self.prefetch_time = prefetch_time
+        self.uploads_per_frame = uploads_per_frame
+
+        # keep the queue short, so it follows the camera
+        self.max_loads = 2 * workers
+        self.executor = ThreadPoolExecutor(
+            max_workers = workers, thread_name_prefix = "cell loader")
+        # cell -> its files being parsed and decoded
+        self.loads: dict[tuple[int, int], Future] = {}
+        # cell -> bytes it takes, for the loaded ones
+        self.resident: dict[tuple[int, int], int] = {}
+        # cell -> bytes it took when last loaded
+        self.sizes: dict[tuple[int, int], int] = {}
+        # cells whose files couldn't be read
+        self.failed: set[tuple[int, int]] = set()
+
+        self.last_position: np.ndarray | None = None
+        self.last_time = 0.0
+        self.velocity = np.zeros(3, dtype=np.float32)
+
+    def get_resident_bytes(self) -> int:
+        """
+            Returns the memory the loaded cells take.
+        """
+
+        return sum(self.resident.values())
+
+    def _get_expected_bytes(self, key: tuple[int, int]) -> int:
+
+        return self.sizes.get(key, self.partition.cells[key].estimate)
+
+    def update(self, camera_position: np.ndarray, now: float | None = None) -> None:
+        """
+            Load and unload cells for the camera's position. Call
+            once per frame, on the GL thread.
+
+            Parameters:
+
+                camera_position: where the camera is.
+
+                now: the time in seconds, by default time.perf_counter.
+        """
+
+        now = time.perf_counter() if now is None else now
+        position = np.array(camera_position, dtype=np.float32)
+        self._update_velocity(position, now)
+
+        near = self.partition.get_cells_near(position, self.load_radius)
+        wanted = set(near)
+        if np.any(self.velocity):
+            ahead = position + self.prefetch_time * self.velocity
+            wanted.update(self.partition.get_cells_near(ahead, self.load_radius))
+        distance = lambda key: self.partition.get_distance(position, key)
+        # nearest first, so the prefetched cells come last
+        wanted = sorted(wanted, key = distance)
+
+        keep = set(wanted)
+        keep.update(self.partition.get_cells_near(position, self.unload_radius))
+        for key in list(self.resident):
+            if key not in keep:
+                self.unload(key)
+        for key in list(self.loads):
+            if key not in keep:
+                self.loads.pop(key).cancel()
+
+        self._finish_loads()
+        self._evict(distance, 0, self.load_radius)
+        self._start_loads(wanted, set(near), distance)
+
+    def _update_velocity(self, position: np.ndarray, now: float) -> None:
+        """
+            Follow how fast, and which way, the camera is moving.
+        """
+
+        if self.last_position is not None and now > self.last_time:
+            velocity = (position - self.last_position) / (now - self.last_time)
+            self.velocity += VELOCITY_SMOOTHING * (velocity - self.velocity)
+        self.last_position = position
+        self.last_time = now
+
+    def _evict(self, distance, needed: int, beyond: float) -> bool:
+        """
+            Unload the farthest cells until the loaded and
+            loading ones leave the given bytes free.
+
+            Parameters:
+
+                distance: gives a cell's distance from the camera.
+
+                needed: bytes to free up within the limit.
+
+                beyond: only cells farther than this are unloaded,
+                    so a cell never pushes out a nearer one.
+
+            Returns:
+
+                Whether there is now room.
+        """
+
+        used = self.get_resident_bytes() + sum(
+            self._get_expected_bytes(key) for key in self.loads)
+        candidates = sorted(
+            (key for key in self.resident if distance(key) > beyond),
+            key = distance, reverse = True)
+        for key in candidates:
+            if used + needed <= self.memory_limit:
+                break
+            used -= self.resident[key]
+            self.unload(key)
+        return used + needed <= self.memory_limit
+
+    def _start_loads(self, wanted: list, near: set, distance) -> None:
+        """
+            Hand the wanted cells which aren't loaded yet to the
+            workers, in order, for as long as they fit in memory.
+        """
+
+        for key in wanted:
+            if len(self.loads) >= self.max_loads:
+                return
+            if key in self.resident or key in self.loads or key in self.failed:
+                continue
+            # make room by unloading cells farther out, those kept
+            # only by the hysteresis or prefetched
+            if not self._evict(distance, self._get_expected_bytes(key), distance(key)):
+                if key in near:
+                    log.warning("Cell %s doesn't fit in the streaming memory limit", key)
+                return
+            self.loads[key] = self.executor.submit(
+                load_cell, self.partition.cells[key])
+
+    def _finish_loads(self) -> None:
+        """
+            Upload the cells the workers are done with.
+        """
+
+        uploads = 0
+        for key, future in list(self.loads.items()):
+            if uploads >= self.uploads_per_frame:
+                return
+            if not future.done():
+                continue
+            del self.loads[key]
+
+            cell = self.partition.cells[key]
+            try:
+                groups, images = future.result()
+            except Exception as error:
+                # a broken file stays broken, don't keep retrying it
+                log.error("Loading cell %s failed: %s", key, error)
+                self.failed.add(key)
+                continue
+
+            with TRACER.span("stream cell", "streaming", cell = key):
+                mesh = None
+                if groups is not None:
+                    mesh = MultiMaterialMesh(cell.mesh, groups, images)
+                    self.engine.add_world_cell(key, mesh)
+                    self.send(
+                        self.scene.add_static_geometry, ("cell", key),
+                        mesh.get_triangles())
+                if cell.entities:
+                    self.send(self.scene.load_cell, key, cell.entities)
+            self.resident[key] = self.sizes[key] = get_cell_bytes(mesh, images)
+            uploads += 1
+
+    def unload(self, key: tuple[int, int]) -> None:
+        """
+            Free a loaded cell's mesh and remove its entities.
+        """
+
+        if self.resident.pop(key, None) is None:
+            return
+        self.engine.remove_world_cell(key)
+        self.send(self.scene.remove_static_geometry, ("cell", key))
+        if self.partition.cells[key].entities:
+            self.send(self.scene.unload_cell, key)
+
+    def destroy(self) -> None:
+        """
+            Stop loading and unload every cell.
+        """
+
+        self.executor.shutdown(wait = False, cancel_futures = True)
+        self.loads.clear()
+        for key in list(self.resident):
+            self.unload(key)
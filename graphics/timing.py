@@ -0,0 +1,200 @@
+from OpenGL.GL import *
+from collections import deque
+from contextlib import contextmanager
+import csv
+import json
+import time
+import numpy as np
+
+from utils.gl_shim import get_recorder
+
+PERCENTILES = (50, 95, 99)
+
+class PassTimer:
+    """
+        Measures how long each render pass takes, on the CPU and on
+        the GPU. GPU timer queries are read back a few frames late,
+        and only once their result is available, so timing never
+        stalls the pipeline.
+    """
+    __slots__ = (
+        "history", "latency", "frame", "cpu_samples", "gpu_samples",
+        "_free_queries", "_pending", "_open", "recorder")
+
+
+    def __init__(self, history: int = 240, latency: int = 3):
+        """
+            Initialize the timer.
+
+            Parameters:
+
+                history: number of samples kept per pass.
+
+                latency: number of frames to wait before asking
+                    for a query's result.
+        """
+
+        self.history = history
+        self.latency = latency
+        self.frame = 0
+
+        self.cpu_samples: dict[str, deque[float]] = {}
+        self.gpu_samples: dict[str, deque[float]] = {}
+
+        self._free_queries: list[int] = []
+        # (frame, pass name, query)
+        self._pending: deque[tuple[int, str, int]] = deque()
+        # pass name -> (cpu start, query)
+        self._open: dict[str, tuple[int, int]] = {}
+
+        # when OpenGL.GL is a utils.gl_shim shim, its calls
+        # are attributed to the passes timed here
+        self.recorder = get_recorder()
+
+    def begin(self, name: str) -> None:
+        """
+            Start timing a pass.
+            GPU timings can't nest, so passes should not overlap.
+        """
+
+        if self.recorder is not None:
+            self.recorder.begin_pass(name)
+        query = self._acquire_query()
+        glBeginQuery(GL_TIME_ELAPSED, query)
+        self._open[name] = (time.perf_counter_ns(), query)
+
+    def end(self, name: str) -> None:
+        """
+            Stop timing a pass.
+        """
+
+        start, query = self._open.pop(name)
+        glEndQuery(GL_TIME_ELAPSED)
+        if self.recorder is not None:
+            self.recorder.end_pass()
+        self._record(self.cpu_samples, name,
+            (time.perf_counter_ns() - start) / 1e6)
+        self._pending.append((self.frame, name, query))
+
+    @contextmanager
+    def section(self, name: str):
+        """
+            Time everything issued inside the with block as one pass.
+        """
+
+        self.begin(name)
+        try:
+            yield
+        finally:
+            self.end(name)
+
+    def end_frame(self) -> None:
+        """
+            Mark the end of a frame and collect any GPU results
+            which have arrived.
+        """
+
+        self.frame += 1
+        available = np.zeros(1, dtype=np.int32)
+        elapsed = np.zeros(1, dtype=np.uint64)
+
+        while self._pending:
+            frame, name, query = self._pending[0]
+            if self.frame - frame < self.latency:
+                break
+            glGetQueryObjectiv(query, GL_QUERY_RESULT_AVAILABLE, available)
+            if not available[0]:
+                # queries finish in order, so the rest aren't ready either
+                break
+            glGetQueryObjectui64v(query, GL_QUERY_RESULT, elapsed)
+            self._record(self.gpu_samples, name, int(elapsed[0]) / 1e6)
+            self._pending.popleft()
+            self._free_queries.append(query)
+
+        if self.recorder is not None:
+            self.recorder.end_frame()
+
+    def _acquire_query(self) -> int:
+        """
+            Returns a query object which isn't in flight.
+        """
+
+        if self._free_queries:
+            return self._free_queries.pop()
+        return int(glGenQueries(1))
+
+    def _record(self,
+        samples: dict[str, deque[float]], name: str, value: float) -> None:
+        """
+            Add a sample in milliseconds to a pass's history.
+        """
+
+        if name not in samples:
+            samples[name] = deque(maxlen = self.history)
+        samples[name].append(value)
+
+    def stats(self) -> dict[str, dict[str, dict[str, float]]]:
+        """
+            Returns the rolling statistics of every pass, in milliseconds.
+            e.g. stats()["shadow"]["gpu"]["p95"]
+        """
+
+        result = {}
+        for kind, samples in (("cpu", self.cpu_samples), ("gpu", self.gpu_samples)):
+            for name, values in samples.items():
+                if not values:
+                    continue
+                data = np.fromiter(values, dtype=np.float64, count=len(values))
+                percentiles = np.percentile(data, PERCENTILES)
+                entry = {
+                    f"p{p}": float(v) for p, v in zip(PERCENTILES, percentiles)
+                }
+                entry["mean"] = float(data.mean())
+                entry["samples"] = len(data)
+                result.setdefault(name, {})[kind] = entry
+        return result
+
+    def get_percentile(self, name: str, kind: str = "gpu", percentile: int = 50) -> float:
+        """
+            Returns one percentile of a pass's timings in milliseconds,
+            or 0 if the pass has no samples yet.
+        """
+
+        samples = (self.gpu_samples if kind == "gpu" else self.cpu_samples).get(name)
+        if not samples:
+            return 0.0
+        return float(np.percentile(
+            np.fromiter(samples, dtype=np.float64, count=len(samples)), percentile))
+
+    def dump_json(self, filepath: str) -> None:
+        """
+            Write the statistics of every pass to a JSON file.
+        """
+
+        with open(filepath, "w") as f:
+            json.dump({"frames": self.frame, "passes": self.stats()}, f, indent = 2)
+
+    def dump_csv(self, filepath: str) -> None:
+        """
+            Write the statistics of every pass to a CSV file,
+            one row per pass and clock.
+        """
+
+        fields = ["pass", "clock", "samples", "mean"] + [f"p{p}" for p in PERCENTILES]
+        with open(filepath, "w", newline = "") as f:
+            writer = csv.DictWriter(f, fieldnames = fields)
+            writer.writeheader()
+            for name, kinds in self.stats().items():
+                for kind, entry in kinds.items():
+                    writer.writerow({"pass": name, "clock": kind, **entry})
+
+    def destroy(self) -> None:
+        """
+            Free the query objects.
+        """
+
+        queries = self._free_queries + [query for _, _, query in self._pending]
+        if queries:
+            glDeleteQueries(len(queries), queries)
+        self._free_queries = []
+        self._pending.clear()
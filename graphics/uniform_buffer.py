@@ -0,0 +1,159 @@
+from OpenGL.GL import *
+import numpy as np
+
+from core.constants import MAX_LIGHTS
+from utils.gpu_memory import GPU_MEMORY
+
+############################## Block layouts ##################################
+
+# std140 byte offsets of every member, as the shaders declare them.
+
+FRAME_BLOCK_NAME = "FrameData"
+FRAME_BLOCK_SIZE = 208
+FRAME_BLOCK_LAYOUT = {
+    "view": 0,
+    "projection": 64,
+    "lightSpaceMatrix": 128,
+    "cameraPosition": 192,
+}
+
+LIGHT_BLOCK_NAME = "LightData"
+LIGHT_STRIDE = 32
+LIGHT_BLOCK_SIZE = MAX_LIGHTS * LIGHT_STRIDE + 16
+LIGHT_BLOCK_LAYOUT = {
+    "lightCount": MAX_LIGHTS * LIGHT_STRIDE,
+}
+for i in range(MAX_LIGHTS):
+    LIGHT_BLOCK_LAYOUT[f"Lights[{i}].position"] = i * LIGHT_STRIDE
+    LIGHT_BLOCK_LAYOUT[f"Lights[{i}].color"] = i * LIGHT_STRIDE + 16
+    LIGHT_BLOCK_LAYOUT[f"Lights[{i}].strength"] = i * LIGHT_STRIDE + 28
+
+###############################################################################
+
+class UniformBlock:
+    """
+        A std140 uniform block, mirrored by a CPU side array
+        and uploaded in one go.
+    """
+    __slots__ = ("name", "binding", "layout", "data", "ubo")
+
+
+    def __init__(self,
+        name: str, binding: int, layout: dict[str, int], size: int):
+        """
+            Allocate the buffer and attach it to its binding point.
+
+            Parameters:
+
+                name: name of the block in the shader source.
+
+                binding: uniform buffer binding point.
+
+                layout: byte offset of each member.
+
+                size: size of the block in bytes.
+        """
+
+        self.name = name
+        self.binding = binding
+        self.layout = layout
+        self.data = np.zeros(size // 4, dtype=np.float32)
+
+        self.ubo = glGenBuffers(1)
+        glBindBuffer(GL_UNIFORM_BUFFER, self.ubo)
+        glBufferData(GL_UNIFORM_BUFFER, self.data.nbytes, None, GL_DYNAMIC_DRAW)
+        GPU_MEMORY.track_buffer(self.ubo, self.data.nbytes, "uniforms", self.name)
+        glBindBufferBase(GL_UNIFORM_BUFFER, self.binding, self.ubo)
+        glBindBuffer(GL_UNIFORM_BUFFER, 0)
+
+    @property
+    def size(self) -> int:
+        """
+            Size of the block in bytes.
+        """
+
+        return self.data.nbytes
+
+    def write(self, member: str, value: np.ndarray) -> None:
+        """
+            Copy a float member (scalar, vector or matrix) into
+            the CPU side copy of the block.
+        """
+
+        value = np.asarray(value, dtype=np.float32).ravel()
+        start = self.layout[member] // 4
+        self.data[start:start + value.size] = value
+
+    def write_int(self, member: str, value: int) -> None:
+        """
+            Copy an int member into the CPU side copy of the block.
+        """
+
+        self.data.view(np.int32)[self.layout[member] // 4] = value
+
+    def upload(self) -> None:
+        """
+            Send the whole block to the GPU.
+        """
+
+        glBindBuffer(GL_UNIFORM_BUFFER, self.ubo)
+        glBufferSubData(GL_UNIFORM_BUFFER, 0, self.data.nbytes, self.data)
+
+    def destroy(self) -> None:
+        """
+            Free the buffer.
+        """
+
+        glDeleteBuffers(1, (self.ubo,))
+        GPU_MEMORY.release("buffer", self.ubo)
+
+class FrameBlock(UniformBlock):
+    """
+        Per frame camera data shared by every program.
+    """
+    __slots__ = tuple()
+
+
+    def __init__(self, binding: int):
+
+        super().__init__(
+            FRAME_BLOCK_NAME, binding, FRAME_BLOCK_LAYOUT, FRAME_BLOCK_SIZE)
+
+class LightBlock(UniformBlock):
+    """
+        The scene's point lights, shared by every program.
+    """
+    __slots__ = ("lights",)
+
+
+    def __init__(self, binding: int):
+
+        super().__init__(
+            LIGHT_BLOCK_NAME, binding, LIGHT_BLOCK_LAYOUT, LIGHT_BLOCK_SIZE)
+
+        # one row per light: x, y, z, _, r, g, b, strength
+        self.lights = self.data[:MAX_LIGHTS * LIGHT_STRIDE // 4].reshape(
+            MAX_LIGHTS, LIGHT_STRIDE // 4)
+
+    def set_lights(self, lights: list) -> None:
+        """
+            Pack the given point lights into the block.
+        """
+
+        count = min(len(lights), MAX_LIGHTS)
+        self.lights[:] = 0
+        for i in range(count):
+            light = lights[i]
+            self.lights[i, 0:3] = light.position
+            self.lights[i, 4:7] = light.color
+            self.lights[i, 7] = light.strength
+        self.write_int("lightCount", count)
+
+    def set_light_rows(self, rows: np.ndarray, count: int) -> None:
+        """
+            Copy lights already packed as (x, y, z, _, r, g, b, strength)
+            rows into the block.
+        """
+
+        self.lights[:] = rows
+        self.write_int("lightCount", count)
@@ -1,6 +1,166 @@
-from core.app import App
+import argparse
+import importlib
+import json
+import logging
+import os
 
-if __name__ == "__main__":
-    app = App()
+from utils.trace import TRACER
+
+# third party modules worth seeing separately in a startup trace
+HEAVY_MODULES = ("numpy", "OpenGL.GL", "pyrr", "glfw")
+
+
+def parse_args() -> argparse.Namespace:
+    """
+        Read the command line options.
+    """
+
+    parser = argparse.ArgumentParser(description = "Walk through building models.")
+    parser.add_argument("--headless", action = "store_true",
+        help = "render offscreen, without a window or input")
+    parser.add_argument("--backend", choices = ("egl", "osmesa"), default = "egl",
+        help = "how the headless context is created")
+    parser.add_argument("--size", default = "640x480",
+        help = "headless image size, as WIDTHxHEIGHT")
+    parser.add_argument("--frames", type = int, default = 300,
+        help = "number of frames to render in headless mode")
+    parser.add_argument("--output",
+        help = "save the last headless frame to this image file")
+    parser.add_argument("--report",
+        help = "save the headless timing report to this JSON file")
+    parser.add_argument("--batch", metavar = "CAMERA_PATH",
+        help = "render a JSON camera path offscreen to an image sequence")
+    parser.add_argument("--out-dir", default = "frames",
+        help = "directory receiving the batch frames")
+    parser.add_argument("--format", choices = ("png", "raw"), default = "png",
+        help = "file format of the batch frames")
+    parser.add_argument("--fps", type = float, default = 30.0,
+        help = "frames per second of camera path time")
+    parser.add_argument("--workers", type = int,
+        help = "number of frame encoding threads")
+    parser.add_argument("--prepass", choices = ("auto", "on", "off"), default = "auto",
+        help = "depth prepass of the forward path in headless mode; "
+            "the report gives the fragments shaded either way")
+    parser.add_argument("--world", metavar = "WORLD_JSON",
+        help = "stream the cells of a world partition manifest "
+            "in and out around the camera")
+    parser.add_argument("--trace", metavar = "TRACE_JSON",
+        help = "record startup phases to this Chrome trace file "
+            "and log a summary of them")
+    parser.add_argument("--gl-calls", action = "store_true",
+        help = "count and time every GL call, logging the "
+            "per frame averages by pass and function on exit")
+    parser.add_argument("--log-level", default = "INFO",
+        choices = ("DEBUG", "INFO", "WARNING", "ERROR"),
+        help = "least severe log messages shown")
+    return parser.parse_args()
+
+def set_up_logging(level: str) -> None:
+    """
+        Send log messages to stderr, with the time since launch.
+    """
+
+    logging.basicConfig(
+        level = level,
+        format = "%(relativeCreated)8.0f ms %(levelname)-7s %(name)s: %(message)s")
+
+def import_modules(names) -> None:
+    """
+        Import modules ahead of use, each in its own trace span.
+    """
+
+    for name in names:
+        with TRACER.span(f"import {name}", "import"):
+            importlib.import_module(name)
+
+def save_trace(filepath: str) -> None:
+    """
+        Write the recorded spans and log their summary.
+    """
+
+    TRACER.save(filepath)
+    logging.getLogger(__name__).info(
+        "Startup trace written to %s\n%s", filepath, TRACER.summarize())
+
+def parse_size(size: str) -> tuple[int, int]:
+    """
+        Read a WIDTHxHEIGHT string.
+    """
+
+    width, height = (int(n) for n in size.lower().split("x"))
+    return width, height
+
+def run_headless(args: argparse.Namespace) -> None:
+    """
+        Render a fixed number of frames offscreen.
+    """
+
+    with TRACER.span("import core.headless", "import"):
+        from core.headless import HeadlessApp
+
+    from core.constants import DEPTH_PREPASS
+
+    app = HeadlessApp(*parse_size(args.size), args.backend)
+    app.renderer.prepass.set_mode(DEPTH_PREPASS[args.prepass.upper()])
+    report = app.run(args.frames)
+    if args.report:
+        app.save_report(report, args.report)
+    if args.output:
+        app.save_frame(args.output)
+    app.quit()
+
+def run_batch(args: argparse.Namespace) -> None:
+    """
+        Render a camera path offscreen to an image sequence.
+    """
+
+    with TRACER.span("import core.batch", "import"):
+        from core.batch import BatchRenderer, CameraPath
+
+    renderer = BatchRenderer(
+        *parse_size(args.size), args.backend, workers = args.workers)
+    report = renderer.render_path(
+        CameraPath.from_json(args.batch), args.out_dir, args.fps, args.format)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent = 2)
+    renderer.quit()
+
+def run_window(args: argparse.Namespace) -> None:
+    """
+        Open the window and walk around.
+    """
+
+    import_modules(HEAVY_MODULES)
+    with TRACER.span("import core.app", "import"):
+        from core.app import App
+
+    app = App(world = args.world)
     app.run()
-    app.quit()
\ No newline at end of file
+    app.quit()
+
+if __name__ == "__main__":
+    args = parse_args()
+    set_up_logging(args.log_level)
+    if args.trace:
+        TRACER.enable()
+    if args.batch or args.headless:
+        # PyOpenGL picks its platform when first imported
+        os.environ["PYOPENGL_PLATFORM"] = args.backend
+    recorder = None
+    if args.gl_calls:
+        # must wrap OpenGL.GL before the graphics modules import it
+        from utils.gl_shim import install_counting
+        recorder = install_counting()
+
+    if args.batch:
+        run_batch(args)
+    elif args.headless:
+        run_headless(args)
+    else:
+        run_window(args)
+
+    if args.trace:
+        save_trace(args.trace)
+    if recorder is not None:
+        logging.getLogger(__name__).info("%s", recorder.summarize())
@@ -0,0 +1,6 @@
+layout (std140) uniform FrameData {
+    mat4 view;
+    mat4 projection;
+    mat4 lightSpaceMatrix;
+    vec3 cameraPosition;
+};
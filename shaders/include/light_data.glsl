@@ -0,0 +1,16 @@
+struct PointLight {
+    vec3 position;
+    vec3 color;
+    float strength;
+};
+
+layout (std140) uniform LightData {
+    PointLight Lights[8];
+    int lightCount;
+};
+
+// a compile time light count lets the compiler unroll the loop
+// and drop the lights that aren't there
+#ifndef LIGHT_COUNT
+#define LIGHT_COUNT lightCount
+#endif
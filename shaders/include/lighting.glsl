@@ -0,0 +1,24 @@
+// ---------------------- Lighting Model ----------------------
+
+// needs FrameData for the camera position
+vec3 calculatePointLight(PointLight light, vec3 fragPosition, vec3 fragNormal, vec3 baseColor)
+{
+    vec3 result = vec3(0.0);
+
+    vec3 fragToLight = light.position - fragPosition;
+    float distance = length(fragToLight);
+    fragToLight = normalize(fragToLight);
+
+    vec3 fragToCamera = normalize(cameraPosition - fragPosition);
+    vec3 halfVec = normalize(fragToLight + fragToCamera);
+
+    // Diffuse
+    float diff = max(dot(fragNormal, fragToLight), 0.0);
+    result += light.color * light.strength * diff * baseColor / (distance * distance);
+
+    // Specular
+    float spec = pow(max(dot(fragNormal, halfVec), 0.0), 32.0);
+    result += light.color * light.strength * spec / (distance * distance);
+
+    return result;
+}
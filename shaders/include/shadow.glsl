@@ -0,0 +1,23 @@
+// ---------------------- Shadow Calculation ----------------------
+
+// needs FrameData, LightData and a shadowMap sampler
+float calculateShadow(vec4 lightSpacePos, vec3 fragPosition, vec3 fragNormal)
+{
+    // Convert from NDC to [0,1] coordinates
+    vec3 projCoords = lightSpacePos.xyz / lightSpacePos.w;
+    projCoords = projCoords * 0.5 + 0.5;
+
+    // Skip fragments outside light frustum
+    if (projCoords.z > 1.0)
+        return 1.0;
+
+    // Read depth from shadow map
+    float closestDepth = texture(shadowMap, projCoords.xy).r;
+    float currentDepth = projCoords.z;
+
+    // Bias to reduce shadow acne
+    float bias = max(0.05 * (1.0 - dot(fragNormal, normalize(Lights[0].position - fragPosition))), 0.001);
+
+    // Shadow factor: 0.0 = in shadow, 1.0 = lit
+    return (currentDepth - bias > closestDepth) ? 0.0 : 1.0;
+}
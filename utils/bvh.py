@@ -0,0 +1,335 @@
+import hashlib
+import logging
+import os
+
+import numpy as np
+
+from utils.trace import TRACER
+
+log = logging.getLogger(__name__)
+
+# bumped whenever the stored layout changes
+BVH_VERSION = 1
+# cost of visiting a node, relative to testing one triangle
+TRAVERSAL_COST = 1.0
+# nodes this small are never split
+MIN_LEAF_SIZE = 2
+# nodes this large are always split, even where SAH says not to
+MAX_LEAF_SIZE = 16
+
+############################## helper functions ###############################
+
+def get_surface_areas(lo: np.ndarray, hi: np.ndarray) -> np.ndarray:
+    """
+        Returns the surface area of each (lo, hi) box.
+    """
+
+    d = np.maximum(hi - lo, 0.0)
+    return 2.0 * (d[..., 0] * d[..., 1] + d[..., 1] * d[..., 2] + d[..., 2] * d[..., 0])
+
+def intersect_triangles(
+    origins: np.ndarray, directions: np.ndarray,
+    triangles: np.ndarray, epsilon: float = 1e-9) -> np.ndarray:
+    """
+        Möller–Trumbore, for many (ray, triangle) pairs at once.
+
+        Parameters:
+
+            origins, directions: (n, 3) rays.
+
+            triangles: (n, 3, 3) the triangle tested with each ray.
+
+        Returns:
+
+            (n,) distance along each ray to its triangle, in units of
+            its direction's length, inf where it misses.
+    """
+
+    v0 = triangles[:, 0]
+    e1 = triangles[:, 1] - v0
+    e2 = triangles[:, 2] - v0
+    p = np.cross(directions, e2)
+    det = np.einsum("ij,ij->i", e1, p)
+    valid = np.abs(det) > epsilon
+    inv_det = 1.0 / np.where(valid, det, 1.0)
+
+    s = origins - v0
+    u = np.einsum("ij,ij->i", s, p) * inv_det
+    q = np.cross(s, e1)
+    v = np.einsum("ij,ij->i", directions, q) * inv_det
+    t = np.einsum("ij,ij->i", e2, q) * inv_det
+
+    hit = valid & (u >= 0.0) & (v >= 0.0) & (u + v <= 1.0) & (t > epsilon)
+    return np.where(hit, t, np.inf)
+
+def load_or_build(triangles: np.ndarray, directory: str = ".bvh_cache") -> "TriangleBVH":
+    """
+        Returns the BVH of a set of triangles, read from the cache
+        directory if they were seen before, otherwise built and stored.
+    """
+
+    triangles = np.ascontiguousarray(triangles, dtype=np.float32)
+    digest = hashlib.sha256(f"{BVH_VERSION}:{MAX_LEAF_SIZE}".encode())
+    digest.update(triangles.tobytes())
+    path = os.path.join(directory, f"{digest.hexdigest()}.npz")
+
+    if os.path.exists(path):
+        try:
+            with TRACER.span("load bvh", triangles = len(triangles)):
+                return TriangleBVH.load(path, triangles)
+        except (OSError, KeyError, ValueError) as error:
+            log.warning("Ignoring unreadable BVH cache %s: %s", path, error)
+
+    with TRACER.span("build bvh", triangles = len(triangles)):
+        bvh = TriangleBVH(triangles)
+    try:
+        os.makedirs(directory, exist_ok = True)
+        bvh.save(path)
+    except OSError as error:
+        log.warning("Couldn't store the BVH in %s: %s", directory, error)
+    return bvh
+
+class TriangleBVH:
+    """
+        A bounding volume hierarchy over a mesh's triangles, built
+        with binned SAH splits, for casting rays against the mesh.
+        Nodes are stored in flat arrays; leaves own a contiguous
+        range of the reordered triangles.
+    """
+    __slots__ = ("triangles", "order", "lo", "hi", "left", "right", "start", "count")
+
+
+    def __init__(self, triangles: np.ndarray | None = None, bins: int = 16):
+        """
+            Build the hierarchy.
+
+            Parameters:
+
+                triangles: (n, 3, 3) corners of each triangle,
+                    None leaves the BVH empty for load to fill.
+
+                bins: candidate split planes tried per axis.
+        """
+
+        if triangles is None:
+            return
+
+        triangles = np.asarray(triangles, dtype=np.float32)
+        tri_lo = triangles.min(axis = 1)
+        tri_hi = triangles.max(axis = 1)
+        centroids = 0.5 * (tri_lo + tri_hi)
+        order = np.arange(len(triangles))
+
+        lo, hi, left, right, start, count = [], [], [], [], [], []
+
+        def add_node(first: int, last: int) -> int:
+            indices = order[first:last]
+            if len(indices):
+                lo.append(tri_lo[indices].min(axis = 0))
+                hi.append(tri_hi[indices].max(axis = 0))
+            else:
+                lo.append(np.zeros(3, dtype=np.float32))
+                hi.append(np.zeros(3, dtype=np.float32))
+            left.append(-1)
+            right.append(-1)
+            start.append(first)
+            count.append(last - first)
+            return len(lo) - 1
+
+        stack = [add_node(0, len(triangles))]
+        while stack:
+            node = stack.pop()
+            first, n = start[node], count[node]
+            if n <= MIN_LEAF_SIZE:
+                continue
+
+            indices = order[first:first + n]
+            split = self._find_split(
+                tri_lo[indices], tri_hi[indices], centroids[indices],
+                get_surface_areas(lo[node], hi[node]), bins)
+            if split is None:
+                if n <= MAX_LEAF_SIZE:
+                    continue
+                # every centroid in one spot, halve the list instead
+                mask = np.arange(n) < n // 2
+            else:
+                mask = split
+
+            order[first:first + n] = np.concatenate([indices[mask], indices[~mask]])
+            middle = first + int(mask.sum())
+            left[node] = add_node(first, middle)
+            right[node] = add_node(middle, first + n)
+            stack.extend((left[node], right[node]))
+
+        self.order = order
+        self.triangles = triangles[order]
+        self.lo = np.array(lo, dtype=np.float32).reshape(-1, 3)
+        self.hi = np.array(hi, dtype=np.float32).reshape(-1, 3)
+        self.left = np.array(left, dtype=np.int32)
+        self.right = np.array(right, dtype=np.int32)
+        self.start = np.array(start, dtype=np.int32)
+        self.count = np.array(count, dtype=np.int32)
+
+    @staticmethod
+    def _find_split(
+        tri_lo: np.ndarray, tri_hi: np.ndarray, centroids: np.ndarray,
+        area: float, bins: int) -> np.ndarray | None:
+        """
+            Find the cheapest binned split of one node's triangles.
+
+            Returns:
+
+                Which triangles go to the left child, or None if
+                keeping the node as a leaf is cheaper.
+        """
+
+        n = len(centroids)
+        c_lo = centroids.min(axis = 0)
+        extent = centroids.max(axis = 0) - c_lo
+        best_cost = (float(n) - TRAVERSAL_COST) * area if n <= MAX_LEAF_SIZE else np.inf
+        best = None
+
+        for axis in range(3):
+            if extent[axis] <= 0.0:
+                continue
+            ids = ((centroids[:, axis] - c_lo[axis]) * (bins / extent[axis])).astype(np.int32)
+            np.minimum(ids, bins - 1, out = ids)
+
+            counts = np.bincount(ids, minlength = bins)
+            bin_lo = np.full((bins, 3), np.inf, dtype=np.float32)
+            bin_hi = np.full((bins, 3), -np.inf, dtype=np.float32)
+            np.minimum.at(bin_lo, ids, tri_lo)
+            np.maximum.at(bin_hi, ids, tri_hi)
+
+            # splitting after bin i puts bins 0..i on the left
+            left_lo = np.minimum.accumulate(bin_lo)[:-1]
+            left_hi = np.maximum.accumulate(bin_hi)[:-1]
+            right_lo = np.minimum.accumulate(bin_lo[::-1])[::-1][1:]
+            right_hi = np.maximum.accumulate(bin_hi[::-1])[::-1][1:]
+            left_count = np.cumsum(counts)[:-1]
+            right_count = n - left_count
+
+            with np.errstate(invalid = "ignore"):
+                costs = get_surface_areas(left_lo, left_hi) * left_count \
+                    + get_surface_areas(right_lo, right_hi) * right_count
+            costs[(left_count == 0) | (right_count == 0)] = np.inf
+
+            i = int(np.argmin(costs))
+            if costs[i] < best_cost:
+                best_cost = costs[i]
+                best = ids <= i
+        return best
+
+    def intersect(self,
+        origins: np.ndarray, directions: np.ndarray,
+        max_distance: float | np.ndarray = np.inf) -> tuple[np.ndarray, np.ndarray]:
+        """
+            Cast many rays at once. The rays go down the tree
+            together, one level per step, each dropping the nodes
+            behind its closest hit so far.
+
+            Parameters:
+
+                origins, directions: (n, 3) rays.
+
+                max_distance: hits farther than this are ignored.
+
+            Returns:
+
+                (n,) distance to each ray's closest hit, inf on a miss,
+                and (n,) index of the triangle hit, -1 on a miss, as
+                given to the constructor.
+        """
+
+        origins = np.asarray(origins, dtype=np.float64).reshape(-1, 3)
+        directions = np.asarray(directions, dtype=np.float64).reshape(-1, 3)
+        best = np.empty(len(origins))
+        best[:] = max_distance
+        hits = np.full(len(origins), -1, dtype=np.int64)
+        if len(self.count) == 0 or self.count[0] == 0:
+            return np.full(len(origins), np.inf), hits
+
+        with np.errstate(divide = "ignore"):
+            inverse = 1.0 / directions
+
+        rays = np.arange(len(origins))
+        nodes = np.zeros(len(origins), dtype=np.int32)
+        while len(rays):
+            # slabs; fmin and fmax skip the nans of 0 * inf
+            with np.errstate(invalid = "ignore"):
+                t0 = (self.lo[nodes] - origins[rays]) * inverse[rays]
+                t1 = (self.hi[nodes] - origins[rays]) * inverse[rays]
+            near = np.maximum(np.fmax.reduce(np.fmin(t0, t1), axis = 1), 0.0)
+            far = np.fmin.reduce(np.fmax(t0, t1), axis = 1)
+            keep = (near <= far) & (near < best[rays])
+            rays = rays[keep]
+            nodes = nodes[keep]
+
+            leaves = self.left[nodes] < 0
+            if np.any(leaves):
+                self._intersect_leaves(
+                    origins, directions, rays[leaves], nodes[leaves], best, hits)
+
+            inner = ~leaves
+            rays = np.concatenate([rays[inner], rays[inner]])
+            nodes = np.concatenate([self.left[nodes[inner]], self.right[nodes[inner]]])
+
+        distances = np.where(hits >= 0, best, np.inf)
+        return distances, np.where(hits >= 0, self.order[np.maximum(hits, 0)], -1)
+
+    def _intersect_leaves(self,
+        origins: np.ndarray, directions: np.ndarray,
+        rays: np.ndarray, nodes: np.ndarray,
+        best: np.ndarray, hits: np.ndarray) -> None:
+        """
+            Test each ray against every triangle of its leaf,
+            keeping the closest hits.
+        """
+
+        counts = self.count[nodes]
+        total = int(counts.sum())
+        if total == 0:
+            return
+        # the triangle index of every (ray, triangle) pair
+        offsets = np.repeat(np.cumsum(counts) - counts, counts)
+        triangles = np.repeat(self.start[nodes], counts) + np.arange(total) - offsets
+        rays = np.repeat(rays, counts)
+
+        t = intersect_triangles(origins[rays], directions[rays], self.triangles[triangles])
+        closer = t < best[rays]
+        if not np.any(closer):
+            return
+        rays, triangles, t = rays[closer], triangles[closer], t[closer]
+
+        # the closest of each ray's hits
+        order = np.lexsort((t, rays))
+        rays, triangles, t = rays[order], triangles[order], t[order]
+        first = np.ones(len(rays), dtype=bool)
+        first[1:] = rays[1:] != rays[:-1]
+        best[rays[first]] = t[first]
+        hits[rays[first]] = triangles[first]
+
+    def save(self, filepath: str) -> None:
+        """
+            Store the hierarchy, the triangles are not saved.
+        """
+
+        np.savez(
+            filepath, order = self.order, lo = self.lo, hi = self.hi,
+            left = self.left, right = self.right,
+            start = self.start, count = self.count)
+
+    @classmethod
+    def load(cls, filepath: str, triangles: np.ndarray) -> "TriangleBVH":
+        """
+            Read a hierarchy stored by save, for the same triangles.
+        """
+
+        bvh = cls()
+        with np.load(filepath) as data:
+            for name in ("order", "lo", "hi", "left", "right", "start", "count"):
+                setattr(bvh, name, data[name])
+        if len(bvh.order) != len(triangles):
+            raise ValueError("The stored BVH is for different triangles")
+        bvh.triangles = np.asarray(triangles, dtype=np.float32)[bvh.order]
+        return bvh
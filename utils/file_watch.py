@@ -0,0 +1,110 @@
+import os
+import queue
+import threading
+
+
+############################## helper functions ###############################
+
+def get_stamp(path: str) -> tuple[int, int] | None:
+    """
+        Returns a file's modification time and size,
+        or None if it doesn't exist.
+    """
+
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+class FileWatcher:
+    """
+        Polls a set of files from a background thread and reports
+        the ones which changed. A change is only reported once the
+        file has looked the same for a whole poll, so an editor
+        still writing it isn't picked up half saved.
+    """
+    __slots__ = ("interval", "stamps", "seen", "changes", "lock", "thread", "stopping")
+
+
+    def __init__(self, interval: float = 0.25):
+        """
+            Initialize the watcher.
+
+            Parameters:
+
+                interval: seconds between polls.
+        """
+
+        self.interval = interval
+        # path -> stamp last reported
+        self.stamps: dict[str, tuple[int, int] | None] = {}
+        # path -> stamp seen on the last poll
+        self.seen: dict[str, tuple[int, int] | None] = {}
+        self.changes = queue.SimpleQueue()
+        self.lock = threading.Lock()
+        self.thread: threading.Thread | None = None
+        self.stopping = threading.Event()
+
+    def watch(self, path: str) -> None:
+        """
+            Start watching a file, if it isn't already.
+        """
+
+        path = os.path.normpath(path)
+        with self.lock:
+            if path not in self.stamps:
+                self.stamps[path] = self.seen[path] = get_stamp(path)
+
+    def start(self) -> None:
+        """
+            Start polling.
+        """
+
+        self.stopping.clear()
+        self.thread = threading.Thread(
+            target = self._loop, name = "file watcher", daemon = True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        """
+            Stop polling, if started.
+        """
+
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def get_changes(self) -> set[str]:
+        """
+            Returns the files which changed since the last call.
+        """
+
+        changes = set()
+        while not self.changes.empty():
+            changes.add(self.changes.get())
+        return changes
+
+    def _loop(self) -> None:
+
+        while not self.stopping.wait(self.interval):
+            self.poll()
+
+    def poll(self) -> None:
+        """
+            Check every watched file once.
+        """
+
+        with self.lock:
+            paths = list(self.stamps)
+
+        for path in paths:
+            stamp = get_stamp(path)
+            with self.lock:
+                settled = stamp == self.seen[path]
+                self.seen[path] = stamp
+                if not settled or stamp == self.stamps[path] or stamp is None:
+                    continue
+                self.stamps[path] = stamp
+            self.changes.put(path)
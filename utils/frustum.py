@@ -0,0 +1,62 @@
+import numpy as np
+
+############################## helper functions ###############################
+
+def extract_planes(view_projection: np.ndarray) -> np.ndarray:
+    """
+        Returns the six planes bounding a view volume.
+
+        Parameters:
+
+            view_projection: world to clip space transform, in the
+                row vector convention used by pyrr (view @ projection).
+
+        Returns:
+
+            A (6, 4) array of planes (a, b, c, d), normals pointing
+            inwards, so points inside satisfy a*x + b*y + c*z + d >= 0.
+    """
+
+    m = np.asarray(view_projection, dtype=np.float64)
+    # pyrr's matrices are transposed, the clip space rows are its columns
+    x, y, z, w = m[:, 0], m[:, 1], m[:, 2], m[:, 3]
+    planes = np.stack([w + x, w - x, w + y, w - y, w + z, w - z])
+    lengths = np.linalg.norm(planes[:, :3], axis = 1, keepdims = True)
+    return planes / np.maximum(lengths, 1e-12)
+
+def aabb_in_frustum(planes: np.ndarray, lo: np.ndarray, hi: np.ndarray) -> bool:
+    """
+        Returns whether an axis aligned box is at least
+        partly inside the planes.
+
+        Parameters:
+
+            planes: (6, 4) planes from extract_planes.
+
+            lo: the box's minimum corner.
+
+            hi: the box's maximum corner.
+    """
+
+    # the corner furthest along each plane's normal
+    corners = np.where(planes[:, :3] >= 0, hi, lo)
+    distances = np.einsum("ij,ij->i", planes[:, :3], corners) + planes[:, 3]
+    return bool(np.all(distances >= 0))
+
+def spheres_in_frustum(
+    planes: np.ndarray, centers: np.ndarray, radii: np.ndarray) -> np.ndarray:
+    """
+        Returns a mask of the spheres which are at least
+        partly inside the planes.
+
+        Parameters:
+
+            planes: (6, 4) planes from extract_planes.
+
+            centers: (n, 3) sphere centres.
+
+            radii: (n,) sphere radii.
+    """
+
+    distances = centers @ planes[:, :3].T + planes[:, 3]
+    return np.all(distances >= -np.asarray(radii)[:, None], axis = 1)
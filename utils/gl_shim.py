@@ -0,0 +1,235 @@
+from collections import deque
+import functools
+import time
+import types
+
+from utils.gl_stub import StubGL, find_gl_names, install as install_stub, replace_gl
+
+# calls made outside any render pass
+NO_PASS = "(none)"
+
+# the recorder fed by the installed shim, if any
+_recorder = None
+
+############################## helper functions ###############################
+
+def get_recorder():
+    """
+        Returns the GLRecorder of the installed shim, or None
+        when OpenGL.GL is the real, unwrapped module.
+    """
+
+    return _recorder
+
+def install_counting(recorder: "GLRecorder | None" = None) -> "GLRecorder":
+    """
+        Wrap every function of the real OpenGL.GL so calls are
+        counted and timed. Call before the graphics modules are
+        imported, after choosing PYOPENGL_PLATFORM.
+
+        Returns:
+
+            The recorder the calls go to.
+    """
+
+    global _recorder
+    import OpenGL.GL
+
+    _recorder = recorder or GLRecorder()
+    replace_gl(CountingGL(OpenGL.GL, _recorder))
+    return _recorder
+
+def install_recording(
+    recorder: "GLRecorder | None" = None, root: str = ".") -> "GLRecorder":
+    """
+        Replace OpenGL.GL with a stub which needs no context and
+        logs every call. Call before anything imports OpenGL.
+
+        Parameters:
+
+            recorder: receives the calls, by default a new one
+                which keeps each frame's call log.
+
+            root: directory whose sources decide which names
+                the stub exports.
+
+        Returns:
+
+            The recorder the calls go to.
+    """
+
+    global _recorder
+
+    install_stub(root)
+    _recorder = recorder or GLRecorder(keep_log = True)
+    replace_gl(RecordingGL(find_gl_names(root), _recorder))
+    return _recorder
+
+class GLRecorder:
+    """
+        Counts GL calls and the time spent in them, by function and
+        by render pass, and turns each frame's totals into a report.
+    """
+    __slots__ = ("calls", "seconds", "passes", "log", "keep_log", "frames")
+
+
+    def __init__(self, keep_log: bool = False, history: int = 240):
+        """
+            Initialize the recorder.
+
+            Parameters:
+
+                keep_log: also keep every call, with its arguments,
+                    in the frame reports.
+
+                history: number of frame reports kept.
+        """
+
+        # (pass, function) -> calls and seconds this frame
+        self.calls: dict[tuple[str, str], int] = {}
+        self.seconds: dict[tuple[str, str], float] = {}
+        self.passes: list[str] = []
+        # (pass, function, arguments) this frame
+        self.log: list[tuple[str, str, tuple]] = []
+        self.keep_log = keep_log
+        self.frames: deque[dict] = deque(maxlen = history)
+
+    def record(self, function: str, seconds: float, args: tuple = ()) -> None:
+        """
+            Count one call.
+        """
+
+        key = (self.passes[-1] if self.passes else NO_PASS, function)
+        self.calls[key] = self.calls.get(key, 0) + 1
+        self.seconds[key] = self.seconds.get(key, 0.0) + seconds
+        if self.keep_log:
+            self.log.append((*key, args))
+
+    def begin_pass(self, name: str) -> None:
+
+        self.passes.append(name)
+
+    def end_pass(self) -> None:
+
+        self.passes.pop()
+
+    def end_frame(self) -> dict:
+        """
+            Close the current frame.
+
+            Returns:
+
+                The frame's report: total calls and milliseconds, the
+                same by function and by pass, and the call log if kept.
+        """
+
+        by_function: dict[str, dict] = {}
+        by_pass: dict[str, dict] = {}
+        for (pass_name, function), calls in self.calls.items():
+            milliseconds = 1000.0 * self.seconds[(pass_name, function)]
+            for table, name in ((by_function, function), (by_pass, pass_name)):
+                entry = table.setdefault(name, {"calls": 0, "ms": 0.0})
+                entry["calls"] += calls
+                entry["ms"] += milliseconds
+            functions = by_pass[pass_name].setdefault("functions", {})
+            functions[function] = calls
+
+        report = {
+            "calls": sum(self.calls.values()),
+            "ms": 1000.0 * sum(self.seconds.values()),
+            "by_function": by_function,
+            "by_pass": by_pass,
+        }
+        if self.keep_log:
+            report["log"] = self.log
+            self.log = []
+        self.frames.append(report)
+        self.calls = {}
+        self.seconds = {}
+        return report
+
+    def summarize(self, top: int = 15) -> str:
+        """
+            Returns a text table of the average calls and
+            milliseconds per frame over the kept reports.
+        """
+
+        if not self.frames:
+            return "No frames recorded"
+
+        count = len(self.frames)
+        lines = [f"GL calls per frame, over {count} frames: "
+                 f"{sum(f['calls'] for f in self.frames) / count:.1f} calls, "
+                 f"{sum(f['ms'] for f in self.frames) / count:.3f} ms"]
+        for title, key, limit in (("pass", "by_pass", None), ("function", "by_function", top)):
+            totals: dict[str, list[float]] = {}
+            for frame in self.frames:
+                for name, entry in frame[key].items():
+                    total = totals.setdefault(name, [0.0, 0.0])
+                    total[0] += entry["calls"]
+                    total[1] += entry["ms"]
+            lines.append(f"{'calls':>10} {'ms':>10}  {title}")
+            ranked = sorted(totals.items(), key = lambda item: -item[1][1])
+            for name, (calls, milliseconds) in ranked[:limit]:
+                lines.append(f"{calls / count:10.1f} {milliseconds / count:10.3f}  {name}")
+        return "\n".join(lines)
+
+class CountingGL(types.ModuleType):
+    """
+        OpenGL.GL with every gl function wrapped to report its calls
+        and their duration, PyOpenGL's own overhead included.
+    """
+
+
+    def __init__(self, gl: types.ModuleType, recorder: GLRecorder):
+        """
+            Parameters:
+
+                gl: the real OpenGL.GL.
+
+                recorder: receives the calls.
+        """
+
+        super().__init__("OpenGL.GL")
+        for name, value in vars(gl).items():
+            # keep __path__ so OpenGL.GL's submodules still import
+            if name.startswith("__") and name not in ("__path__", "__all__"):
+                continue
+            if name.startswith("gl") and callable(value):
+                value = self._wrap(name, value, recorder)
+            setattr(self, name, value)
+
+    @staticmethod
+    def _wrap(name: str, function, recorder: GLRecorder):
+
+        @functools.wraps(function)
+        def counted(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                recorder.record(name, time.perf_counter() - start)
+        return counted
+
+class RecordingGL(StubGL):
+    """
+        The context free stub, logging each call to a recorder.
+    """
+
+
+    def __init__(self, names: set[str], recorder: GLRecorder):
+
+        self.recorder = recorder
+        super().__init__(names)
+
+    def _make_function(self, name: str):
+
+        function = super()._make_function(name)
+
+        def recorded(*args):
+            start = time.perf_counter()
+            try:
+                return function(*args)
+            finally:
+                self.recorder.record(name, time.perf_counter() - start, args)
+        return recorded
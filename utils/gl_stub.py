@@ -0,0 +1,169 @@
+import ctypes
+import itertools
+import os
+import re
+import sys
+import types
+
+import numpy as np
+
+GL_NAME = re.compile(r"\b(gl[A-Z]\w*|GL_\w+)\b")
+
+# constants whose value the code compares against
+KNOWN_CONSTANTS = {
+    "GL_FALSE": 0,
+    "GL_TRUE": 1,
+    "GL_NONE": 0,
+    "GL_NO_ERROR": 0,
+    "GL_INVALID_INDEX": 0xFFFFFFFF,
+    "GL_FRAMEBUFFER_COMPLETE": 0x8CD5,
+    "GL_ALREADY_SIGNALED": 0x911A,
+    "GL_TIMEOUT_EXPIRED": 0x911B,
+}
+
+############################## helper functions ###############################
+
+def find_gl_names(root: str) -> set[str]:
+    """
+        Returns every gl function and GL_ constant named in
+        the Python sources under a directory.
+    """
+
+    names = set()
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            if filename.endswith(".py"):
+                with open(os.path.join(directory, filename), "r") as f:
+                    names.update(GL_NAME.findall(f.read()))
+    return names
+
+def install(root: str = ".") -> "StubGL":
+    """
+        Put a stub OpenGL.GL in place of the real one, so the
+        graphics modules can be imported and driven without a
+        context. Call before anything imports OpenGL.
+
+        Parameters:
+
+            root: directory whose sources decide which names
+                the stub exports.
+
+        Returns:
+
+            The stub module.
+    """
+
+    if isinstance(sys.modules.get("OpenGL.GL"), StubGL):
+        return sys.modules["OpenGL.GL"]
+    if "OpenGL.GL" in sys.modules:
+        raise RuntimeError("OpenGL.GL was imported before the stub was installed")
+
+    stub = StubGL(find_gl_names(root))
+    package = types.ModuleType("OpenGL")
+    package.__path__ = []
+    sys.modules["OpenGL"] = package
+    replace_gl(stub)
+    return stub
+
+def replace_gl(module: types.ModuleType) -> None:
+    """
+        Make module what later imports of OpenGL.GL get.
+        Modules which already star imported it keep the old names.
+    """
+
+    sys.modules["OpenGL.GL"] = module
+    sys.modules["OpenGL"].GL = module
+
+class StubGL(types.ModuleType):
+    """
+        A module standing in for OpenGL.GL. Every function does
+        nothing and returns something plausible: fresh names from
+        glGen* and glCreate*, success from status queries, zero from
+        everything else, so the CPU side of rendering runs as usual.
+    """
+
+
+    def __init__(self, names: set[str]):
+        """
+            Build the stub.
+
+            Parameters:
+
+                names: the functions and constants to export.
+        """
+
+        super().__init__("OpenGL.GL")
+        self.__all__ = ["ctypes"]
+        self.ctypes = ctypes
+
+        self._names = itertools.count(1)
+        values = itertools.count(0x10000)
+        for name in sorted(names):
+            if name.startswith("GL_"):
+                setattr(self, name, KNOWN_CONSTANTS.get(name, next(values)))
+            else:
+                setattr(self, name, self._make_function(name))
+            self.__all__.append(name)
+
+    def _make_function(self, name: str):
+        """
+            Returns the stand in for one gl function.
+        """
+
+        if name.startswith("glGen"):
+            return self._generate
+        if name.startswith("glCreate"):
+            return lambda *args: next(self._names)
+        if name in ("glGetProgramiv", "glGetShaderiv"):
+            return self._get_status
+        if name == "glGetUniformBlockIndex":
+            return lambda *args: KNOWN_CONSTANTS["GL_INVALID_INDEX"]
+        if name == "glCheckFramebufferStatus":
+            return lambda *args: KNOWN_CONSTANTS["GL_FRAMEBUFFER_COMPLETE"]
+        if name == "glClientWaitSync":
+            return lambda *args: KNOWN_CONSTANTS["GL_ALREADY_SIGNALED"]
+        if name == "glFenceSync":
+            return lambda *args: object()
+        if name in ("glGetString", "glGetStringi"):
+            return lambda *args: b"stub"
+        if name in ("glGetProgramInfoLog", "glGetShaderInfoLog"):
+            return lambda *args: b""
+        if name.startswith("glGetQueryObject"):
+            return self._get_query
+        if name == "glGetActiveUniform":
+            return lambda *args: (b"", 1, 0)
+        if name == "glReadPixels":
+            return lambda x, y, width, height, *args: bytes(4 * width * height)
+        if name.startswith("glGet"):
+            return lambda *args: 0
+        return lambda *args: None
+
+    def _generate(self, count: int, *args):
+        """
+            glGen*: one name as an int, several as an array.
+        """
+
+        if count == 1:
+            return next(self._names)
+        return np.array([next(self._names) for _ in range(count)], dtype=np.uint32)
+
+    def _get_query(self, query: int, pname: int, out) -> None:
+        """
+            glGetQueryObject*: results are available at
+            once and every pass took no time.
+        """
+
+        out[...] = 1 if pname == getattr(self, "GL_QUERY_RESULT_AVAILABLE", None) else 0
+
+    def _get_status(self, handle: int, pname: int) -> int:
+        """
+            glGetProgramiv and glGetShaderiv: every build succeeds,
+            and there are no uniforms or binaries to list.
+        """
+
+        if pname in (
+            getattr(self, "GL_ACTIVE_UNIFORMS", None),
+            getattr(self, "GL_PROGRAM_BINARY_LENGTH", None),
+            getattr(self, "GL_INFO_LOG_LENGTH", None)):
+            return 0
+        return KNOWN_CONSTANTS["GL_TRUE"]
@@ -0,0 +1,75 @@
+import os
+import re
+
+INCLUDE_PATTERN = re.compile(r'^\s*#include\s+"([^"]+)"\s*$')
+
+############################## helper functions ###############################
+
+def load_source(
+    filepath: str, defines: dict[str, object] | None = None) -> tuple[str, list[str]]:
+    """
+        Read a GLSL file, expanding its #include directives
+        and adding the given defines.
+
+        Parameters:
+
+            filepath: path to the source file.
+
+            defines: preprocessor symbols, inserted after #version.
+
+        Returns:
+
+            The final source, and every file it was built from.
+    """
+
+    dependencies = []
+    source = _expand(filepath, dependencies, [])
+    return apply_defines(source, defines), dependencies
+
+def _expand(filepath: str, dependencies: list[str], stack: list[str]) -> str:
+    """
+        Returns a file's source with its includes pasted in,
+        each file at most once.
+    """
+
+    filepath = os.path.normpath(filepath)
+    if filepath in stack:
+        raise RuntimeError(
+            f"Circular #include: {' -> '.join(stack + [filepath])}")
+    if filepath in dependencies:
+        return ""
+    dependencies.append(filepath)
+
+    with open(filepath, "r") as f:
+        lines = f.readlines()
+
+    result = []
+    for line in lines:
+        match = INCLUDE_PATTERN.match(line)
+        if match is None:
+            result.append(line)
+            continue
+        # includes are relative to the including file
+        included = os.path.join(os.path.dirname(filepath), match.group(1))
+        result.append(_expand(included, dependencies, stack + [filepath]))
+        if not result[-1].endswith("\n"):
+            result.append("\n")
+    return "".join(result)
+
+def apply_defines(source: str, defines: dict[str, object] | None) -> str:
+    """
+        Returns GLSL source with a #define for each entry
+        inserted just after its #version line.
+    """
+
+    if not defines:
+        return source
+
+    lines = source.splitlines(keepends = True)
+    insert_at = 0
+    for i, line in enumerate(lines):
+        if line.strip().startswith("#version"):
+            insert_at = i + 1
+            break
+    block = "".join(f"#define {name} {value}\n" for name, value in defines.items())
+    return "".join(lines[:insert_at]) + block + "".join(lines[insert_at:])
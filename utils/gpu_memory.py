@@ -0,0 +1,266 @@
+import logging
+import os
+import sys
+
+log = logging.getLogger(__name__)
+
+# bytes per texel of the internal formats in use, as the format
+# states them; drivers may pad, three channel formats especially
+TEXEL_BYTES = {
+    "GL_R8": 1,
+    "GL_RGB": 3,
+    "GL_RGB8": 3,
+    "GL_RGBA": 4,
+    "GL_RGBA8": 4,
+    "GL_RGB16F": 6,
+    "GL_RGBA16F": 8,
+    "GL_DEPTH_COMPONENT": 4,
+    "GL_DEPTH_COMPONENT24": 4,
+    "GL_DEPTH_COMPONENT32F": 4,
+    "GL_DEPTH24_STENCIL8": 4,
+}
+# frames of the call stack kept as a resource's creation site
+SITE_DEPTH = 6
+
+############################## helper functions ###############################
+
+def get_format_name(internal_format) -> str:
+    """
+        Returns the name of a GL format constant,
+        or the format itself if it is already a name.
+    """
+
+    if isinstance(internal_format, str):
+        return internal_format
+    return getattr(internal_format, "name", str(internal_format))
+
+def get_site(skip: int = 1) -> tuple[str, ...]:
+    """
+        Returns the innermost frames of the caller's stack,
+        each as "file:line function", innermost first.
+
+        Parameters:
+
+            skip: frames to leave out, 1 starts at the caller.
+    """
+
+    frame = sys._getframe(skip)
+    site = []
+    while frame is not None and len(site) < SITE_DEPTH:
+        code = frame.f_code
+        filename = os.path.relpath(code.co_filename)
+        site.append(f"{filename}:{frame.f_lineno} {code.co_name}")
+        frame = frame.f_back
+    return tuple(site)
+
+def format_bytes(count: int) -> str:
+    """
+        Returns a byte count in readable units.
+    """
+
+    if count < 1024:
+        return f"{count} B"
+    for unit in ("KiB", "MiB", "GiB"):
+        count /= 1024
+        if count < 1024 or unit == "GiB":
+            return f"{count:.1f} {unit}"
+
+class GPUResource:
+    """
+        One buffer, texture or renderbuffer and the memory it holds.
+    """
+    __slots__ = ("kind", "handle", "nbytes", "format", "owner", "site")
+
+
+    def __init__(self,
+        kind: str, handle: int, nbytes: int,
+        format: str, owner: str, site: tuple[str, ...]):
+        """
+            Initialize the record.
+
+            Parameters:
+
+                kind: "buffer", "texture" or "renderbuffer".
+
+                handle: the GL name of the object.
+
+                nbytes: memory the object holds.
+
+                format: what it holds, a texel format or buffer use.
+
+                owner: the asset it belongs to, e.g. a model's path.
+
+                site: the call stack which created it.
+        """
+
+        self.kind = kind
+        self.handle = handle
+        self.nbytes = nbytes
+        self.format = format
+        self.owner = owner
+        self.site = site
+
+    def __repr__(self) -> str:
+
+        return (f"{self.kind} {self.handle} {format_bytes(self.nbytes)} "
+                f"{self.format} of {self.owner}, created at {self.site[0]}")
+
+class GPUMemory:
+    """
+        Accounts for the GPU memory behind every buffer, texture and
+        renderbuffer the engine allocates, by what owns it and where
+        it was created. Resources are tracked when their storage is
+        allocated and released when they are deleted, so whatever is
+        still tracked after everything was destroyed was leaked.
+
+        Only the GL thread allocates, so there is no locking.
+    """
+    __slots__ = ("resources",)
+
+
+    def __init__(self):
+        """
+            Initialize an empty tracker.
+        """
+
+        # (kind, handle) -> its record
+        self.resources: dict[tuple[str, int], GPUResource] = {}
+
+    def _track(self,
+        kind: str, handle: int, nbytes: int, format: str, owner: str) -> None:
+        """
+            Record an object's storage. Storage reallocated for an
+            object already tracked replaces its size and format,
+            it keeps its owner and creation site.
+        """
+
+        key = (kind, int(handle))
+        resource = self.resources.get(key)
+        if resource is not None:
+            resource.nbytes = int(nbytes)
+            resource.format = format
+            return
+        self.resources[key] = GPUResource(
+            kind, int(handle), int(nbytes), format, owner, get_site(3))
+
+    def track_buffer(self, handle: int, nbytes: int, use: str, owner: str) -> None:
+        """
+            Record a buffer's storage, as allocated by glBufferData.
+
+            Parameters:
+
+                use: what the buffer holds, e.g. "vertices".
+        """
+
+        self._track("buffer", handle, nbytes, use, owner)
+
+    def track_texture(self,
+        handle: int, width: int, height: int, internal_format, owner: str,
+        mipmaps: bool = False, layers: int = 1) -> None:
+        """
+            Record a texture's storage.
+
+            Parameters:
+
+                internal_format: the GL format constant, or its name.
+
+                mipmaps: whether it has a full mipmap chain,
+                    a third more memory.
+
+                layers: number of images, 6 for a cube map.
+        """
+
+        name = get_format_name(internal_format)
+        nbytes = width * height * TEXEL_BYTES.get(name, 4) * layers
+        if mipmaps:
+            nbytes = nbytes * 4 // 3
+        self._track("texture", handle, nbytes, name, owner)
+
+    def track_renderbuffer(self,
+        handle: int, width: int, height: int, internal_format, owner: str) -> None:
+        """
+            Record a renderbuffer's storage.
+        """
+
+        name = get_format_name(internal_format)
+        self._track(
+            "renderbuffer", handle, width * height * TEXEL_BYTES.get(name, 4),
+            name, owner)
+
+    def release(self, kind: str, *handles: int) -> None:
+        """
+            Forget deleted objects of one kind.
+        """
+
+        for handle in handles:
+            self.resources.pop((kind, int(handle)), None)
+
+    def get_total(self) -> int:
+        """
+            Returns the bytes held by every tracked object.
+        """
+
+        return sum(resource.nbytes for resource in self.resources.values())
+
+    def get_totals(self, by: str = "kind") -> dict[str, int]:
+        """
+            Returns the bytes held, summed by "kind", "owner"
+            or "format", largest first.
+        """
+
+        totals: dict[str, int] = {}
+        for resource in self.resources.values():
+            key = getattr(resource, by)
+            totals[key] = totals.get(key, 0) + resource.nbytes
+        return dict(sorted(totals.items(), key = lambda item: -item[1]))
+
+    def get_top(self, count: int = 10) -> list[GPUResource]:
+        """
+            Returns the objects holding the most memory.
+        """
+
+        return sorted(
+            self.resources.values(), key = lambda resource: -resource.nbytes)[:count]
+
+    def summarize(self, count: int = 10) -> str:
+        """
+            Returns a text report: the total, the totals by kind
+            and by owner, and the largest objects.
+        """
+
+        lines = [f"GPU memory: {format_bytes(self.get_total())} "
+                 f"in {len(self.resources)} objects"]
+        for title, by in (("by kind", "kind"), ("by owner", "owner")):
+            lines.append(f"  {title}:")
+            for key, nbytes in list(self.get_totals(by).items())[:count]:
+                lines.append(f"    {format_bytes(nbytes):>12}  {key}")
+        lines.append("  largest:")
+        for resource in self.get_top(count):
+            lines.append(f"    {format_bytes(resource.nbytes):>12}  {resource.kind} "
+                         f"{resource.handle} {resource.format} of {resource.owner}, "
+                         f"{resource.site[0]}")
+        return "\n".join(lines)
+
+    def check_leaks(self) -> list[GPUResource]:
+        """
+            Log every object still tracked, call once everything
+            has been destroyed.
+
+            Returns:
+
+                The leaked objects.
+        """
+
+        leaks = sorted(
+            self.resources.values(), key = lambda resource: -resource.nbytes)
+        if not leaks:
+            return leaks
+        log.warning(
+            "%d GPU objects leaked, %s", len(leaks),
+            format_bytes(sum(resource.nbytes for resource in leaks)))
+        for resource in leaks:
+            log.warning("Leaked %r\n    %s", resource, "\n    ".join(resource.site))
+        return leaks
+
+# the process wide tracker
+GPU_MEMORY = GPUMemory()
@@ -1,10 +1,20 @@
+import logging
 import os
 from OpenGL.GL import *
-from OpenGL.GL.shaders import compileProgram, compileShader
+from utils.glsl import load_source
+from utils.program_cache import ProgramCache, PendingProgram, build_programs, submit_programs
+from utils.trace import TRACER
+
+log = logging.getLogger(__name__)
+
+# linked programs, kept between launches
+PROGRAM_CACHE = ProgramCache()
 
 ############################## helper functions ###############################
 
-def create_shader(vertex_filepath: str, fragment_filepath: str) -> int:
+def create_shader(
+    vertex_filepath: str, fragment_filepath: str,
+    defines: dict[str, object] | None = None) -> int:
     """
         Compile and link shader modules to make a shader program.
 
@@ -15,22 +25,64 @@ def create_shader(vertex_filepath: str, fragment_filepath: str) -> int:
             
             fragment_filepath: path to the text file storing the
                                 fragment source code
+
+            defines: preprocessor symbols added to both stages
         
         Returns:
 
             A handle to the created shader program
     """
 
-    with open(vertex_filepath,'r') as f:
-        vertex_src = f.readlines()
+    return create_shaders([(vertex_filepath, fragment_filepath, defines)])[0]
 
-    with open(fragment_filepath,'r') as f:
-        fragment_src = f.readlines()
-    
-    shader = compileProgram(compileShader(vertex_src, GL_VERTEX_SHADER),
-                            compileShader(fragment_src, GL_FRAGMENT_SHADER))
-    
-    return shader
+def create_shaders(
+    programs: list[tuple[str, str, dict[str, object] | None]]) -> list[int]:
+    """
+        Make several shader programs at once, loading them from
+        the program cache when possible and otherwise compiling
+        them concurrently where the driver allows.
+
+        Parameters:
+
+            programs: (vertex filepath, fragment filepath, defines)
+                for each program.
+
+        Returns:
+
+            Handles to the created shader programs, in the same order.
+    """
+
+    return build_programs(_get_program_sources(programs), PROGRAM_CACHE)
+
+def submit_shaders(
+    programs: list[tuple[str, str, dict[str, object] | None]]) -> list[int | PendingProgram]:
+    """
+        Like create_shaders, but without waiting on the driver:
+        programs missing from the cache come back pending, to be
+        finished with utils.program_cache.finish_program.
+    """
+
+    return submit_programs(_get_program_sources(programs), PROGRAM_CACHE)
+
+def _get_program_sources(
+    programs: list[tuple[str, str, dict[str, object] | None]]) -> list[tuple]:
+    """
+        Returns the name and final stage sources of each program.
+    """
+
+    jobs = []
+    for vertex_filepath, fragment_filepath, defines in programs:
+        name = f"{os.path.basename(vertex_filepath)}+{os.path.basename(fragment_filepath)}"
+        if defines:
+            name += " " + ",".join(defines)
+
+        with TRACER.span("preprocess shader", program = name):
+            vertex_src, _ = load_source(vertex_filepath, defines)
+            fragment_src, _ = load_source(fragment_filepath, defines)
+
+        jobs.append((name, [
+            (GL_VERTEX_SHADER, vertex_src), (GL_FRAGMENT_SHADER, fragment_src)]))
+    return jobs
 
 
 def load_mesh(filename: str) -> tuple[list[float], str | None]:
@@ -70,10 +122,10 @@ def load_mesh(filename: str) -> tuple[list[float], str | None]:
 
     texture_path = None
     if mtl_file and material_name:
-        texture_path = parse_mtl_for_texture(filename, mtl_file, material_name)
+        with TRACER.span("parse mtl", file = mtl_file):
+            texture_path = parse_mtl_for_texture(filename, mtl_file, material_name)
 
-    print("MTL file:", mtl_file)
-    print("Material used:", material_name)
+    log.debug("%s: mtl file %s, material %s", filename, mtl_file, material_name)
 
     return vertices, texture_path
 
@@ -142,6 +194,18 @@ def make_corner(corner_description: str,
         vertices.append(element)
 
 
+def get_mtl_path(obj_file_path: str) -> str | None:
+    """
+    Returns the path of the .mtl file an obj file references, if any.
+    """
+    with open(obj_file_path, "r") as file:
+        for line in file:
+            words = line.strip().split()
+            if len(words) > 1 and words[0] == "mtllib":
+                return os.path.join(os.path.dirname(obj_file_path), words[1])
+    return None
+
+
 def parse_mtl_for_texture(obj_file_path: str, mtl_file_name: str, target_material: str) -> str | None:
     """
     Try to parse the .mtl file to find the texture file used by a material.
@@ -214,7 +278,8 @@ def load_multi_material_mesh(obj_file_path: str) -> dict[str, dict]:
     # Attach texture paths
     if mtl_file:
         mtl_path = os.path.join(os.path.dirname(obj_file_path), mtl_file)
-        parse_mtl_for_material_textures(mtl_path, material_groups)
+        with TRACER.span("parse mtl", file = mtl_path):
+            parse_mtl_for_material_textures(mtl_path, material_groups)
 
     return material_groups
 
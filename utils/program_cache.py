@@ -0,0 +1,387 @@
+import hashlib
+import logging
+import os
+import time
+
+from OpenGL.GL import *
+from OpenGL.error import GLError
+import numpy as np
+
+from utils.trace import TRACER
+
+log = logging.getLogger(__name__)
+
+# from GL_KHR_parallel_shader_compile
+GL_MAX_SHADER_COMPILER_THREADS_KHR = 0x91B0
+GL_COMPLETION_STATUS_KHR = 0x91B1
+
+_extensions: set[str] | None = None
+_parallel: bool | None = None
+
+############################## helper functions ###############################
+
+def get_extensions() -> set[str]:
+    """
+        Returns the names of the extensions the current
+        context supports.
+    """
+
+    global _extensions
+    if _extensions is None:
+        count = glGetIntegerv(GL_NUM_EXTENSIONS)
+        _extensions = {
+            glGetStringi(GL_EXTENSIONS, i).decode() for i in range(count)
+        }
+    return _extensions
+
+def is_parallel() -> bool:
+    """
+        Returns whether the driver compiles shaders on its own
+        threads, asking it to use as many as it likes the
+        first time.
+    """
+
+    global _parallel
+    if _parallel is None:
+        _parallel = "GL_KHR_parallel_shader_compile" in get_extensions()
+        if _parallel:
+            # let the driver pick the number of threads
+            from OpenGL.GL.KHR.parallel_shader_compile import glMaxShaderCompilerThreadsKHR
+            glMaxShaderCompilerThreadsKHR(0xFFFFFFFF)
+    return _parallel
+
+def get_driver() -> str:
+    """
+        Returns the vendor, renderer and version strings
+        of the current context.
+    """
+
+    return "|".join(
+        glGetString(name).decode() for name in (GL_VENDOR, GL_RENDERER, GL_VERSION))
+
+class ProgramCache:
+    """
+        Stores linked shader programs as driver binaries on disk,
+        so later launches can skip compiling and linking.
+    """
+    __slots__ = ("directory", "enabled", "timings")
+
+
+    def __init__(self, directory: str = ".shader_cache"):
+        """
+            Initialize the cache.
+
+            Parameters:
+
+                directory: where the binaries are kept.
+        """
+
+        self.directory = directory
+        self.enabled: bool | None = None
+        # name -> (how the program was made, milliseconds)
+        self.timings: dict[str, tuple[str, float]] = {}
+
+    def is_enabled(self) -> bool:
+        """
+            Returns whether the driver can save and load
+            program binaries.
+        """
+
+        if self.enabled is None:
+            self.enabled = (
+                "GL_ARB_get_program_binary" in get_extensions()
+                or glGetIntegerv(GL_NUM_PROGRAM_BINARY_FORMATS) > 0)
+        return self.enabled
+
+    def get_key(self, sources: list[str]) -> str:
+        """
+            Returns the cache key of a program: its final sources
+            (defines included) and the driver that built it.
+        """
+
+        digest = hashlib.sha256(get_driver().encode())
+        for source in sources:
+            digest.update(b"\0")
+            digest.update(source.encode())
+        return digest.hexdigest()
+
+    def _get_path(self, key: str) -> str:
+
+        return os.path.join(self.directory, f"{key}.bin")
+
+    def load(self, key: str) -> int | None:
+        """
+            Returns a program made from a cached binary, or None
+            if there is no binary or the driver rejects it.
+        """
+
+        if not self.is_enabled():
+            return None
+
+        path = self._get_path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        if len(data) <= 4:
+            return None
+
+        binary_format = int(np.frombuffer(data[:4], dtype=np.uint32)[0])
+        binary = np.frombuffer(data[4:], dtype=np.uint8)
+
+        program = glCreateProgram()
+        try:
+            glProgramBinary(program, binary_format, binary, len(binary))
+            linked = glGetProgramiv(program, GL_LINK_STATUS) == GL_TRUE
+        except GLError as error:
+            # e.g. a format the driver no longer lists
+            log.debug("Cached binary of %s rejected: %s", key, error)
+            linked = False
+        if not linked:
+            # the driver changed underneath us, recompile
+            glDeleteProgram(program)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return program
+
+    def store(self, key: str, program: int) -> None:
+        """
+            Save a linked program's binary.
+        """
+
+        if not self.is_enabled():
+            return
+
+        length = glGetProgramiv(program, GL_PROGRAM_BINARY_LENGTH)
+        if length <= 0:
+            return
+        binary = np.zeros(length, dtype=np.uint8)
+        written = np.zeros(1, dtype=np.int32)
+        binary_format = np.zeros(1, dtype=np.uint32)
+        glGetProgramBinary(program, length, written, binary_format, binary)
+
+        os.makedirs(self.directory, exist_ok = True)
+        path = self._get_path(key)
+        # write then rename, so a crash never leaves half a binary
+        with open(path + ".tmp", "wb") as f:
+            f.write(binary_format.tobytes())
+            f.write(binary[:written[0]].tobytes())
+        os.replace(path + ".tmp", path)
+
+    def record(self, name: str, source: str, milliseconds: float) -> None:
+        """
+            Note how a program was made and how long it took.
+        """
+
+        self.timings[name] = (source, milliseconds)
+        log.debug("%s: %s in %.2f ms", name, source, milliseconds)
+
+    def report(self) -> dict[str, float]:
+        """
+            Returns the total time spent on cache hits and on
+            compiles, in milliseconds, with their counts.
+        """
+
+        report = {"cache": 0.0, "compile": 0.0, "cache_count": 0, "compile_count": 0}
+        for source, milliseconds in self.timings.values():
+            report[source] += milliseconds
+            report[f"{source}_count"] += 1
+        return report
+
+    def log_report(self, when: str, count: int = 10) -> None:
+        """
+            Log the totals and the slowest programs, then forget
+            them, so the next report only covers newer programs.
+
+            Parameters:
+
+                when: what the programs were made for, e.g. "startup".
+
+                count: number of programs listed.
+        """
+
+        if not self.timings:
+            return
+        report = self.report()
+        log.info(
+            "Programs for %s: %d from cache in %.1f ms, %d compiled in %.1f ms",
+            when, report["cache_count"], report["cache"],
+            report["compile_count"], report["compile"])
+        slowest = sorted(self.timings.items(), key = lambda item: -item[1][1])
+        for name, (source, milliseconds) in slowest[:count]:
+            log.info("    %8.2f ms  %-7s  %s", milliseconds, source, name)
+        self.timings.clear()
+
+class PendingProgram:
+    """
+        A program whose shaders were submitted to the driver
+        but whose status hasn't been checked yet.
+    """
+    __slots__ = ("name", "key", "program", "shaders", "start")
+
+
+    def __init__(self, name: str, key: str, sources: list[tuple[int, str]]):
+        """
+            Submit the shaders for compiling and the program
+            for linking, without waiting on either.
+
+            Parameters:
+
+                name: shown in reports and errors.
+
+                key: the program's cache key.
+
+                sources: (shader stage, source) pairs.
+        """
+
+        self.name = name
+        self.key = key
+        self.start = time.perf_counter()
+
+        self.program = glCreateProgram()
+        self.shaders = []
+        for stage, source in sources:
+            shader = glCreateShader(stage)
+            glShaderSource(shader, source)
+            glCompileShader(shader)
+            glAttachShader(self.program, shader)
+            self.shaders.append(shader)
+        glProgramParameteri(
+            self.program, GL_PROGRAM_BINARY_RETRIEVABLE_HINT, GL_TRUE)
+        glLinkProgram(self.program)
+
+    def is_done(self) -> bool:
+        """
+            Returns whether the driver has finished linking,
+            only meaningful with parallel compiling.
+        """
+
+        return bool(glGetProgramiv(self.program, GL_COMPLETION_STATUS_KHR))
+
+    def finish(self) -> int:
+        """
+            Check the result, raising RuntimeError with the
+            driver's log if compiling or linking failed.
+
+            Returns:
+
+                The linked program.
+        """
+
+        for shader in self.shaders:
+            if glGetShaderiv(shader, GL_COMPILE_STATUS) != GL_TRUE:
+                info_log = glGetShaderInfoLog(shader)
+                self.discard()
+                raise RuntimeError(f"Shader compile failure in {self.name}: {info_log}")
+        if glGetProgramiv(self.program, GL_LINK_STATUS) != GL_TRUE:
+            info_log = glGetProgramInfoLog(self.program)
+            self.discard()
+            raise RuntimeError(f"Link failure in {self.name}: {info_log}")
+
+        for shader in self.shaders:
+            glDetachShader(self.program, shader)
+            glDeleteShader(shader)
+        return self.program
+
+    def discard(self) -> None:
+        """
+            Free the program without checking it.
+        """
+
+        for shader in self.shaders:
+            glDeleteShader(shader)
+        glDeleteProgram(self.program)
+
+def submit_programs(
+    programs: list[tuple[str, list[tuple[int, str]]]],
+    cache: ProgramCache) -> list[int | PendingProgram]:
+    """
+        Start making several programs without waiting on the driver.
+
+        Parameters:
+
+            programs: (name, [(shader stage, source), ...]) per program.
+
+            cache: the binary cache to read.
+
+        Returns:
+
+            In the same order, each program if it was in the cache,
+            otherwise its PendingProgram.
+    """
+
+    is_parallel()
+
+    results = []
+    for name, sources in programs:
+        start = time.perf_counter()
+        key = cache.get_key([source for _, source in sources])
+        program = cache.load(key)
+        if program is not None:
+            end = time.perf_counter()
+            cache.record(name, "cache", 1000.0 * (end - start))
+            TRACER.record("load program binary", start, end, program = name)
+            results.append(program)
+        else:
+            results.append(PendingProgram(name, key, sources))
+    return results
+
+def finish_program(job: PendingProgram, cache: ProgramCache) -> int:
+    """
+        Check a submitted program and store its binary.
+
+        Returns:
+
+            The linked program.
+    """
+
+    program = job.finish()
+    end = time.perf_counter()
+    cache.record(job.name, "compile", 1000.0 * (end - job.start))
+    # from submission, so parallel compiles overlap in the trace
+    TRACER.record("compile program", job.start, end, program = job.name)
+    with TRACER.span("store program binary", program = job.name):
+        cache.store(job.key, program)
+    return program
+
+def build_programs(
+    programs: list[tuple[str, list[tuple[int, str]]]],
+    cache: ProgramCache) -> list[int]:
+    """
+        Make several programs, from the cache where possible.
+        Misses are all submitted before any is waited on, so with
+        GL_KHR_parallel_shader_compile the driver builds them
+        side by side.
+
+        Parameters:
+
+            programs: (name, [(shader stage, source), ...]) per program.
+
+            cache: the binary cache to read and fill.
+
+        Returns:
+
+            The programs, in the same order.
+    """
+
+    results = submit_programs(programs, cache)
+    pending = [
+        i for i, result in enumerate(results) if isinstance(result, PendingProgram)]
+
+    parallel = is_parallel()
+    while pending:
+        waiting = []
+        for i in pending:
+            if parallel and not results[i].is_done():
+                waiting.append(i)
+                continue
+            results[i] = finish_program(results[i], cache)
+        pending = waiting
+        if pending:
+            time.sleep(0.001)
+
+    return results
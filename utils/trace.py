@@ -0,0 +1,176 @@
+from contextlib import contextmanager
+import functools
+import json
+import os
+import threading
+import time
+
+
+class Tracer:
+    """
+        Records nested, named spans of time, to see where startup
+        goes. Does nothing until enabled, so spans can be left in
+        code which also runs every frame.
+    """
+    __slots__ = ("enabled", "origin", "spans", "local", "thread_names")
+
+
+    def __init__(self):
+        """
+            Initialize a disabled tracer.
+        """
+
+        self.enabled = False
+        self.origin = time.perf_counter()
+        # (path of names from the outermost span, category,
+        #  start, end, thread id, args), times in seconds
+        self.spans: list[tuple] = []
+        self.local = threading.local()
+        self.thread_names: dict[int, str] = {}
+
+    def enable(self) -> None:
+        """
+            Start recording.
+        """
+
+        self.enabled = True
+
+    def _get_stack(self) -> list[str]:
+        """
+            Returns the names of the spans open on this thread.
+        """
+
+        stack = getattr(self.local, "stack", None)
+        if stack is None:
+            stack = self.local.stack = []
+            thread = threading.current_thread()
+            self.thread_names[thread.ident] = thread.name
+        return stack
+
+    @contextmanager
+    def span(self, name: str, category: str = "startup", **args):
+        """
+            Time the body of a with statement, nested
+            under any span open on this thread.
+
+            Parameters:
+
+                name: what is being done.
+
+                category: groups spans in the trace viewer.
+
+                args: extra details shown with the span.
+        """
+
+        if not self.enabled:
+            yield
+            return
+
+        stack = self._get_stack()
+        path = (*stack, name)
+        stack.append(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            stack.pop()
+            self.spans.append(
+                (path, category, start, end, threading.get_ident(), args))
+
+    def record(self,
+        name: str, start: float, end: float,
+        category: str = "startup", **args) -> None:
+        """
+            Add a span measured elsewhere, under the spans open on
+            this thread. Times come from time.perf_counter.
+        """
+
+        if not self.enabled:
+            return
+
+        path = (*self._get_stack(), name)
+        self.spans.append(
+            (path, category, start, end, threading.get_ident(), args))
+
+    def traced(self, name: str | None = None, category: str = "startup"):
+        """
+            Decorate a function so every call is a span,
+            named after the function unless a name is given.
+        """
+
+        def decorate(function):
+
+            label = name or function.__qualname__
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.span(label, category):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def to_chrome(self) -> dict:
+        """
+            Returns the spans in the Chrome trace event format,
+            for chrome://tracing or Perfetto.
+        """
+
+        pid = os.getpid()
+        events = [
+            {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid,
+             "args": {"name": thread_name}}
+            for tid, thread_name in self.thread_names.items()
+        ]
+        for path, category, start, end, tid, args in self.spans:
+            events.append({
+                "name": path[-1], "cat": category, "ph": "X",
+                "ts": 1e6 * (start - self.origin), "dur": 1e6 * (end - start),
+                "pid": pid, "tid": tid,
+                "args": {key: str(value) for key, value in args.items()},
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def save(self, filepath: str) -> None:
+        """
+            Write the spans to a Chrome trace JSON file.
+        """
+
+        with open(filepath, "w") as f:
+            json.dump(self.to_chrome(), f)
+
+    def summarize(self) -> str:
+        """
+            Returns a text tree of the spans, merged by path, with
+            the total and self time of each in milliseconds.
+        """
+
+        # path -> [total, calls, first start]
+        totals: dict[tuple, list] = {}
+        for path, _, start, end, _, _ in self.spans:
+            entry = totals.setdefault(path, [0.0, 0, start])
+            entry[0] += end - start
+            entry[1] += 1
+            entry[2] = min(entry[2], start)
+
+        children: dict[tuple, float] = {}
+        for path, (total, _, _) in totals.items():
+            if len(path) > 1:
+                children[path[:-1]] = children.get(path[:-1], 0.0) + total
+
+        lines = [f"{'total ms':>10} {'self ms':>10} {'calls':>6}  span"]
+        # parents start before their children, so sorting on the
+        # path's start times keeps the tree in order
+        starts = {path: entry[2] for path, entry in totals.items()}
+        order = sorted(totals, key = lambda path: tuple(
+            starts.get(path[:i + 1], 0.0) for i in range(len(path))))
+        for path in order:
+            total, calls, _ = totals[path]
+            own = total - children.get(path, 0.0)
+            lines.append(
+                f"{1000.0 * total:10.2f} {1000.0 * own:10.2f} {calls:6d}  "
+                f"{'  ' * (len(path) - 1)}{path[-1]}")
+        return "\n".join(lines)
+
+# the process wide tracer
+TRACER = Tracer()